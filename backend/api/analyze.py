@@ -5,13 +5,13 @@ api/analyze.py - Sketch Analysis Endpoint
 """
 
 from flask import Blueprint, request, jsonify
-import io
 
 from core.thread_local import (
     get_image_processor,
     get_prompt_builder,
     get_gemini_client,
-    get_analysis_cache
+    get_analysis_cache,
+    get_upload_store
 )
 from config import Models
 
@@ -28,6 +28,9 @@ def analyze_sketch():
         "image_base64": "..."
     }
 
+    The response also carries "image_handle", which /api/render accepts
+    instead of re-uploading the same sketch.
+
     Response:
     {
         "building_type": "...",
@@ -42,28 +45,28 @@ def analyze_sketch():
         prompt_builder = get_prompt_builder()
         gemini = get_gemini_client()
         cache = get_analysis_cache()  # ✅ NEW: Get cache
+        uploads = get_upload_store()
 
         data = request.json
 
         if 'image_base64' not in data:
             return jsonify({"error": "Missing image_base64"}), 400
 
-        # Process image
-        pil_image, _ = processor.process_base64_image(data['image_base64'])
-        if not pil_image:
+        # Process image (decoded once per upload, derivatives memoized on the
+        # stored context so a later /api/render can reuse them by handle)
+        image_ctx = uploads.ingest(processor, data['image_base64'])
+        if not image_ctx:
             return jsonify({"error": "Invalid image"}), 400
 
         # Detect sketch type
-        sketch_info = processor.detect_sketch_type(pil_image)
+        sketch_info = image_ctx.sketch_info()
 
         # ✅ OPTIMIZED: Resize to 2048 to preserve maximum detail for analysis
         # Previously was 1024 which lost too much detail
-        pil_image = processor.resize_image(pil_image, max_size=2048)
+        pil_image = image_ctx.resized(max_size=2048)
 
-        # ✅ NEW: Convert image to bytes for cache lookup
-        img_byte_arr = io.BytesIO()
-        pil_image.save(img_byte_arr, format='PNG')
-        image_bytes = img_byte_arr.getvalue()
+        # Cache key = the uploaded bytes (no re-encode needed)
+        image_bytes = image_ctx.raw_bytes
 
         # ✅ NEW: Check cache first
         cached_result = cache.get(image_bytes)
@@ -72,6 +75,7 @@ def analyze_sketch():
             cached_result['sketch_detail_level'] = sketch_info.detail_level
             cached_result['is_colored'] = sketch_info.is_colored
             cached_result['sketch_type'] = sketch_info.sketch_type
+            cached_result['image_handle'] = image_ctx.handle
 
             print("✅ Returning cached analysis result")
             return jsonify(cached_result)
@@ -93,6 +97,7 @@ def analyze_sketch():
         analysis_result['sketch_detail_level'] = sketch_info.detail_level
         analysis_result['is_colored'] = sketch_info.is_colored
         analysis_result['sketch_type'] = sketch_info.sketch_type
+        analysis_result['image_handle'] = image_ctx.handle
 
         return jsonify(analysis_result)
         
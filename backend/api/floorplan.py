@@ -6,12 +6,12 @@ POST /api/floorplan/render   - Render materials/colors onto floor plan
 """
 
 import base64
-import io
 from flask import Blueprint, request, jsonify
 
-from core.thread_local import get_image_processor, get_gemini_client, get_prompt_builder
-from core.history_manager import HistoryManager
+from core.thread_local import get_image_processor, get_gemini_client, get_prompt_builder, get_history_writer
+from core.image_processor import encode_png
 from config import Models, FloorPlanConfig
+from references.payload_cache import get_payload_cache
 
 floorplan_bp = Blueprint('floorplan', __name__)
 
@@ -47,11 +47,11 @@ def analyze_floorplan():
             return jsonify({"error": "Missing image_base64"}), 400
 
         # Process image
-        image_pil, _ = processor.process_base64_image(data['image_base64'])
-        if not image_pil:
+        image_ctx = processor.ingest(data['image_base64'])
+        if not image_ctx:
             return jsonify({"error": "Invalid image"}), 400
 
-        image_pil = processor.resize_image(image_pil, max_size=2048)
+        image_pil = image_ctx.resized(max_size=2048)
 
         print(f"🔍 Analyzing floor plan...")
 
@@ -89,6 +89,7 @@ def render_floorplan():
         "color_scheme": "...",      # optional: text description of color preferences
         "aspect_ratio": "1:1",      # optional: default 1:1
         "reference_image_base64": "..." # optional: style reference
+                                        # (or "reference_image_id" of a library image)
     }
 
     Response:
@@ -109,16 +110,21 @@ def render_floorplan():
             return jsonify({"error": f"Missing required fields: {required}"}), 400
 
         # Process source floor plan
-        image_pil, _ = processor.process_base64_image(data['image_base64'])
-        if not image_pil:
+        image_ctx = processor.ingest(data['image_base64'])
+        if not image_ctx:
             return jsonify({"error": "Invalid floor plan image"}), 400
 
-        image_pil = processor.resize_image(image_pil, max_size=2048)
+        image_pil = image_ctx.resized(max_size=2048)
 
-        # Process reference image (optional)
-        reference_pil = None
-        if data.get('reference_image_base64'):
-            reference_pil, _ = processor.process_base64_image(data['reference_image_base64'])
+        # Process reference image (optional): library image by id (pre-encoded) or upload
+        reference_image = None
+        if data.get('reference_image_id'):
+            reference_image = get_payload_cache().get(data['reference_image_id'])  # PNG bytes
+            if reference_image is None:
+                return jsonify({"error": f"Reference image not found: {data['reference_image_id']}"}), 404
+        elif data.get('reference_image_base64'):
+            reference_ctx = processor.ingest(data['reference_image_base64'], mode='RGB')
+            reference_image = reference_ctx.image if reference_ctx else None
 
         # Extract parameters
         analysis_data = data['analysis_data']
@@ -132,14 +138,14 @@ def render_floorplan():
         print(f"   Rooms: {len(analysis_data.get('rooms', []))}")
         print(f"   Style: {style}")
         print(f"   Aspect ratio: {aspect_ratio}")
-        print(f"   Reference: {'Yes' if reference_pil else 'No'}")
+        print(f"   Reference: {'Yes' if reference_image else 'No'}")
 
         # Build render prompt
         render_prompt = prompt_builder.build_floorplan_render_prompt(
             analysis_data=analysis_data,
             style=style,
             color_scheme=color_scheme,
-            has_reference=(reference_pil is not None),
+            has_reference=(reference_image is not None),
             aspect_ratio=aspect_ratio,
             technical_specs=technical_specs
         )
@@ -150,19 +156,21 @@ def render_floorplan():
         generated_pil = gemini.generate_image(
             prompt=render_prompt,
             source_image=image_pil,
-            reference_image=reference_pil,
+            reference_image=reference_image,
             temperature=FloorPlanConfig.TEMPERATURE_RENDER
         )
 
         if not generated_pil:
             return jsonify({"error": "Floor plan render generation failed"}), 500
 
-        # Auto-save to history
+        # Convert to base64 (PNG bytes are shared with the history writer)
+        result_b64 = base64.b64encode(encode_png(generated_pil)).decode('utf-8')
+
+        # Auto-save to history (background thread)
         try:
-            hm = HistoryManager()
             apt = analysis_data.get('apartment_type', '')
             summary = f"{apt} | {style} | {color_scheme[:80]}" if color_scheme else f"{apt} | {style}"
-            hm.save_render(
+            get_history_writer().submit(
                 image_pil=generated_pil,
                 mode="floorplan",
                 prompt_summary=summary,
@@ -172,11 +180,6 @@ def render_floorplan():
         except Exception as he:
             print(f"⚠️  History save failed (non-critical): {he}")
 
-        # Convert to base64
-        out_buf = io.BytesIO()
-        generated_pil.save(out_buf, format='PNG', quality=95)
-        result_b64 = base64.b64encode(out_buf.getvalue()).decode('utf-8')
-
         print("✅ Floor plan render complete")
 
         return jsonify({
@@ -2,21 +2,33 @@
 api/history.py - Render History API Endpoints
 
 Endpoints:
-  GET  /api/history/list?mode=&page=&limit=   - List renders
+  GET  /api/history/list?mode=&page=&limit=&cursor= - List renders
+  GET  /api/history/search?q=&<facet>=&from=&to= - Full-text + faceted search
   GET  /api/history/detail/<id>               - Get full metadata
   GET  /api/history/image/<id>               - Download PNG
+  GET  /api/history/thumbnail/<id>?kind=     - Thumbnail file (kind: thumbnail | source)
   GET  /api/history/stats                    - Get render counts
+  GET  /api/history/usage                    - Disk usage by mode + retention status
   DELETE /api/history/delete/<id>            - Delete a render
   DELETE /api/history/clear?mode=            - Clear all in a mode
 """
 
-import io
-from flask import Blueprint, request, jsonify, send_file
+from pathlib import Path
 
-from core.history_manager import HistoryManager
+from flask import Blueprint, Response, request, jsonify, send_file
+
+from config import HistoryConfig
+
+from core.history_index import FACET_FIELDS
+from core.history_manager import HistoryManager, THUMBNAIL_FIELDS, THUMBNAIL_MIMETYPES
+from core.thread_local import get_history_writer, get_history_compactor
 
 history_bp = Blueprint("history", __name__)
 
+# Render images and thumbnails never change for a given render ID
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+IMMUTABLE_CACHE_CONTROL = f"public, max-age={THUMBNAIL_MAX_AGE}, immutable"
+
 # Module-level singleton (safe: file-based, no shared mutable state)
 _history_manager: HistoryManager = None
 
@@ -28,17 +40,100 @@ def get_history_manager() -> HistoryManager:
     return _history_manager
 
 
+def _with_thumbnail_urls(item: dict) -> dict:
+    """Replace thumbnail blob keys/filenames with /api/history/thumbnail URLs."""
+    blobs = item.pop("blobs", None) or {}
+    for kind, field in THUMBNAIL_FIELDS.items():
+        if item.pop(field, None) or blobs.get(field):
+            suffix = "" if kind == "thumbnail" else f"?kind={kind}"
+            item[f"{field}_url"] = f"/api/history/thumbnail/{item['id']}{suffix}"
+    return item
+
+
+def _send_history_file(path: Path, mimetype: str, download_name: str = None) -> Response:
+    """
+    Serve a file under render_history/ without loading it into memory.
+
+    With HISTORY_X_ACCEL_PREFIX set, nginx serves the file itself
+    (X-Accel-Redirect to an internal location). Otherwise send_file
+    streams it from disk and answers conditional (ETag/Last-Modified)
+    and Range requests; with HISTORY_X_SENDFILE it emits X-Sendfile.
+    """
+    if HistoryConfig.X_ACCEL_PREFIX:
+        relative = path.relative_to(get_history_manager().base_dir).as_posix()
+        response = Response(status=200, mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = HistoryConfig.X_ACCEL_PREFIX.rstrip("/") + "/" + relative
+        if download_name:
+            response.headers.set("Content-Disposition", "attachment", filename=download_name)
+    else:
+        response = send_file(
+            path,
+            mimetype=mimetype,
+            as_attachment=bool(download_name),
+            download_name=download_name,
+            conditional=True,
+            etag=True,
+            max_age=THUMBNAIL_MAX_AGE
+        )
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
 @history_bp.route("/history/list", methods=["GET"])
 def list_history():
-    """GET /api/history/list?mode=interior&page=1&limit=20"""
+    """
+    GET /api/history/list?mode=interior&page=1&limit=20
+
+    For infinite scroll, pass the previous response's next_cursor as
+    ?cursor= instead of page.
+    """
     mode = request.args.get("mode") or None
+    cursor = request.args.get("cursor") or None
     try:
         page = max(1, int(request.args.get("page", 1)))
         limit = min(100, max(1, int(request.args.get("limit", 20))))
     except ValueError:
         return jsonify({"error": "Invalid page/limit"}), 400
 
-    result = get_history_manager().list_renders(mode=mode, page=page, limit=limit)
+    result = get_history_manager().list_renders(mode=mode, page=page, limit=limit, cursor=cursor)
+    result["items"] = [_with_thumbnail_urls(item) for item in result["items"]]
+    return jsonify(result)
+
+
+@history_bp.route("/history/search", methods=["GET"])
+def search_history():
+    """
+    GET /api/history/search?q=phong khach&mode=interior&aspect_ratio=16:9
+                           &from=2026-01-01&to=2026-01-31&limit=20&cursor=
+
+    q matches prompt summaries and settings, with or without Vietnamese
+    accents. Facet filters: mode, aspect_ratio, viewpoint, style,
+    preserve_mode, camera_angle, time_of_day. The response's "facets"
+    holds {facet: {value: count}} for the current query.
+    """
+    query = request.args.get("q", "")
+    filters = {name: request.args.get(name) for name in FACET_FIELDS if request.args.get(name)}
+    cursor = request.args.get("cursor") or None
+    try:
+        page = max(1, int(request.args.get("page", 1)))
+        limit = min(100, max(1, int(request.args.get("limit", 20))))
+    except ValueError:
+        return jsonify({"error": "Invalid page/limit"}), 400
+
+    try:
+        result = get_history_manager().search(
+            query=query,
+            filters=filters,
+            date_from=request.args.get("from") or None,
+            date_to=request.args.get("to") or None,
+            page=page,
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Invalid search: {e}"}), 400
+
+    result["items"] = [_with_thumbnail_urls(item) for item in result["items"]]
     return jsonify(result)
 
 
@@ -49,28 +144,70 @@ def get_detail(render_id: str):
     detail = get_history_manager().get_render_detail(render_id, mode=mode)
     if not detail:
         return jsonify({"error": "Not found"}), 404
-    return jsonify(detail)
+    return jsonify(_with_thumbnail_urls(detail))
 
 
 @history_bp.route("/history/image/<render_id>", methods=["GET"])
 def get_image(render_id: str):
-    """GET /api/history/image/<render_id> - Returns PNG for download"""
+    """
+    GET /api/history/image/<render_id> - Returns PNG for download
+
+    ✅ OPTIMIZED: Streamed from disk (Range + conditional GET support) or
+    offloaded to nginx, instead of read_bytes() into a BytesIO.
+    """
     mode = request.args.get("mode") or None
-    image_bytes = get_history_manager().get_render_image_bytes(render_id, mode=mode)
-    if not image_bytes:
+    path = get_history_manager().get_render_image_path(render_id, mode=mode)
+    if path is None:
         return jsonify({"error": "Not found"}), 404
-    return send_file(
-        io.BytesIO(image_bytes),
-        mimetype="image/png",
-        as_attachment=True,
-        download_name=f"render_{render_id}.png"
-    )
+    # Old renders may have been transcoded to lossless WebP by the compactor
+    ext = path.suffix.lstrip(".")
+    mimetype = "image/webp" if ext == "webp" else "image/png"
+    return _send_history_file(path, mimetype, download_name=f"render_{render_id}.{ext}")
+
+
+@history_bp.route("/history/thumbnail/<render_id>", methods=["GET"])
+def get_thumbnail(render_id: str):
+    """
+    GET /api/history/thumbnail/<render_id>?kind=thumbnail|source
+
+    Served with ETag/Last-Modified (conditional requests get 304) and a
+    long immutable Cache-Control, so the gallery is cached by the browser
+    and by nginx.
+    """
+    kind = request.args.get("kind", "thumbnail")
+    path = get_history_manager().get_thumbnail_path(render_id, kind=kind)
+    if path is None:
+        return jsonify({"error": "Not found"}), 404
+
+    mimetype = THUMBNAIL_MIMETYPES.get(path.suffix.lstrip("."), "application/octet-stream")
+    return _send_history_file(path, mimetype)
 
 
 @history_bp.route("/history/stats", methods=["GET"])
 def get_stats():
-    """GET /api/history/stats"""
-    return jsonify(get_history_manager().get_stats())
+    """GET /api/history/stats (includes background writer queue/latency)"""
+    stats = get_history_manager().get_stats()
+    stats["writer"] = get_history_writer().get_stats()
+    return jsonify(stats)
+
+
+@history_bp.route("/history/usage", methods=["GET"])
+def get_usage():
+    """
+    GET /api/history/usage
+
+    by_mode: renders and bytes of each mode's own files; storage: what is
+    actually on disk after deduplication; retention: policies and the
+    compactor's last run.
+    """
+    manager = get_history_manager()
+    by_mode = manager.index.usage()
+    return jsonify({
+        "by_mode": by_mode,
+        "total_bytes": sum(u["bytes"] for u in by_mode.values()),
+        "storage": manager.blobs.get_stats(),
+        "retention": get_history_compactor().get_stats()
+    })
 
 
 @history_bp.route("/history/delete/<render_id>", methods=["DELETE"])
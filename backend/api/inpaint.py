@@ -10,6 +10,7 @@ import io
 from PIL import Image
 
 from core.thread_local import get_image_processor, get_inpainting_engine
+from config import InpaintingConfig
 
 inpaint_bp = Blueprint('inpaint', __name__)
 
@@ -25,7 +26,9 @@ def inpaint_image():
         "mask_image_base64": "...",
         "edit_instruction": "...",
         "reference_image_base64": "..." (optional),
-        "preserve_mode": "hybrid" (optional)
+        "preserve_mode": "hybrid" (optional),
+        "roi_mode": false (optional: send only the masked region to Gemini),
+        "roi_context": true (optional: with roi_mode, also send a downscaled full scene)
     }
 
     Response:
@@ -46,22 +49,22 @@ def inpaint_image():
             return jsonify({"error": f"Missing: {required}"}), 400
 
         # Process images
-        source_pil, _ = processor.process_base64_image(data['source_image_base64'])
-        mask_pil, _ = processor.process_base64_image(data['mask_image_base64'])
+        source_ctx = processor.ingest(data['source_image_base64'], mode='RGB')
+        mask_ctx = processor.ingest(data['mask_image_base64'], mode='L')  # Grayscale
         
-        if not source_pil or not mask_pil:
+        if not source_ctx or not mask_ctx:
             return jsonify({"error": "Invalid images"}), 400
         
-        # Convert to numpy
-        source_array = np.array(source_pil.convert('RGB'))
-        mask_array = np.array(mask_pil.convert('L'))  # Grayscale
+        # Convert to numpy (mask aligned to the source size)
+        source_array = source_ctx.array()
+        mask_array = np.asarray(mask_ctx.resized_to(source_ctx.size))
         
         # Reference image (optional)
         reference_array = None
         if 'reference_image_base64' in data:
-            ref_pil, _ = processor.process_base64_image(data['reference_image_base64'])
-            if ref_pil:
-                reference_array = np.array(ref_pil.convert('RGB'))
+            ref_ctx = processor.ingest(data['reference_image_base64'], mode='RGB')
+            if ref_ctx:
+                reference_array = ref_ctx.array()
         
         # Inpaint
         preserve_mode = data.get('preserve_mode', 'hybrid')
@@ -71,7 +74,9 @@ def inpaint_image():
             mask_image=mask_array,
             edit_instruction=data['edit_instruction'],
             reference_image=reference_array,
-            preserve_mode=preserve_mode
+            preserve_mode=preserve_mode,
+            roi_mode=bool(data.get('roi_mode', InpaintingConfig.ROI_MODE_DEFAULT)),
+            roi_context=bool(data.get('roi_context', InpaintingConfig.ROI_CONTEXT_DEFAULT))
         )
         
         # Convert back to base64
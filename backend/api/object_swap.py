@@ -9,17 +9,19 @@ POST /api/object-swap/render
   - swap_instruction: text description
   - preserve_mode: hybrid (default) | strict | gemini_only
   - aspect_ratio: for source resize (default: preserve original)
+  - roi_mode: send only the masked region (+ margin) to Gemini (default: off)
+  - roi_context: with roi_mode, also send a downscaled full scene (default: on)
 
 Response: { "result_image_base64": "...", "mime_type": "image/png" }
 """
 
 import base64
-import io
 from flask import Blueprint, request, jsonify
 
-from core.thread_local import get_image_processor, get_gemini_client
+from core.thread_local import get_image_processor, get_gemini_client, get_history_writer
+from core.image_processor import encode_png
 from core.object_swap_engine import ObjectSwapEngine
-from core.history_manager import HistoryManager
+from config import InpaintingConfig
 
 object_swap_bp = Blueprint('object_swap', __name__)
 
@@ -41,7 +43,9 @@ def object_swap_render():
         "mask_image_base64": "data:image/png;base64,...",
         "reference_object_base64": "data:image/png;base64,..." (optional),
         "swap_instruction": "Replace with modern Scandinavian sofa" (optional),
-        "preserve_mode": "hybrid" (optional: hybrid|strict|gemini_only)
+        "preserve_mode": "hybrid" (optional: hybrid|strict|gemini_only),
+        "roi_mode": false (optional),
+        "roi_context": true (optional)
     }
     """
     try:
@@ -54,37 +58,37 @@ def object_swap_render():
             return jsonify({"error": f"Missing required fields: {required}"}), 400
 
         # Process source image
-        source_pil, _ = processor.process_base64_image(data['source_image_base64'])
-        if not source_pil:
+        source_ctx = processor.ingest(data['source_image_base64'], mode='RGB')
+        if not source_ctx:
             return jsonify({"error": "Invalid source image"}), 400
 
         # Process mask image
-        mask_pil, _ = processor.process_base64_image(data['mask_image_base64'])
-        if not mask_pil:
+        mask_ctx = processor.ingest(data['mask_image_base64'], mode='L')
+        if not mask_ctx:
             return jsonify({"error": "Invalid mask image"}), 400
 
-        # Ensure mask matches source dimensions
-        if mask_pil.size != source_pil.size:
-            mask_pil = mask_pil.resize(source_pil.size)
-
         # Process reference object (optional)
         reference_pil = None
         if data.get('reference_object_base64'):
-            reference_pil, _ = processor.process_base64_image(data['reference_object_base64'])
+            reference_ctx = processor.ingest(data['reference_object_base64'], mode='RGB')
+            reference_pil = reference_ctx.image if reference_ctx else None
 
         swap_instruction = data.get('swap_instruction', '')
         preserve_mode = data.get('preserve_mode', 'hybrid')
+        roi_mode = bool(data.get('roi_mode', InpaintingConfig.ROI_MODE_DEFAULT))
+        roi_context = bool(data.get('roi_context', InpaintingConfig.ROI_CONTEXT_DEFAULT))
 
         print(f"🔄 Object Swap request:")
-        print(f"   Source: {source_pil.size}")
-        print(f"   Mask: {mask_pil.size}")
+        print(f"   Source: {source_ctx.size}")
+        print(f"   Mask: {mask_ctx.size}")
         print(f"   Reference: {'Yes' if reference_pil else 'No (text only)'}")
         print(f"   Instruction: {swap_instruction[:80]}")
         print(f"   Preserve mode: {preserve_mode}")
+        print(f"   ROI mode: {roi_mode}")
 
-        # Resize source for processing (max 2048)
-        source_resized = processor.resize_image(source_pil, max_size=2048)
-        mask_resized = mask_pil.resize(source_resized.size) if mask_pil.size != source_resized.size else mask_pil
+        # Resize source for processing (max 2048); mask is aligned in a single resize
+        source_resized = source_ctx.resized(max_size=2048)
+        mask_resized = mask_ctx.resized_to(source_resized.size)
 
         # Run engine
         engine = _get_engine()
@@ -93,14 +97,18 @@ def object_swap_render():
             mask_image=mask_resized,
             reference_object=reference_pil,
             swap_instruction=swap_instruction,
-            preserve_mode=preserve_mode
+            preserve_mode=preserve_mode,
+            roi_mode=roi_mode,
+            roi_context=roi_context
         )
 
-        # Auto-save to history
+        # Convert to base64 (PNG bytes are shared with the history writer)
+        result_b64 = base64.b64encode(encode_png(result_pil)).decode('utf-8')
+
+        # Auto-save to history (background thread)
         try:
-            hm = HistoryManager()
             summary = swap_instruction[:150] if swap_instruction else "Object swap"
-            hm.save_render(
+            get_history_writer().submit(
                 image_pil=result_pil,
                 mode="object_swap",
                 prompt_summary=summary,
@@ -110,11 +118,6 @@ def object_swap_render():
         except Exception as he:
             print(f"⚠️  History save failed (non-critical): {he}")
 
-        # Convert to base64
-        out_buf = io.BytesIO()
-        result_pil.save(out_buf, format='PNG')
-        result_b64 = base64.b64encode(out_buf.getvalue()).decode('utf-8')
-
         return jsonify({
             "result_image_base64": result_b64,
             "mime_type": "image/png"
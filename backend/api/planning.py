@@ -4,14 +4,15 @@ Urban planning visualization with multiple lots
 """
 
 import base64
-import io
 from flask import Blueprint, request, jsonify
 
 from core.thread_local import (
     get_image_processor,
     get_prompt_builder,
-    get_gemini_client
+    get_gemini_client,
+    get_history_writer
 )
+from core.image_processor import encode_png
 from config import Models
 
 planning_bp = Blueprint('planning', __name__)
@@ -68,15 +69,15 @@ def planning_render():
                 return jsonify({"error": "Each lot must have lot_number and description"}), 400
 
         # Process images
-        site_plan_pil, _ = processor.process_base64_image(data['site_plan_base64'])
-        lot_map_pil, _ = processor.process_base64_image(data['lot_map_base64'])
+        site_plan_ctx = processor.ingest(data['site_plan_base64'])
+        lot_map_ctx = processor.ingest(data['lot_map_base64'])
 
-        if not site_plan_pil or not lot_map_pil:
+        if not site_plan_ctx or not lot_map_ctx:
             return jsonify({"error": "Invalid images"}), 400
 
         # ✅ OPTIMIZED: Resize to 2048 to preserve maximum detail
-        site_plan_pil = processor.resize_image(site_plan_pil, max_size=2048)
-        lot_map_pil = processor.resize_image(lot_map_pil, max_size=2048)
+        site_plan_pil = site_plan_ctx.resized(max_size=2048)
+        lot_map_pil = lot_map_ctx.resized(max_size=2048)
 
         # Extract parameters
         camera_angle = data.get('camera_angle', 'drone_45deg')
@@ -112,13 +113,14 @@ def planning_render():
         if not generated_pil:
             return jsonify({"error": "Planning render generation failed"}), 500
 
-        # Auto-save to render history (best-effort)
+        # Convert to base64 (PNG bytes are shared with the history writer)
+        output_base64 = base64.b64encode(encode_png(generated_pil)).decode('utf-8')
+
+        # Auto-save to render history (best-effort, background thread)
         try:
-            from core.history_manager import HistoryManager
-            hm = HistoryManager()
             n_lots = len(lot_descriptions)
             summary = f"Planning: {n_lots} lots | {camera_angle} | {time_of_day}"
-            hm.save_render(
+            get_history_writer().submit(
                 image_pil=generated_pil,
                 mode="planning",
                 prompt_summary=summary,
@@ -128,11 +130,6 @@ def planning_render():
         except Exception as he:
             print(f"⚠️  History save failed (non-critical): {he}")
 
-        # Convert PIL Image to base64
-        output_buffer = io.BytesIO()
-        generated_pil.save(output_buffer, format='PNG', quality=95)
-        output_base64 = base64.b64encode(output_buffer.getvalue()).decode('utf-8')
-
         print("✅ Planning render complete")
 
         return jsonify({
@@ -183,12 +180,12 @@ def analyze_sketch():
             return jsonify({"error": "Missing image_base64"}), 400
 
         # Process sketch image
-        sketch_pil, _ = processor.process_base64_image(data['image_base64'])
-        if not sketch_pil:
+        sketch_ctx = processor.ingest(data['image_base64'])
+        if not sketch_ctx:
             return jsonify({"error": "Invalid sketch image"}), 400
 
         # Resize if needed
-        sketch_pil = processor.resize_image(sketch_pil, max_size=2048)
+        sketch_pil = sketch_ctx.resized(max_size=2048)
 
         # Build analyze prompt
         analyze_prompt = prompt_builder.build_planning_analyze_prompt()
@@ -264,12 +261,12 @@ def planning_detail_render():
             return jsonify({"error": "Missing planning_description"}), 400
 
         # Process sketch image
-        sketch_pil, _ = processor.process_base64_image(data['image_base64'])
-        if not sketch_pil:
+        sketch_ctx = processor.ingest(data['image_base64'])
+        if not sketch_ctx:
             return jsonify({"error": "Invalid sketch image"}), 400
 
         # Resize if needed (match new resolution capabilities)
-        sketch_pil = processor.resize_image(sketch_pil, max_size=2048)
+        sketch_pil = sketch_ctx.resized(max_size=2048)
 
         # Extract parameters
         planning_description = planning_data['planning_description']
@@ -329,12 +326,13 @@ def planning_detail_render():
         if not generated_pil:
             return jsonify({"error": "Planning detail render generation failed"}), 500
 
-        # Auto-save to render history (best-effort)
+        # Convert to base64 (PNG bytes are shared with the history writer)
+        output_base64 = base64.b64encode(encode_png(generated_pil)).decode('utf-8')
+
+        # Auto-save to render history (best-effort, background thread)
         try:
-            from core.history_manager import HistoryManager
-            hm = HistoryManager()
             summary = f"Planning Detail | {camera_angle} | {planning_description[:100]}"
-            hm.save_render(
+            get_history_writer().submit(
                 image_pil=generated_pil,
                 mode="planning_detail",
                 prompt_summary=summary,
@@ -344,11 +342,6 @@ def planning_detail_render():
         except Exception as he:
             print(f"⚠️  History save failed (non-critical): {he}")
 
-        # Convert PIL Image to base64
-        output_buffer = io.BytesIO()
-        generated_pil.save(output_buffer, format='PNG', quality=95)
-        output_base64 = base64.b64encode(output_buffer.getvalue()).decode('utf-8')
-
         # Add data:image/png;base64, prefix
         output_base64_full = f"data:image/png;base64,{output_base64}"
 
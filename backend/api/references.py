@@ -2,13 +2,37 @@
 api/references.py - Reference Images API
 """
 
-from flask import Blueprint, request, jsonify, send_file
-import io
+from flask import Blueprint, Response, redirect, request, jsonify
 
+from api.history import get_history_manager
+from config import ReferenceConfig
+from core.thread_local import get_image_processor, get_upload_store
+from references.embedding import MODES, compute_embedding, resolve_mode
+from references.features import FeatureQuery, analysis_array, load_analysis_image
 from references.library import get_library
+from references.payload_cache import get_payload_cache
+from references.thumbnails import THUMBNAIL_SIZES
 
 references_bp = Blueprint('references', __name__)
 
+# /references/image URLs carrying the file's version (?v=) never change
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _prewarm_payloads(images) -> None:
+    """
+    Start encoding the first results for /api/render (reference_image_id)
+    when PAYLOAD_PREWARM_TOP is enabled; cloud images not downloaded yet
+    are skipped (speculation must not queue remote downloads)
+    """
+    if ReferenceConfig.PAYLOAD_PREWARM_TOP > 0:
+        library = get_library()
+        top = images[:ReferenceConfig.PAYLOAD_PREWARM_TOP]
+        get_payload_cache().prewarm(
+            img['id'] for img in top
+            if img.get('id') and library.source_version(img['id']) != "remote-pending"
+        )
+
 
 @references_bp.route('/references/list', methods=['GET'])
 def list_references():
@@ -18,6 +42,14 @@ def list_references():
     Query params:
         category: Category name (optional)
         subcategory: Subcategory name (optional)
+        Visual features (optional; lists across the library when no
+        category is given, with total/page/limit/pages):
+            min_brightness, max_brightness, min_warmth, max_warmth,
+            min_saturation, max_saturation, min_edge_density, max_edge_density
+            tone: warm | cool | neutral
+            color: #rrggbb in the dominant palette
+            sort: brightness | -brightness | warmth | ... | color (closest to ?color=)
+        page, limit: Pagination (with feature params)
     
     Response:
     {
@@ -26,6 +58,8 @@ def list_references():
                 "id": "...",
                 "name": "...",
                 "thumbnail_url": "...",
+                "image_url": "/api/references/image/<id>?v=...",   (local images)
+                "thumbnail_urls": {"200": "...", "400": "...", "800": "..."},
                 "metadata": {...}
             }
         ]
@@ -37,6 +71,28 @@ def list_references():
         category = request.args.get('category')
         subcategory = request.args.get('subcategory')
         
+        try:
+            features = FeatureQuery(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if features.active:
+            try:
+                page = max(1, int(request.args.get('page', 1)))
+                limit = min(100, max(1, int(request.args.get('limit', 20))))
+            except ValueError:
+                return jsonify({"error": "Invalid page/limit"}), 400
+            result = library.browse(
+                features,
+                category=category or None,
+                subcategory=subcategory or None,
+                page=page,
+                limit=limit
+            )
+            _prewarm_payloads(result["results"])
+            result["results"] = [library.public_entry(r) for r in result["results"]]
+            return jsonify(result)
+        
         if category and subcategory:
             images = library.list_images(category, subcategory)
         elif category:
@@ -51,12 +107,82 @@ def list_references():
             categories = library.list_categories()
             return jsonify({"categories": categories})
         
-        return jsonify({"images": images})
+        _prewarm_payloads(images)
+        # ✅ OPTIMIZED: URLs to cacheable binaries instead of embedded base64
+        return jsonify({"images": [library.public_entry(img) for img in images]})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@references_bp.route('/references/image/<image_id>', methods=['GET'])
+def serve_reference_image(image_id: str):
+    """
+    Reference image (or thumbnail) as binary
+    
+    Query params:
+        size: 200 | 400 | 800 for a WebP thumbnail (default: original)
+        v: version token from image_url/thumbnail_urls; when it matches,
+           the response is cached as immutable
+    
+    ETag + If-None-Match (304) and Range are supported. Cloud-only
+    images are served from the remote cache once downloaded; until then
+    they redirect to their URL (and the download starts in the background).
+    """
+    size = request.args.get('size')
+    if size is not None:
+        if not size.isdigit() or int(size) not in THUMBNAIL_SIZES:
+            return jsonify({"error": f"Invalid size (use one of {list(THUMBNAIL_SIZES)})"}), 400
+        size = int(size)
+    
+    library = get_library()
+    image_meta = library.get_image_entry(image_id)
+    if image_meta is None:
+        return jsonify({"error": "Image not found"}), 404
+    
+    file_info = library.get_image_file(image_id, size)
+    if file_info is None:
+        cloud_url = image_meta.get('cloud_url')
+        if size is None and cloud_url and library.remote is not None:
+            # Never block an <img> on a download: serve only what is on disk
+            if library.remote.is_cached(cloud_url):
+                remote = library.read_remote(image_id)
+                if remote is not None:
+                    response = Response(remote["data"], mimetype=remote["mime_type"])
+                    response.set_etag(remote["version"])
+                    response.headers["Cache-Control"] = "public, no-cache"
+                    return response.make_conditional(
+                        request, accept_ranges=True, complete_length=len(remote["data"])
+                    )
+            else:
+                library.remote.prefetch([cloud_url])
+        url = image_meta.get('thumbnail_url' if size else 'cloud_url') or cloud_url
+        if url:
+            return redirect(url)
+        return jsonify({"error": "Image file not found"}), 404
+    
+    if request.args.get('v') == library.image_version(image_id):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = "public, no-cache"
+    
+    # Revalidation: answered from the file's stat, without reading it
+    if request.if_none_match.contains(file_info["etag"]):
+        response = Response(status=304)
+        response.set_etag(file_info["etag"])
+        response.headers["Cache-Control"] = cache_control
+        return response
+    
+    image = library.read_image(image_id, size)
+    if image is None:
+        return jsonify({"error": "Image file not found"}), 404
+    
+    response = Response(image["data"], mimetype=image["mime_type"])
+    response.set_etag(image["etag"])
+    response.headers["Cache-Control"] = cache_control
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(image["data"]))
+
+
 @references_bp.route('/references/download', methods=['POST'])
 def download_reference():
     """
@@ -85,36 +211,238 @@ def download_reference():
         if not result:
             return jsonify({"error": "Image not found"}), 404
         
+        # Downloaded = picked: have it ready for /api/render (reference_image_id)
+        get_payload_cache().prewarm([data['image_id']])
         return jsonify(result)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@references_bp.route('/references/reload', methods=['POST'])
+def reload_references():
+    """
+    Re-read manifest.json now (without waiting for the watcher)
+    
+    Query params:
+        force: "true" to rebuild even if the file looks unchanged
+    
+    Response:
+    {
+        "reloaded": true,
+        "stats": {...}
+    }
+    """
+    library = get_library()
+    force = request.args.get('force', 'false').lower() == 'true'
+    reloaded = library.reload(force=force)
+    stats = library.get_stats()
+    if not reloaded and stats["last_error"]:
+        return jsonify({"error": f"Reload failed: {stats['last_error']}", "stats": stats}), 500
+    return jsonify({"reloaded": reloaded, "stats": stats})
+
+
+@references_bp.route('/references/stats', methods=['GET'])
+def reference_stats():
+    """Library size, manifest reload metrics and render payload cache"""
+    return jsonify({**get_library().get_stats(), "payload_cache": get_payload_cache().get_stats()})
+
+
+@references_bp.route('/references/prewarm', methods=['POST'])
+def prewarm_references():
+    """
+    Prepare library images for /api/render "reference_image_id" in the
+    background (e.g. when the user opens a reference's detail view)
+    
+    Request:
+    {
+        "image_ids": ["modern_vn_001", ...]
+    }
+    
+    Response:
+    {
+        "queued": 1     (already cached / unknown ids are skipped)
+    }
+    """
+    data = request.json or {}
+    image_ids = data.get('image_ids')
+    if not isinstance(image_ids, list) or not all(isinstance(i, str) for i in image_ids):
+        return jsonify({"error": "image_ids must be a list of strings"}), 400
+    return jsonify({"queued": get_payload_cache().prewarm(image_ids[:ReferenceConfig.PAYLOAD_PREWARM_QUEUE])})
+
+
+@references_bp.route('/references/prefetch', methods=['POST'])
+def prefetch_references():
+    """
+    Download the cloud-only images of a category into the server's remote
+    cache in the background (e.g. when the user opens the category)
+    
+    Request:
+    {
+        "category": "modern",
+        "subcategory": "main"     (optional)
+    }
+    
+    Response:
+    {
+        "queued": 12    (already cached images are skipped)
+    }
+    """
+    data = request.json or {}
+    category = data.get('category')
+    subcategory = data.get('subcategory')
+    if not isinstance(category, str) or (subcategory is not None and not isinstance(subcategory, str)):
+        return jsonify({"error": "category (and optional subcategory) must be strings"}), 400
+    
+    library = get_library()
+    if category not in library.list_categories():
+        return jsonify({"error": "Category not found"}), 404
+    if library.remote is None:
+        return jsonify({"error": "Remote reference cache is disabled (REFERENCES_REMOTE_CACHE_MB=0)"}), 409
+    queued = library.prefetch_category(category, subcategory, limit=ReferenceConfig.REMOTE_PREFETCH_MAX)
+    return jsonify({"queued": queued})
+
+
 @references_bp.route('/references/search', methods=['GET'])
 def search_references():
     """
-    Search references by tags
+    Search references
     
     Query params:
-        tags: Comma-separated tags (e.g., "modern,vietnam")
+        q: Free text, ranked (e.g., "dong duong hoang hon"); accents optional
+        tags: Comma-separated tags (e.g., "modern,vietnam"); with q, restricts
+              the ranked results to images having any of them
+        category: Restrict to one category (with q)
+        page, limit: Pagination (with q)
+        min_*/max_*, tone, color, sort: Visual feature filters/sort, as
+              for /references/list
     
     Response:
     {
-        "results": [...]
+        "results": [...],
+        "total": 12, "page": 1, "limit": 20, "pages": 1   (with q)
     }
     """
     try:
+        query = request.args.get('q', '').strip()
         tags_str = request.args.get('tags', '')
         tags = [t.strip() for t in tags_str.split(',') if t.strip()]
         
-        if not tags:
-            return jsonify({"error": "No tags provided"}), 400
+        if not query and not tags:
+            return jsonify({"error": "No query or tags provided"}), 400
+        
+        try:
+            features = FeatureQuery(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         library = get_library()
-        results = library.search_by_tags(tags)
         
-        return jsonify({"results": results})
+        if not query:
+            # Any-tag match, manifest order
+            results = features.apply(library.search_by_tags(tags))
+            _prewarm_payloads(results)
+            return jsonify({"results": [library.public_entry(r) for r in results]})
+        
+        try:
+            page = max(1, int(request.args.get('page', 1)))
+            limit = min(100, max(1, int(request.args.get('limit', 20))))
+        except ValueError:
+            return jsonify({"error": "Invalid page/limit"}), 400
+        
+        result = library.search(
+            query,
+            category=request.args.get('category') or None,
+            tags=tags or None,
+            page=page,
+            limit=limit,
+            features=features if features.active else None
+        )
+        _prewarm_payloads(result["results"])
+        result["results"] = [library.public_entry(r) for r in result["results"]]
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@references_bp.route('/references/similar', methods=['POST'])
+def similar_references():
+    """
+    "More like this": library images that look like a given image
+    
+    Request (one image source):
+    {
+        "image_id": "modern_vn_001",     # a library image
+        "render_id": "...",              # or a history render
+        "image_base64": "...",           # or an upload (or "image_handle")
+        "mode": "auto",                  # auto | all | color | shape
+        "category": "...",               # optional
+        "limit": 20
+    }
+    
+    mode "auto" compares uploads/renders without color (sketches) by
+    shape only, everything else by color + shape.
+    
+    Response:
+    {
+        "results": [... image + category/subcategory/score],
+        "mode": "all"
+    }
+    """
+    try:
+        data = request.json or {}
+        
+        mode = data.get('mode', 'auto')
+        if mode not in MODES:
+            return jsonify({"error": f"Invalid mode (use one of {', '.join(MODES)})"}), 400
+        try:
+            limit = min(100, max(1, int(data.get('limit', 20))))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid limit"}), 400
+        
+        library = get_library()
+        image_id = data.get('image_id')
+        
+        if image_id:
+            # ✅ OPTIMIZED: library images reuse their precomputed embedding
+            embedding = library.get_embedding(image_id)
+            if embedding is None:
+                if library.get_image_entry(image_id) is None:
+                    return jsonify({"error": "Image not found"}), 404
+                return jsonify({"error": "No embedding for this image (run auto_generate_manifest.py)"}), 409
+            if mode == 'auto':
+                mode = 'all'
+        else:
+            if data.get('render_id'):
+                path = get_history_manager().get_render_image_path(data['render_id'])
+                if path is None:
+                    return jsonify({"error": "Render not found"}), 404
+                rgb = load_analysis_image(path)
+            elif data.get('image_base64') or data.get('image_handle'):
+                try:
+                    image_ctx = get_upload_store().resolve(get_image_processor(), data)
+                except KeyError as e:
+                    return jsonify({"error": f"Unknown or expired image handle: {e.args[0]}", "code": "handle_expired"}), 410
+                if image_ctx is None:
+                    return jsonify({"error": "Invalid image"}), 400
+                rgb = analysis_array(image_ctx.image)
+            else:
+                return jsonify({"error": "Missing image_id, render_id, image_base64 or image_handle"}), 400
+            embedding = compute_embedding(rgb)
+            mode = resolve_mode(mode, rgb)
+        
+        results = library.find_similar(
+            embedding,
+            mode=mode,
+            category=data.get('category') or None,
+            limit=limit,
+            exclude=image_id
+        )
+        return jsonify({
+            "results": [library.public_entry(r) for r in results],
+            "mode": mode
+        })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
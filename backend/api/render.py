@@ -6,14 +6,17 @@ api/render.py - Main Render Endpoint
 
 from flask import Blueprint, request, jsonify
 import base64
-import io
 
 from core.thread_local import (
     get_image_processor,
     get_prompt_builder,
     get_gemini_client,
-    get_translator
+    get_translator,
+    get_upload_store,
+    get_history_writer
 )
+from core.image_processor import encode_png
+from references.payload_cache import get_payload_cache
 
 render_bp = Blueprint('render', __name__)
 
@@ -27,11 +30,12 @@ def render_image():
 
     Request:
     {
-        "image_base64": "...",
+        "image_base64": "...",   # or "image_handle" from a previous response
         "form_data_vi": {...},  # ✅ CHANGED: Vietnamese form with user edits
         "aspect_ratio": "16:9",
         "viewpoint": "main_facade",
-        "reference_image_base64": "..." (optional)
+        "reference_image_base64": "..." (optional, or "reference_image_handle",
+                                         or "reference_image_id" of a library image)
     }
 
     Response:
@@ -39,8 +43,13 @@ def render_image():
         "generated_image_base64": "...",
         "mime_type": "image/png",
         "aspect_ratio": "16:9",
-        "viewpoint": "main_facade"
+        "viewpoint": "main_facade",
+        "image_handle": "...",
+        "reference_image_handle": "..."   (null without an uploaded reference)
     }
+
+    An unknown/evicted handle sent without base64 returns 410 so the
+    client can re-upload.
     """
     try:
         # ✅ FIX: Get thread-local instances (prevents race conditions)
@@ -48,33 +57,46 @@ def render_image():
         prompt_builder = get_prompt_builder()
         gemini = get_gemini_client()
         translator = get_translator()
+        uploads = get_upload_store()
 
         data = request.json
 
         # ✅ FIX: Accept form_data_vi instead of translated_data_en
-        required = ['image_base64', 'form_data_vi', 'aspect_ratio']
-        if not all(k in data for k in required):
-            return jsonify({"error": f"Missing required fields: {required}"}), 400
+        required = ['form_data_vi', 'aspect_ratio']
+        if not all(k in data for k in required) or not (data.get('image_base64') or data.get('image_handle')):
+            return jsonify({"error": f"Missing required fields: {required + ['image_base64 or image_handle']}"}), 400
+
+        # Process sketch image (reused from the upload store when possible)
+        try:
+            sketch_ctx = uploads.resolve(processor, data)
+            reference_ctx = uploads.resolve(
+                processor, data,
+                base64_key='reference_image_base64',
+                handle_key='reference_image_handle'
+            )
+        except KeyError as e:
+            return jsonify({"error": f"Unknown or expired image handle: {e.args[0]}", "code": "handle_expired"}), 410
 
-        # Process sketch image
-        sketch_pil, _ = processor.process_base64_image(data['image_base64'])
-        if not sketch_pil:
+        if not sketch_ctx:
             return jsonify({"error": "Invalid sketch image"}), 400
+
+        # ✅ OPTIMIZED: library references are sent by id and served from
+        # the pre-encoded payload cache (no download + re-upload + re-encode)
+        reference_png = None
+        if data.get('reference_image_id'):
+            reference_png = get_payload_cache().get(data['reference_image_id'])
+            if reference_png is None:
+                return jsonify({"error": f"Reference image not found: {data['reference_image_id']}"}), 404
+        elif reference_ctx:
+            reference_png = reference_ctx.png()
         
-        # Detect and preprocess
-        sketch_info = processor.detect_sketch_type(sketch_pil)
+        # Detect and preprocess (memoized per handle, including the PNG sent upstream)
         # ✅ OPTIMIZED: Use preserve_quality=True to minimize quality loss
-        preprocessed = processor.preprocess_sketch(
-            sketch_pil,
+        preprocessed = sketch_ctx.preprocessed(
             target_aspect_ratio=data['aspect_ratio'],
-            sketch_info=sketch_info,
             preserve_quality=True  # ✅ NEW: Preserve maximum quality
         )
-        
-        # Process reference image (optional)
-        reference_pil = None
-        if 'reference_image_base64' in data:
-            reference_pil, _ = processor.process_base64_image(data['reference_image_base64'])
+        preprocessed_png = sketch_ctx.preprocessed_png(data['aspect_ratio'], preserve_quality=True)
         
         # ✅ FIX: RE-TRANSLATE form_data_vi to include user edits!
         # ✅ NEW: Pass render_mode to translator
@@ -125,7 +147,7 @@ def render_image():
                 prompt, negative_prompt = prompt_builder.build_interior_render_prompt(
                     translated_data_en=translated_data_en,
                     viewpoint=viewpoint,
-                    has_reference=(reference_pil is not None),
+                    has_reference=(reference_png is not None),
                     sketch_adherence=sketch_adherence,
                     aspect_ratio=aspect_ratio
                 )
@@ -134,7 +156,7 @@ def render_image():
                 prompt, negative_prompt = prompt_builder.build_render_prompt(
                     translated_data_en=translated_data_en,
                     viewpoint=viewpoint,
-                    has_reference=(reference_pil is not None),
+                    has_reference=(reference_png is not None),
                     sketch_adherence=sketch_adherence,
                     aspect_ratio=aspect_ratio
                 )
@@ -145,23 +167,24 @@ def render_image():
         # Generate image
         generated_pil = gemini.generate_image(
             prompt=prompt,
-            source_image=preprocessed,
-            reference_image=reference_pil,
+            source_image=preprocessed_png,
+            reference_image=reference_png,
             temperature=0.4
         )
         
         if not generated_pil:
             return jsonify({"error": "Image generation failed"}), 500
 
-        # Auto-save to render history (best-effort, non-blocking)
+        # Convert to base64 (PNG bytes are shared with the history writer)
+        output_base64 = base64.b64encode(encode_png(generated_pil)).decode('utf-8')
+
+        # Auto-save to render history (best-effort, background thread)
         try:
-            from core.history_manager import HistoryManager
-            hm = HistoryManager()
             if render_mode == 'interior':
                 summary = f"{form_data_vi.get('room_type', '')} | {form_data_vi.get('interior_style', '')}"
             else:
                 summary = f"{form_data_vi.get('building_type', '')} | {form_data_vi.get('facade_style', '')}"
-            hm.save_render(
+            get_history_writer().submit(
                 image_pil=generated_pil,
                 mode=render_mode,
                 prompt_summary=summary,
@@ -171,16 +194,13 @@ def render_image():
         except Exception as he:
             print(f"⚠️  History save failed (non-critical): {he}")
 
-        # Convert to base64
-        output_buffer = io.BytesIO()
-        generated_pil.save(output_buffer, format='PNG', quality=95)
-        output_base64 = base64.b64encode(output_buffer.getvalue()).decode('utf-8')
-
         return jsonify({
             "generated_image_base64": output_base64,
             "mime_type": "image/png",
             "aspect_ratio": data['aspect_ratio'],
-            "viewpoint": viewpoint
+            "viewpoint": viewpoint,
+            "image_handle": sketch_ctx.handle,
+            "reference_image_handle": reference_ctx.handle if reference_ctx else None
         })
         
     except Exception as e:
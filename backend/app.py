@@ -14,7 +14,7 @@ from flask import Flask, jsonify
 from flask_cors import CORS
 import os
 
-from config import ServerConfig
+from config import ServerConfig, HistoryConfig, ReferenceConfig
 from api.render import render_bp
 from api.translate import translate_bp
 from api.analyze import analyze_bp
@@ -23,9 +23,11 @@ from api.references import references_bp
 from api.inpaint import inpaint_bp
 from api.planning import planning_bp
 from api.settings import settings_bp
-from api.history import history_bp
+from api.history import history_bp, get_history_manager
 from api.object_swap import object_swap_bp
 from api.floorplan import floorplan_bp
+from core.thread_local import get_history_compactor
+from references.library import get_library
 
 
 def create_app():
@@ -37,6 +39,7 @@ def create_app():
     
     # ============== CONFIGURATION ==============
     app.config['MAX_CONTENT_LENGTH'] = ServerConfig.MAX_CONTENT_LENGTH
+    app.config['USE_X_SENDFILE'] = HistoryConfig.X_SENDFILE
     
     # ============== CORS ==============
     CORS(app, resources={
@@ -61,6 +64,30 @@ def create_app():
     app.register_blueprint(object_swap_bp, url_prefix='/api')          # /api/object-swap/*
     app.register_blueprint(floorplan_bp, url_prefix='/api')            # /api/floorplan/*
     
+    # ============== RENDER HISTORY INDEX ==============
+    # Open (and if needed build/migrate) the history index at startup
+    # rather than on the first gallery request
+    history_manager = get_history_manager()
+    if HistoryConfig.REINDEX_ON_START:
+        count = history_manager.rebuild_index()
+        print(f"📇 History index rebuilt: {count} renders")
+    else:
+        # Cheap scandir count check; rebuilds if sidecars changed on disk
+        history_manager.reconcile()
+
+    # Retention/compaction thread (only when a policy is configured; with
+    # the debug reloader, only in the child process that serves requests)
+    compactor = get_history_compactor()
+    serving_process = not ServerConfig.DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+    if compactor.enabled and serving_process:
+        compactor.start()
+        print(f"🧹 History compactor started (every {compactor.interval}s)")
+
+    # ============== REFERENCE LIBRARY ==============
+    # Pick up manifest.json edits (auto_generate_manifest.py) without a restart
+    if ReferenceConfig.RELOAD_INTERVAL_SECONDS > 0 and serving_process:
+        get_library().start_watching(ReferenceConfig.RELOAD_INTERVAL_SECONDS)
+    
     # ============== HEALTH CHECK ==============
     @app.route('/health', methods=['GET'])
     def health_check():
@@ -8,19 +8,46 @@ Usage:
     python auto_generate_manifest.py
     
     hoặc khi thêm ảnh mới:
-    python auto_generate_manifest.py --scan
+    python auto_generate_manifest.py --scan [--workers 8]
+
+Incremental: mỗi entry lưu "file": {size, mtime_ns, sha256}; ảnh không đổi
+(cùng size + mtime, thumbnails/features/embedding còn đủ) được bỏ qua. Phần
+việc theo từng ảnh (đọc kích thước, hash, thumbnails, visual features,
+embedding cho "more like this") chạy song song trên process pool.
+Embeddings được lưu riêng trong references/embeddings.npz.
+
+Sau manifest.json, tool ghi thêm references/manifest.db (bản compiled,
+xem references/compiled.py): ảnh base64 nhúng được tách ra thành blob,
+backend chỉ đọc khi cần.
 """
 
 import os
 import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 import argparse
 
+from PIL import Image
+
+import numpy as np
+
+from references.compiled import COMPILED_FILENAME, compile_manifest
+from references.embedding import EMBEDDINGS_FILENAME, compute_embedding, load_embeddings, save_embeddings
+from references.features import FEATURES_VERSION, compute_features, load_analysis_image
+from references.manifest import iter_images
+from references.thumbnails import THUMBNAIL_SIZES, generate_thumbnails, thumbnail_relpath
+
 
 # ============== CONFIG ==============
-IMAGES_DIR = Path("references/images")
-MANIFEST_PATH = Path("references/manifest.json")
+REFERENCES_DIR = Path("references")
+IMAGES_DIR = REFERENCES_DIR / "images"
+MANIFEST_PATH = REFERENCES_DIR / "manifest.json"
+EMBEDDINGS_PATH = REFERENCES_DIR / EMBEDDINGS_FILENAME
+COMPILED_PATH = REFERENCES_DIR / COMPILED_FILENAME
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
 
 
 # ============== HELPER FUNCTIONS ==============
@@ -69,38 +96,44 @@ def detect_category_from_folder(folder_name: str) -> Dict[str, str]:
     })
 
 
-def scan_images_folder() -> Dict[str, List[Dict]]:
+def scan_images_folder(images_dir: Path = IMAGES_DIR) -> Dict[str, List[Dict]]:
     """
     Scan images/ folder and return structure
     
     Returns:
         {
             "cao_tang_hien_dai": [
-                {"file": "ct_hd_001.jpg", "path": "..."},
+                {"file": "ct_hd_001.jpg", "path": "images/cao_tang_hien_dai/ct_hd_001.jpg",
+                 "size": 123456, "mtime_ns": 1700000000000000000},
                 ...
             ],
             ...
         }
     """
-    if not IMAGES_DIR.exists():
-        print(f"❌ Error: {IMAGES_DIR} does not exist!")
+    if not images_dir.exists():
+        print(f"❌ Error: {images_dir} does not exist!")
         return {}
     
     categories = {}
     
-    for category_folder in IMAGES_DIR.iterdir():
-        if not category_folder.is_dir():
+    # ✅ OPTIMIZED: scandir gives size/mtime with the directory listing
+    for category_entry in sorted(os.scandir(images_dir), key=lambda e: e.name):
+        if not category_entry.is_dir():
             continue
         
-        category_name = category_folder.name
+        category_name = category_entry.name
         images = []
         
-        for image_file in category_folder.glob("*"):
-            if image_file.suffix.lower() in ['.jpg', '.jpeg', '.png', '.webp']:
-                images.append({
-                    "file": image_file.name,
-                    "path": str(image_file.relative_to(Path("references")))
-                })
+        for image_entry in sorted(os.scandir(category_entry.path), key=lambda e: e.name):
+            if not image_entry.is_file() or not image_entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            stat = image_entry.stat()
+            images.append({
+                "file": image_entry.name,
+                "path": f"{images_dir.name}/{category_name}/{image_entry.name}",
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns
+            })
         
         if images:
             categories[category_name] = images
@@ -196,73 +229,224 @@ def merge_with_existing(new_manifest: Dict, existing_path: Path, sync_mode: bool
     
     with open(existing_path, 'r', encoding='utf-8') as f:
         existing = json.load(f)
+    existing.setdefault("categories", {})
     
     if sync_mode:
         # ⭐ CHẾ ĐỘ SYNC: Xóa ảnh không tồn tại
         print("  🔄 SYNC MODE: Removing non-existent images...")
-        
-        for category, data in list(existing.get("categories", {}).items()):
+        for category in list(existing["categories"]):
             if category not in new_manifest["categories"]:
                 # Category không còn tồn tại → xóa
                 print(f"  ❌ Removed category: {category}")
                 del existing["categories"][category]
-                continue
-            
-            # Lấy danh sách ID ảnh hiện tại
-            new_image_ids = {img["id"] for img in new_manifest["categories"][category]["subcategory_main"]["images"]}
-            
-            # Lọc chỉ giữ ảnh còn tồn tại
-            existing_images = existing["categories"][category].get("subcategory_main", {}).get("images", [])
-            filtered_images = []
-            
+    
+    for category, data in new_manifest["categories"].items():
+        if category not in existing["categories"]:
+            # New category
+            existing["categories"][category] = data
+            print(f"  ➕ Added category: {category}")
+            continue
+        
+        main = existing["categories"][category].setdefault("subcategory_main", {"images": []})
+        existing_images = main.get("images", [])
+        new_images = data["subcategory_main"]["images"]
+        
+        # Một lần cho mỗi category: tập ID ảnh mới / ảnh cũ
+        new_ids = {img["id"] for img in new_images}
+        if sync_mode:
+            kept = []
             for img in existing_images:
-                if img["id"] in new_image_ids:
-                    filtered_images.append(img)
+                if img["id"] in new_ids:
+                    kept.append(img)
                 else:
                     print(f"  ❌ Removed: {img['id']} (file not found)")
-            
-            existing["categories"][category]["subcategory_main"]["images"] = filtered_images
+            existing_images = kept
         
-        # Thêm category và ảnh mới
-        for category, data in new_manifest["categories"].items():
-            if category not in existing["categories"]:
-                existing["categories"][category] = data
-                print(f"  ➕ Added category: {category}")
-            else:
-                # Thêm ảnh mới vào category đã tồn tại
-                existing_images = existing["categories"][category]["subcategory_main"]["images"]
-                existing_ids = {img["id"] for img in existing_images}
-                
-                for new_img in data["subcategory_main"]["images"]:
-                    if new_img["id"] not in existing_ids:
-                        existing_images.append(new_img)
-                        print(f"  ➕ Added: {new_img['id']}")
+        # Add only new images
+        existing_ids = {img["id"] for img in existing_images}
+        for new_img in new_images:
+            if new_img["id"] not in existing_ids:
+                existing_images.append(new_img)
+                print(f"  ➕ Added: {new_img['id']}")
         
-        return existing
+        main["images"] = existing_images
     
-    else:
-        # ⭐ CHẾ ĐỘ MERGE: Chỉ thêm mới, không xóa
-        for category, data in new_manifest["categories"].items():
-            if category in existing.get("categories", {}):
-                # Category exists, merge images
-                existing_images = existing["categories"][category].get("subcategory_main", {}).get("images", [])
-                new_images = data["subcategory_main"]["images"]
-                
-                existing_ids = {img["id"] for img in existing_images}
-                
-                # Add only new images
-                for new_img in new_images:
-                    if new_img["id"] not in existing_ids:
-                        existing_images.append(new_img)
-                        print(f"  ➕ Added: {new_img['id']}")
-                
-                existing["categories"][category]["subcategory_main"]["images"] = existing_images
+    return existing
+
+
+# ============== PER-IMAGE WORK (process pool) ==============
+
+def probe_image(task: Dict) -> Dict:
+    """
+    Hash, measure, thumbnail and describe one image. Runs in a worker
+    process: takes and returns plain data only.
+    
+    Args:
+        task: {"references_dir", "path" (relative to it), "thumbnails": bool,
+               "features": bool, "embedding": bool,
+               "sha256": recorded in the manifest or None}
+    """
+    references_dir = Path(task["references_dir"])
+    rel_path = task["path"]
+    path = references_dir / rel_path
+    result = {"path": rel_path}
+    try:
+        stat = path.stat()
+        with open(path, 'rb') as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        result["file"] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        
+        # Header only: Image.open doesn't decode pixels
+        with Image.open(path) as img:
+            result["width"], result["height"] = img.size
+        
+        if task["thumbnails"]:
+            if digest == task["sha256"] and _touch_thumbnails(references_dir, rel_path):
+                # Same content, new mtime (copied/touched): keep the thumbnails
+                result["thumbnails"] = {
+                    str(size): thumbnail_relpath(rel_path, size) for size in THUMBNAIL_SIZES
+                }
             else:
-                # New category
-                existing["categories"][category] = data
-                print(f"  ➕ Added category: {category}")
+                result["thumbnails"] = generate_thumbnails(references_dir, rel_path)
         
-        return existing
+        if task["features"] or task["embedding"]:
+            # One small decode for both
+            rgb = load_analysis_image(path)
+            if task["features"]:
+                result["features"] = compute_features(rgb)
+            if task["embedding"]:
+                result["embedding"] = compute_embedding(rgb)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _touch_thumbnails(references_dir: Path, rel_path: str) -> bool:
+    """Mark existing thumbnails as current; False if any is missing"""
+    paths = [references_dir / thumbnail_relpath(rel_path, size) for size in THUMBNAIL_SIZES]
+    if not all(p.exists() for p in paths):
+        return False
+    for p in paths:
+        os.utime(p)
+    return True
+
+
+def needs_update(
+    entry: Dict,
+    scanned: Dict,
+    references_dir: Path,
+    make_thumbnails: bool,
+    make_features: bool,
+    embeddings: Optional[Dict[str, Tuple[str, np.ndarray]]] = None
+) -> bool:
+    """False if the entry's recorded file state still matches the file on disk"""
+    recorded = entry.get("file") or {}
+    if recorded.get("size") != scanned["size"] or recorded.get("mtime_ns") != scanned["mtime_ns"]:
+        return True
+    if "width" not in entry:
+        return True
+    if make_features and (entry.get("features") or {}).get("version") != FEATURES_VERSION:
+        return True
+    if embeddings is not None:
+        stored = embeddings.get(entry.get("id"))
+        if stored is None or stored[0] != recorded.get("sha256"):
+            return True
+    if make_thumbnails:
+        thumbnails = entry.get("thumbnails") or {}
+        if set(thumbnails) != {str(size) for size in THUMBNAIL_SIZES}:
+            return True
+        return not all((references_dir / rel).exists() for rel in thumbnails.values())
+    return False
+
+
+def process_images(tasks: List[Dict], workers: int) -> List[Dict]:
+    """probe_image over all tasks, in parallel when worth it"""
+    if workers <= 1 or len(tasks) < 2:
+        return [probe_image(task) for task in tasks]
+    chunksize = max(1, min(64, len(tasks) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(probe_image, tasks, chunksize=chunksize))
+
+
+def update_image_entries(
+    manifest: Dict,
+    scanned_data: Dict,
+    references_dir: Path = REFERENCES_DIR,
+    make_thumbnails: bool = True,
+    make_features: bool = True,
+    workers: int = 1,
+    embeddings: Optional[Dict[str, Tuple[str, np.ndarray]]] = None
+) -> Dict[str, int]:
+    """
+    Refresh file info / dimensions / thumbnails / features of the local
+    entries whose file changed (or that never had them). Returns counts.
+    
+    embeddings ({id: (sha256, vector)}, see load_embeddings) is updated in
+    place when given; None skips embeddings.
+    """
+    scanned_by_path = {img["path"]: img for images in scanned_data.values() for img in images}
+    
+    pending: Dict[str, List[Dict]] = {}
+    unchanged = 0
+    for _, _, entry in iter_images(manifest):
+        scanned = scanned_by_path.get(entry.get("path"))
+        if entry.get("storage", "local") != "local" or scanned is None:
+            continue
+        if needs_update(entry, scanned, references_dir, make_thumbnails, make_features, embeddings):
+            pending.setdefault(entry["path"], []).append(entry)
+        else:
+            unchanged += 1
+    
+    tasks = [
+        {
+            "references_dir": str(references_dir),
+            "path": rel_path,
+            "thumbnails": make_thumbnails,
+            "features": make_features,
+            "embedding": embeddings is not None,
+            "sha256": (entries[0].get("file") or {}).get("sha256")
+        }
+        for rel_path, entries in pending.items()
+    ]
+    failed = 0
+    for result in process_images(tasks, workers):
+        if "error" in result:
+            failed += 1
+            print(f"  ⚠️  {result['path']}: {result['error']}")
+            continue
+        for entry in pending[result["path"]]:
+            entry["file"] = result["file"]
+            entry["width"], entry["height"] = result["width"], result["height"]
+            for field in ("thumbnails", "features"):
+                if field in result:
+                    entry[field] = result[field]
+            if "embedding" in result and entry.get("id") is not None:
+                embeddings[entry["id"]] = (result["file"]["sha256"], result["embedding"])
+    
+    return {"processed": len(tasks) - failed, "unchanged": unchanged, "failed": failed}
+
+
+def prune_embeddings(
+    embeddings: Dict[str, Tuple[str, np.ndarray]],
+    manifest: Dict
+) -> Dict[str, Tuple[str, np.ndarray]]:
+    """Embeddings of the images still in the manifest, in manifest order"""
+    pruned = {}
+    for _, _, entry in iter_images(manifest):
+        image_id = entry.get("id")
+        if image_id in embeddings and image_id not in pruned:
+            pruned[image_id] = embeddings[image_id]
+    return pruned
+
+
+def write_manifest(manifest: Dict, manifest_path: Path = MANIFEST_PATH) -> None:
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    # Write-then-rename: a running backend polling the manifest never
+    # reads a half-written file
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
 
 
 # ============== MAIN ==============
@@ -273,6 +457,12 @@ def main():
     parser.add_argument('--create', action='store_true', help='Create new manifest (overwrite)')
     parser.add_argument('--preview', action='store_true', help='Preview without saving')
     parser.add_argument('--sync', action='store_true', help='Sync mode: remove images that no longer exist')
+    parser.add_argument('--no-thumbnails', action='store_true', help='Skip thumbnail generation')
+    parser.add_argument('--no-features', action='store_true', help='Skip visual feature extraction')
+    parser.add_argument('--no-embeddings', action='store_true', help='Skip similarity embeddings')
+    parser.add_argument('--no-compile', action='store_true', help='Do not write manifest.db')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Processes for hashing/thumbnails (default: CPU count)')
     
     args = parser.parse_args()
     
@@ -319,12 +509,31 @@ def main():
         print("🔄 Merging with existing manifest...")
         final_manifest = merge_with_existing(new_manifest, MANIFEST_PATH, sync_mode=args.sync)
     
-    # Save
+    # Only new/changed images are hashed, measured and thumbnailed
+    print(f"🖼️  Processing changed images ({args.workers} workers)...")
+    embeddings = None if args.no_embeddings else load_embeddings(EMBEDDINGS_PATH)
+    counts = update_image_entries(
+        final_manifest, scanned_data,
+        make_thumbnails=not args.no_thumbnails,
+        make_features=not args.no_features,
+        workers=args.workers,
+        embeddings=embeddings
+    )
+    print(f"  ✅ {counts['processed']} processed, {counts['unchanged']} unchanged, "
+          f"{counts['failed']} failed")
+    
+    # Save (embeddings first: the backend reloads both when manifest.json changes)
+    if embeddings is not None:
+        embeddings = prune_embeddings(embeddings, final_manifest)
+        print(f"💾 Saving {len(embeddings)} embeddings to: {EMBEDDINGS_PATH}")
+        save_embeddings(EMBEDDINGS_PATH, embeddings)
     print(f"💾 Saving to: {MANIFEST_PATH}")
-    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    write_manifest(final_manifest)
     
-    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
-        json.dump(final_manifest, f, indent=2, ensure_ascii=False)
+    if not args.no_compile:
+        compiled = compile_manifest(final_manifest, COMPILED_PATH, source_path=MANIFEST_PATH)
+        print(f"💾 Compiled to: {COMPILED_PATH} ({compiled['images']} images, "
+              f"{compiled['blobs']} embedded blobs)")
     
     print()
     print("=" * 60)
@@ -334,9 +543,10 @@ def main():
     print("Next steps:")
     print("1. Review manifest.json")
     print("2. Edit metadata if needed (lighting, materials, etc.)")
-    print("3. Restart backend: python app.py")
+    print("3. A running backend picks it up within REFERENCES_RELOAD_INTERVAL seconds")
+    print("   (or POST /api/references/reload)")
     print()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,90 @@
+"""
+benchmarks/bench_blending.py - hybrid/strict preservation kernels at 2K and 4K
+
+Compares the previous float64 implementations (3-channel masks,
+original * (1 - m) + edited * m) with core.compositing.soft_blend /
+hard_blend, reporting latency and peak traced memory for a small mask
+(one object) and a large mask (half the frame).
+
+Usage (from backend/):
+    python -m benchmarks.bench_blending [--repeat 5]
+"""
+
+import argparse
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from benchmarks.common import measure, print_header
+from core.compositing import hard_blend, soft_blend
+
+RESOLUTIONS = {"2K": (2048, 1152), "4K": (3840, 2160)}
+
+
+def legacy_hybrid(original, edited, mask):
+    """Reference copy of the previous InpaintingEngine._hybrid_preserve"""
+    _, mask_binary = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+    mask_dilated = cv2.dilate(mask_binary, np.ones((11, 11), np.uint8), iterations=1)
+    blend_mask = cv2.GaussianBlur(mask_dilated, (21, 21), 0) / 255.0
+    blend_mask = np.expand_dims(blend_mask, axis=2)
+    return (original * (1 - blend_mask) + edited * blend_mask).astype(np.uint8)
+
+
+def legacy_strict(original, edited, mask):
+    """Reference copy of the previous InpaintingEngine._strict_preserve"""
+    _, mask_binary = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+    mask_3d = np.expand_dims(mask_binary, axis=2).repeat(3, axis=2) / 255.0
+    return np.where(mask_3d > 0.5, edited, original).astype(np.uint8)
+
+
+def peak_mb(func) -> float:
+    """Peak memory traced by tracemalloc (NumPy reports its buffers) in MB"""
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def make_case(width: int, height: int, coverage: str):
+    rng = np.random.default_rng(width)
+    original = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    edited = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    mask = np.zeros((height, width), dtype=np.uint8)
+    if coverage == "small":
+        mask[height // 8: height // 3, width // 10: width // 4] = 255
+    else:
+        mask[:, : width // 2] = 255
+    return original, edited, mask
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    kernels = [
+        ("hybrid", legacy_hybrid, soft_blend),
+        ("strict", legacy_strict, hard_blend),
+    ]
+
+    print_header("Preservation blending: legacy float64 vs shared kernel")
+    print(f"{'res':>4} {'mask':>6} {'kernel':>7} {'legacy ms':>10} {'new ms':>8} "
+          f"{'legacy MB':>10} {'new MB':>8}")
+
+    for res_name, (width, height) in RESOLUTIONS.items():
+        for coverage in ("small", "large"):
+            original, edited, mask = make_case(width, height, coverage)
+            for name, legacy, current in kernels:
+                legacy_t = measure(lambda: legacy(original, edited, mask), repeat=args.repeat)
+                current_t = measure(lambda: current(original, edited, mask), repeat=args.repeat)
+                legacy_mem = peak_mb(lambda: legacy(original, edited, mask))
+                current_mem = peak_mb(lambda: current(original, edited, mask))
+                print(f"{res_name:>4} {coverage:>6} {name:>7} "
+                      f"{legacy_t['median_ms']:>10.1f} {current_t['median_ms']:>8.1f} "
+                      f"{legacy_mem:>10.1f} {current_mem:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+benchmarks/bench_history_index.py - render history listing at 10k / 100k renders
+
+Compares the previous list_renders (glob + json.load every sidecar, sort,
+slice) with the SQLite index: first page, a deep page by offset, and the
+same deep page by keyset cursor.
+
+The legacy scan needs real sidecar files, so it only runs up to
+--legacy-max renders; the index is populated directly for larger sizes.
+
+Usage (from backend/):
+    python -m benchmarks.bench_history_index [--sizes 10000 100000] [--repeat 3]
+"""
+
+import argparse
+import json
+import random
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from benchmarks.common import measure, print_header
+from core.history_index import HistoryIndex
+from core.history_manager import VALID_MODES
+
+
+def fake_metadata(i: int, start: datetime, thumb_b64: str):
+    timestamp = start + timedelta(seconds=i)
+    render_id = f"{i:08x}"
+    mode = VALID_MODES[i % len(VALID_MODES)]
+    stem = f"{timestamp.strftime('%Y%m%d_%H%M%S')}_{render_id}"
+    return {
+        "id": render_id,
+        "timestamp": timestamp.isoformat(),
+        "mode": mode,
+        "filename": f"{stem}.png",
+        "thumbnail_b64": thumb_b64,
+        "source_thumbnail_b64": thumb_b64,
+        "prompt_summary": f"Modern villa render #{i}",
+        "settings": {"aspect_ratio": "16:9", "viewpoint": "eye_level"}
+    }, stem
+
+
+def legacy_list(base_dir: Path, page: int, limit: int):
+    """Reference copy of the previous HistoryManager.list_renders"""
+    all_items = []
+    for m in VALID_MODES:
+        for json_file in (base_dir / m).glob("*.json"):
+            with open(json_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            meta.pop("source_thumbnail_b64", None)
+            all_items.append(meta)
+    all_items.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+    start = (page - 1) * limit
+    return all_items[start:start + limit]
+
+
+def run_size(n: int, args) -> None:
+    start = datetime(2024, 1, 1)
+    thumb_b64 = "A" * (args.thumb_kb * 1024)
+    limit = 20
+    deep_page = max(1, n // limit - 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_dir = Path(tmp)
+        for mode in VALID_MODES:
+            (base_dir / mode).mkdir()
+
+        entries = [fake_metadata(i, start, thumb_b64) for i in range(n)]
+        random.Random(n).shuffle(entries)
+
+        index = HistoryIndex(base_dir / "history_index.db")
+        index.add_many(entries)
+
+        print(f"\n{n:,} renders")
+
+        if n <= args.legacy_max:
+            for meta, stem in entries:
+                with open(base_dir / meta["mode"] / f"{stem}.json", "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+            t = measure(lambda: legacy_list(base_dir, 1, limit), repeat=args.repeat)
+            print(f"  legacy scan, page 1      : {t['median_ms']:10.2f} ms")
+        else:
+            print(f"  legacy scan              :   skipped (> --legacy-max {args.legacy_max:,})")
+
+        t = measure(lambda: index.page(limit=limit), repeat=args.repeat)
+        print(f"  index, page 1            : {t['median_ms']:10.2f} ms")
+
+        t = measure(lambda: index.page(mode="interior", limit=limit), repeat=args.repeat)
+        print(f"  index, page 1 (one mode) : {t['median_ms']:10.2f} ms")
+
+        offset = (deep_page - 1) * limit
+        t = measure(lambda: index.page(limit=limit, offset=offset), repeat=args.repeat)
+        print(f"  index, page {deep_page:<6} offset : {t['median_ms']:9.2f} ms")
+
+        previous = index.page(limit=1, offset=offset - 1)[0]
+        cursor = HistoryIndex.make_cursor(previous)
+        t = measure(lambda: index.page(limit=limit, cursor=cursor), repeat=args.repeat)
+        print(f"  index, page {deep_page:<6} cursor : {t['median_ms']:9.2f} ms")
+
+        t = measure(lambda: index.count(), repeat=args.repeat)
+        print(f"  index, total count       : {t['median_ms']:10.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy-max", type=int, default=10_000)
+    parser.add_argument("--thumb-kb", type=int, default=8,
+                        help="Size of the fake base64 thumbnail in each sidecar")
+    args = parser.parse_args()
+
+    print_header("Render history listing: JSON scan vs SQLite index")
+    for n in args.sizes:
+        run_size(n, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+benchmarks/bench_history_search.py - render history search at 100k renders
+
+Times HistoryIndex.search (FTS5 + facet counts) for: no query (facets
+only), a common word, an unaccented phrase matching accented summaries,
+a rare word, a prefix, a query combined with filters and a date range,
+and a deep page by cursor.
+
+Usage (from backend/):
+    python -m benchmarks.bench_history_search [--sizes 10000 100000] [--repeat 5]
+"""
+
+import argparse
+import random
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from benchmarks.common import measure, print_header
+from core.history_index import HistoryIndex
+from core.history_manager import VALID_MODES
+
+SUBJECTS = ["Biệt thự hiện đại", "Phòng khách", "Nhà phố", "Khu đô thị", "Căn hộ",
+            "Modern villa", "Office tower", "Resort ven biển", "Quán cà phê", "Phòng ngủ"]
+DETAILS = ["ánh sáng tự nhiên", "gỗ óc chó", "kính cường lực", "sunset lighting",
+           "minimalist", "tropical garden", "bê tông trần", "đèn vàng ấm", "marble", "rooftop pool"]
+ASPECTS = ["16:9", "4:3", "1:1", "9:16", "3:2"]
+VIEWPOINTS = ["eye_level", "aerial", "close_up", "wide"]
+STYLES = ["modern", "scandinavian", "indochine", "industrial"]
+
+
+def fake_metadata(i: int, start: datetime, rng: random.Random):
+    timestamp = start + timedelta(minutes=i)
+    render_id = f"{i:08x}"
+    mode = VALID_MODES[i % len(VALID_MODES)]
+    stem = f"{timestamp.strftime('%Y%m%d_%H%M%S')}_{render_id}"
+    settings = {"aspect_ratio": rng.choice(ASPECTS)}
+    if mode in ("building", "interior"):
+        settings["viewpoint"] = rng.choice(VIEWPOINTS)
+    if mode == "floorplan":
+        settings["style"] = rng.choice(STYLES)
+    return {
+        "id": render_id,
+        "timestamp": timestamp.isoformat(),
+        "mode": mode,
+        "filename": f"{stem}.png",
+        "blobs": {"image": f"{render_id}.png"},
+        "prompt_summary": f"{rng.choice(SUBJECTS)}, {rng.choice(DETAILS)}, {rng.choice(DETAILS)} #{i}",
+        "settings": settings
+    }, stem
+
+
+def run_size(n: int, args) -> None:
+    start = datetime(2024, 1, 1)
+    rng = random.Random(n)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = HistoryIndex(Path(tmp) / "history_index.db")
+        index.add_many(fake_metadata(i, start, rng) for i in range(n))
+        middle = (start + timedelta(minutes=n // 2)).isoformat()
+
+        print(f"\n{n:,} renders")
+        cases = [
+            ("no query (facets only)", dict()),
+            ("common word 'phong'", dict(query="phong")),
+            ("unaccented 'go oc cho'", dict(query="go oc cho")),
+            ("rare word '4321'", dict(query="4321")),
+            ("prefix 'biet th'", dict(query="biet th")),
+            ("query + filters + dates", dict(query="hien dai", filters={"mode": "building", "aspect_ratio": "16:9"},
+                                             date_from=middle)),
+        ]
+        for label, kwargs in cases:
+            result = index.search(**kwargs)
+            t = measure(lambda: index.search(**kwargs), repeat=args.repeat)
+            print(f"  {label:<26}: {t['median_ms']:8.2f} ms  ({result['total']:,} matches)")
+
+        deep = index.search(query="phong", limit=1, offset=index.search(query="phong")["total"] // 2)
+        cursor = HistoryIndex.make_cursor(deep["items"][0])
+        t = measure(lambda: index.search(query="phong", cursor=cursor), repeat=args.repeat)
+        print(f"  {'deep page by cursor':<26}: {t['median_ms']:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print_header("Render history search: FTS5 + facets")
+    for n in args.sizes:
+        run_size(n, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+benchmarks/bench_manifest_generation.py - auto_generate_manifest.py on a large library
+
+Builds a synthetic library (default 20k small JPEGs in 10 categories) and
+times:
+  - scan (scandir + stat)
+  - cold run, 1 worker vs --workers (hash + dimensions + thumbnails + features)
+  - warm re-run with nothing changed (incremental: merge + stat checks)
+  - re-run after 1% of the files changed
+
+Usage (from backend/):
+    python -m benchmarks.bench_manifest_generation [--images 20000] [--workers 8]
+        [--serial-max 5000]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from auto_generate_manifest import (
+    generate_manifest, merge_with_existing, scan_images_folder,
+    update_image_entries, write_manifest
+)
+from benchmarks.common import print_header
+
+CATEGORIES = 10
+
+
+def build_library(images_dir: Path, n: int) -> None:
+    per_category = (n + CATEGORIES - 1) // CATEGORIES
+    for c in range(CATEGORIES):
+        category_dir = images_dir / f"category_{c:02d}"
+        category_dir.mkdir(parents=True)
+        for i in range(min(per_category, n - c * per_category)):
+            color = ((c * 25) % 256, (i * 7) % 256, (i * 13) % 256)
+            Image.new("RGB", (640, 480), color).save(category_dir / f"ref_{c:02d}_{i:05d}.jpg", quality=80)
+
+
+def run(references_dir: Path, workers: int, manifest_path: Path) -> dict:
+    """One full generation (scan, merge with manifest_path, process, write)"""
+    timings = {}
+    start = time.perf_counter()
+    scanned = scan_images_folder(references_dir / "images")
+    timings["scan"] = time.perf_counter() - start
+
+    manifest = merge_with_existing(generate_manifest(scanned), manifest_path)
+    counts = update_image_entries(manifest, scanned, references_dir, workers=workers)
+    write_manifest(manifest, manifest_path)
+    timings["total"] = time.perf_counter() - start
+    timings.update(counts)
+    return timings
+
+
+def report(label: str, timings: dict) -> None:
+    print(f"  {label:<28}: {timings['total']:8.2f} s   (scan {timings['scan'] * 1000:.0f} ms, "
+          f"{timings['processed']:,} processed, {timings['unchanged']:,} unchanged)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--serial-max", type=int, default=5_000,
+                        help="Run the 1-worker cold pass only up to this many images")
+    args = parser.parse_args()
+
+    print_header(f"Manifest generation: {args.images:,} images, {args.workers} workers")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        references_dir = Path(tmp) / "references"
+        manifest_path = references_dir / "manifest.json"
+        print("  building library...", flush=True)
+        build_library(references_dir / "images", args.images)
+
+        if args.images <= args.serial_max:
+            report("cold, 1 worker", run(references_dir, 1, manifest_path))
+            manifest_path.unlink()
+            shutil.rmtree(references_dir / "thumbnails")
+        else:
+            print(f"  {'cold, 1 worker':<28}:  skipped (> --serial-max {args.serial_max:,})")
+
+        report(f"cold, {args.workers} workers", run(references_dir, args.workers, manifest_path))
+        report("warm, nothing changed", run(references_dir, args.workers, manifest_path))
+
+        changed = sorted((references_dir / "images").rglob("*.jpg"))[::100]
+        for path in changed:
+            Image.new("RGB", (640, 480), (255, 0, 0)).save(path, quality=80)
+        report(f"warm, {len(changed):,} files changed", run(references_dir, args.workers, manifest_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+benchmarks/bench_manifest_load.py - library startup: manifest.json vs manifest.db
+
+Builds a manifest whose images are all embedded (tier-1 base64, default
+2,000 x ~40 KB, i.e. ~110 MB of JSON) and times, for each format:
+  - ReferenceLibrary() load (parse + indexes)
+  - Python memory retained by the library (tracemalloc)
+  - get_image_base64() of an embedded image
+
+Usage (from backend/):
+    python -m benchmarks.bench_manifest_load [--images 2000] [--image-kb 40]
+"""
+
+import argparse
+import base64
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.common import measure, print_header
+from references.compiled import COMPILED_FILENAME, compile_manifest
+from references.library import ReferenceLibrary
+
+CATEGORIES = 10
+
+
+def build_manifest(n: int, image_kb: int) -> dict:
+    manifest = {"version": "1.0.0", "categories": {}}
+    for i in range(n):
+        category = manifest["categories"].setdefault(f"category_{i % CATEGORIES:02d}", {
+            "name": f"Category {i % CATEGORIES}",
+            "subcategory_main": {"name": "Main Collection", "images": []}
+        })
+        category["subcategory_main"]["images"].append({
+            "id": f"ref_{i:06d}",
+            "name": f"Reference {i}",
+            "tags": ["modern", f"tag_{i % 50}"],
+            "description": "Synthetic embedded reference image",
+            "mime_type": "image/jpeg",
+            "base64": base64.b64encode(os.urandom(image_kb * 1024)).decode()
+        })
+    return manifest
+
+
+def load(manifest_path: Path) -> dict:
+    gc.collect()
+    start = time.perf_counter()
+    ReferenceLibrary(manifest_path)
+    elapsed = time.perf_counter() - start
+
+    # Memory on a second load: tracemalloc slows allocations down
+    gc.collect()
+    tracemalloc.start()
+    library = ReferenceLibrary(manifest_path)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"library": library, "load_ms": elapsed * 1000, "retained": retained, "peak": peak}
+
+
+def report(label: str, result: dict) -> None:
+    print(f"  {label:<22}: load {result['load_ms']:8.1f} ms   retained {result['retained'] / 1e6:7.1f} MB"
+          f"   peak {result['peak'] / 1e6:7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=2_000)
+    parser.add_argument("--image-kb", type=int, default=40)
+    args = parser.parse_args()
+
+    print_header(f"Reference library load: {args.images:,} embedded images of {args.image_kb} KB")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest_path = Path(tmp) / "manifest.json"
+        manifest = build_manifest(args.images, args.image_kb)
+        manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
+        print(f"  manifest.json: {manifest_path.stat().st_size / 1e6:.1f} MB")
+
+        start = time.perf_counter()
+        compile_manifest(manifest, Path(tmp) / COMPILED_FILENAME, source_path=manifest_path)
+        print(f"  compile manifest.db: {(time.perf_counter() - start) * 1000:.0f} ms")
+        del manifest
+        compiled_path = Path(tmp) / COMPILED_FILENAME
+
+        # JSON: hide manifest.db for the first load
+        hidden = compiled_path.with_name("manifest.db.hidden")
+        compiled_path.rename(hidden)
+        result = load(manifest_path)
+        report("manifest.json", result)
+        library = result.pop("library")
+        t = measure(lambda: library.get_image_base64("ref_000123"), repeat=20)
+        print(f"  {'  get_image_base64':<22}: {t['median_ms']:8.3f} ms")
+        del library, result
+        hidden.rename(compiled_path)
+
+        result = load(manifest_path)
+        report("manifest.db", result)
+        library = result.pop("library")
+        t = measure(lambda: library.get_image_base64("ref_000123"), repeat=20)
+        print(f"  {'  get_image_base64':<22}: {t['median_ms']:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
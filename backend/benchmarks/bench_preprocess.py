@@ -0,0 +1,95 @@
+"""
+benchmarks/bench_preprocess.py - preprocess_sketch across all ASPECT_RATIOS
+
+Compares the previous implementation (PIL LANCZOS upscale, LANCZOS4 for
+every resize, white canvas via np.ones(...) * 255 + copy) with the current
+OpenCV path (scale-dependent interpolation, cv2.copyMakeBorder padding).
+
+Usage (from backend/):
+    python -m benchmarks.bench_preprocess [--repeat 5]
+"""
+
+import argparse
+import contextlib
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from benchmarks.common import measure, print_header
+from config import ASPECT_RATIOS
+from core.image_processor import ImageProcessor
+
+# Typical uploads: small phone photo, mid-size scan, large scan, tall sketch
+INPUT_SIZES = [(800, 600), (1400, 1000), (3000, 2000), (1200, 2400)]
+
+
+def legacy_preprocess(pil_image, target_aspect_ratio, preserve_quality):
+    """Reference copy of the previous implementation"""
+    target_w, target_h = ASPECT_RATIOS.get(target_aspect_ratio, (1920, 1080))
+    orig_w, orig_h = pil_image.size
+
+    if preserve_quality:
+        if orig_w > 1500 or orig_h > 1500:
+            return pil_image
+        if orig_w < 1920:
+            scale_factor = 1920 / orig_w
+            new_w, new_h = int(orig_w * scale_factor), int(orig_h * scale_factor)
+            return pil_image.resize((new_w, new_h), Image.Resampling.LANCZOS)
+
+    img_array = np.array(pil_image)
+    h, w = img_array.shape[:2]
+    scale = min(target_w / w, target_h / h)
+    new_w, new_h = int(w * scale), int(h * scale)
+    resized = cv2.resize(img_array, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4)
+
+    padded = np.ones((target_h, target_w, resized.shape[2]), dtype=np.uint8) * 255
+    y_offset = (target_h - new_h) // 2
+    x_offset = (target_w - new_w) // 2
+    padded[y_offset:y_offset + new_h, x_offset:x_offset + new_w] = resized
+    return Image.fromarray(padded)
+
+
+def make_sketch(width: int, height: int) -> Image.Image:
+    """White page with random dark strokes"""
+    rng = np.random.default_rng(width * height)
+    canvas = np.full((height, width, 3), 255, dtype=np.uint8)
+    for _ in range(200):
+        x1, x2 = rng.integers(0, width, 2)
+        y1, y2 = rng.integers(0, height, 2)
+        cv2.line(canvas, (int(x1), int(y1)), (int(x2), int(y2)), (30, 30, 30), 2)
+    return Image.fromarray(canvas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    processor = ImageProcessor()
+    print_header("preprocess_sketch: legacy vs OpenCV fast path (median ms)")
+    print(f"{'input':>11} {'ratio':>6} {'mode':>9} {'legacy':>9} {'current':>9} {'speedup':>8}")
+
+    for width, height in INPUT_SIZES:
+        sketch = make_sketch(width, height)
+        for ratio in ASPECT_RATIOS:
+            for preserve_quality in (True, False):
+                # preserve_quality ignores the target ratio; time it once per input
+                if preserve_quality and ratio != next(iter(ASPECT_RATIOS)):
+                    continue
+
+                def run_current():
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        processor.preprocess_sketch(sketch, ratio, preserve_quality=preserve_quality)
+
+                legacy = measure(lambda: legacy_preprocess(sketch, ratio, preserve_quality), repeat=args.repeat)
+                current = measure(run_current, repeat=args.repeat)
+                speedup = legacy["median_ms"] / max(current["median_ms"], 1e-6)
+                mode = "preserve" if preserve_quality else "pad"
+                print(f"{width:>5}x{height:<5} {ratio:>6} {mode:>9} "
+                      f"{legacy['median_ms']:>9.2f} {current['median_ms']:>9.2f} {speedup:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+benchmarks/bench_reference_similarity.py - "more like this" at 50k references
+
+Builds a synthetic library of embeddings (real embeddings of a few hundred
+generated images, jittered to the requested size) and times:
+  - embedding an uploaded 1600x1200 image (downsample + histogram + HOG)
+  - embeddings.npz save/load and the SimilarityIndex build (snapshot load)
+  - queries: all / color / shape, and restricted to one category
+
+Usage (from backend/):
+    python -m benchmarks.bench_reference_similarity [--sizes 10000 50000] [--repeat 20]
+"""
+
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from benchmarks.common import measure, print_header
+from references.embedding import (
+    COLOR_DIM, COLOR_WEIGHT, SHAPE_WEIGHT, SimilarityIndex, compute_embedding,
+    load_embeddings, query_vector, save_embeddings
+)
+from references.features import analysis_array
+
+BASE_IMAGES = 300
+CATEGORIES = 10
+
+
+def synthetic_image(rng: np.random.Generator, size=(640, 480)) -> Image.Image:
+    background = tuple(int(c) for c in rng.integers(0, 256, 3))
+    img = Image.new("RGB", size, background)
+    draw = ImageDraw.Draw(img)
+    for _ in range(int(rng.integers(3, 12))):
+        x0, y0 = int(rng.integers(0, size[0])), int(rng.integers(0, size[1]))
+        x1, y1 = int(rng.integers(0, size[0])), int(rng.integers(0, size[1]))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        if rng.random() < 0.5:
+            draw.rectangle([min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)], fill=color)
+        else:
+            draw.line([(x0, y0), (x1, y1)], fill=color, width=int(rng.integers(2, 10)))
+    return img
+
+
+def _renormalize(vectors: np.ndarray) -> np.ndarray:
+    """Per part L2 normalization + weights, as compute_embedding does"""
+    color, shape = vectors[:, :COLOR_DIM], vectors[:, COLOR_DIM:]
+    color /= np.maximum(np.linalg.norm(color, axis=1, keepdims=True), 1e-12)
+    shape /= np.maximum(np.linalg.norm(shape, axis=1, keepdims=True), 1e-12)
+    return np.hstack([color * np.sqrt(COLOR_WEIGHT), shape * np.sqrt(SHAPE_WEIGHT)]).astype(np.float32)
+
+
+def synthetic_embeddings(n: int, rng: np.random.Generator) -> np.ndarray:
+    base = np.array([compute_embedding(analysis_array(synthetic_image(rng))) for _ in range(BASE_IMAGES)])
+    vectors = base[rng.integers(0, BASE_IMAGES, n)]
+    vectors = np.abs(vectors + rng.normal(0, 0.02, vectors.shape).astype(np.float32))
+    return _renormalize(vectors)
+
+
+def run_size(n: int, vectors: np.ndarray, query: np.ndarray, args) -> None:
+    ids = [f"ref_{i:06d}" for i in range(n)]
+    groups = [f"category_{i % CATEGORIES:02d}" for i in range(n)]
+    vectors = vectors[:n]
+
+    print(f"\n{n:,} references ({vectors.shape[1]} dims, {vectors.nbytes / 1e6:.1f} MB)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "embeddings.npz"
+        stored = {image_id: ("0" * 64, vector) for image_id, vector in zip(ids, vectors)}
+        t = measure(lambda: save_embeddings(path, stored), repeat=3)
+        print(f"  {'save embeddings.npz':<26}: {t['median_ms']:8.2f} ms")
+        t = measure(lambda: load_embeddings(path), repeat=3)
+        print(f"  {'load embeddings.npz':<26}: {t['median_ms']:8.2f} ms")
+
+    t = measure(lambda: SimilarityIndex(ids, vectors, groups=groups), repeat=3)
+    print(f"  {'build index':<26}: {t['median_ms']:8.2f} ms")
+
+    index = SimilarityIndex(ids, vectors, groups=groups)
+    cases = [
+        ("query, all", dict(query=query_vector(query, "all"))),
+        ("query, color", dict(query=query_vector(query, "color"))),
+        ("query, shape", dict(query=query_vector(query, "shape"))),
+        ("query, one category", dict(query=query_vector(query, "all"), group="category_03")),
+        ("query, limit 100", dict(query=query_vector(query, "all"), limit=100)),
+    ]
+    for label, kwargs in cases:
+        t = measure(lambda: index.query(**kwargs), repeat=args.repeat, warmup=2)
+        print(f"  {label:<26}: {t['median_ms']:8.2f} ms  (min {t['min_ms']:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print_header("Reference similarity: brute-force cosine over embeddings")
+
+    rng = np.random.default_rng(0)
+    upload = synthetic_image(rng, size=(1600, 1200))
+    t = measure(lambda: compute_embedding(analysis_array(upload)), repeat=args.repeat)
+    print(f"  {'embed 1600x1200 upload':<26}: {t['median_ms']:8.2f} ms")
+
+    query = compute_embedding(analysis_array(upload))
+    vectors = synthetic_embeddings(max(args.sizes), rng)
+    for n in args.sizes:
+        run_size(n, vectors, query, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+benchmarks/common.py - Shared helpers for the benchmark scripts
+
+Run benchmarks from the backend/ folder, e.g.:
+    python -m benchmarks.bench_preprocess
+"""
+
+import os
+import statistics
+import time
+from typing import Callable, Dict
+
+# config.py refuses to import without an API key; benchmarks never call Gemini
+os.environ.setdefault("GEMINI_API_KEY", "AIzaSy-benchmark-placeholder")
+
+
+def measure(func: Callable[[], object], repeat: int = 5, warmup: int = 1) -> Dict[str, float]:
+    """Run func repeatedly and return min/median wall time in milliseconds"""
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "min_ms": min(timings),
+        "median_ms": statistics.median(timings)
+    }
+
+
+def print_header(title: str) -> None:
+    print("=" * 70)
+    print(title)
+    print("=" * 70)
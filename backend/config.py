@@ -278,6 +278,15 @@ class InpaintingConfig:
     MASK_EROSION_KERNEL = 3
     MASK_DILATION_KERNEL = 5
 
+    # ROI mode: send only the mask's bounding box (+ margin) to Gemini
+    ROI_MODE_DEFAULT = False
+    ROI_MARGIN_RATIO = 0.25      # Context margin, fraction of the box's longest side
+    ROI_MIN_MARGIN = 48          # px
+    ROI_MIN_SIZE = 512           # Minimum crop side (px)
+    ROI_MAX_AREA_RATIO = 0.5     # Larger ROIs fall back to the full image
+    ROI_CONTEXT_DEFAULT = True   # Also send a downscaled whole-scene image
+    ROI_CONTEXT_MAX_SIZE = 768   # Longest side of that context image
+
 # ============== Translation Config ==============
 class TranslationConfig:
     """Translation settings"""
@@ -318,6 +327,80 @@ class PerformanceConfig:
     ENABLE_CACHE = False
     CACHE_TTL = 3600  # 1 hour
 
+# ============== Upload Store Config ==============
+class UploadStoreConfig:
+    """Server-side store of uploaded images, addressed by image handle"""
+    MAX_ENTRIES = int(os.environ.get("UPLOAD_STORE_MAX_ENTRIES", 32))
+    MAX_BYTES = int(os.environ.get("UPLOAD_STORE_MAX_MB", 512)) * 1024 * 1024
+
+# ============== Render History Config ==============
+class HistoryConfig:
+    """Render history storage (core/history_manager.py, core/history_index.py)"""
+    # Rebuild the SQLite index from the JSON sidecars at every startup
+    # (it is always rebuilt when missing or when its schema changes)
+    REINDEX_ON_START = os.environ.get("HISTORY_REINDEX_ON_START", "False").lower() == "true"
+
+    # Background writer (core/history_writer.py)
+    WRITER_QUEUE_SIZE = int(os.environ.get("HISTORY_WRITER_QUEUE_SIZE", 16))
+    WRITER_PUT_TIMEOUT = 2.0          # seconds to wait for a free slot before saving inline
+    WRITER_SHUTDOWN_TIMEOUT = 30.0    # seconds to flush pending saves at exit
+
+    # File offload for /api/history/image and /api/history/thumbnail.
+    # X_ACCEL_PREFIX: nginx internal location aliasing render_history/
+    # (e.g. "/_protected/render_history/", see frontend/nginx.conf).
+    # X_SENDFILE: Apache/lighttpd style X-Sendfile header.
+    X_ACCEL_PREFIX = os.environ.get("HISTORY_X_ACCEL_PREFIX", "")
+    X_SENDFILE = os.environ.get("HISTORY_X_SENDFILE", "False").lower() == "true"
+
+    # Retention (core/history_retention.py), 0 = unlimited. Per-mode
+    # overrides: HISTORY_MAX_COUNT_<MODE>, HISTORY_MAX_AGE_DAYS_<MODE>,
+    # HISTORY_MAX_MB_<MODE> (e.g. HISTORY_MAX_COUNT_OBJECT_SWAP=200)
+    MAX_COUNT = int(os.environ.get("HISTORY_MAX_COUNT", 0))
+    MAX_AGE_DAYS = float(os.environ.get("HISTORY_MAX_AGE_DAYS", 0))
+    MAX_MB = int(os.environ.get("HISTORY_MAX_MB", 0))
+
+    # Background compactor: how often it runs, and after how many days
+    # full-resolution PNGs are transcoded to lossless WebP (0 = never)
+    COMPACT_INTERVAL_SECONDS = int(os.environ.get("HISTORY_COMPACT_INTERVAL", 3600))
+    TRANSCODE_AFTER_DAYS = float(os.environ.get("HISTORY_TRANSCODE_AFTER_DAYS", 0))
+    TRANSCODE_BATCH = 50              # renders transcoded per run
+
+# ============== Reference Library Config ==============
+class ReferenceConfig:
+    """Reference library (references/library.py)"""
+    # Seconds between mtime checks of manifest.json; a changed manifest is
+    # re-indexed and swapped in without a restart (0 = no watcher; use
+    # POST /api/references/reload)
+    RELOAD_INTERVAL_SECONDS = float(os.environ.get("REFERENCES_RELOAD_INTERVAL", 5))
+
+    # /api/references/image: in-process LRU of recently served image and
+    # thumbnail bytes
+    IMAGE_CACHE_MB = int(os.environ.get("REFERENCES_IMAGE_CACHE_MB", 64))
+    IMAGE_CACHE_ENTRIES = 512
+
+    # Renders with "reference_image_id": library images kept decoded,
+    # resized and PNG-encoded, ready to send upstream
+    PAYLOAD_CACHE_MB = int(os.environ.get("REFERENCES_PAYLOAD_CACHE_MB", 256))
+    PAYLOAD_CACHE_ENTRIES = 64
+    PAYLOAD_MAX_SIZE = 2048
+    # Encoded in the background when picked (/api/references/download,
+    # POST /api/references/prewarm). PAYLOAD_PREWARM_TOP > 0 also encodes
+    # the first N results of every list/search: speculative CPU work on
+    # the process that serves renders, so off by default
+    PAYLOAD_PREWARM_TOP = int(os.environ.get("REFERENCES_PAYLOAD_PREWARM_TOP", 0))
+    PAYLOAD_PREWARM_QUEUE = 32
+
+    # Tier-3 (cloud_url) images: downloaded server-side into a disk LRU
+    # (references/remote_cache.py) so they can be served inline and used
+    # as render references. 0 = disabled (the client gets the URL)
+    REMOTE_CACHE_MB = int(os.environ.get("REFERENCES_REMOTE_CACHE_MB", 512))
+    REMOTE_CACHE_DIR = os.environ.get("REFERENCES_REMOTE_CACHE_DIR", "")  # default: references/remote_cache
+    REMOTE_REVALIDATE_SECONDS = int(os.environ.get("REFERENCES_REMOTE_REVALIDATE", 3600))
+    REMOTE_TIMEOUT_SECONDS = 15
+    REMOTE_MAX_IMAGE_MB = 25
+    REMOTE_PREFETCH_WORKERS = 2
+    REMOTE_PREFETCH_MAX = 200         # URLs queued per POST /api/references/prefetch
+
 # ============== PROMPTS ==============
 
 # Analysis System Prompt (Vietnamese)
@@ -838,4 +921,3 @@ if __name__ == "__main__":
     print()
     print("✅ Configuration loaded successfully!")
     print("=" * 60)
-
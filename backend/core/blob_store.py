@@ -0,0 +1,157 @@
+"""
+core/blob_store.py - Content-addressed storage for render history files
+
+Render images and thumbnails are stored once per distinct content under
+render_history/blobs/<2 hex>/<sha256>.<ext>; sidecars reference them by
+key. Re-rendering the same sketch dozens of times stores its source
+thumbnail once; re-saving an identical output stores it once.
+
+Reference counts live in the `blobs` table of the history index DB. A
+blob file is deleted when its last render is deleted (delete/clear/
+retention), and recount() rebuilds the counts from the sidecars.
+"""
+
+import hashlib
+import os
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable
+
+from core.history_index import HistoryIndex
+
+BLOB_DIRNAME = "blobs"
+
+
+def blob_path(base_dir: Path, key: str) -> Path:
+    """Location of a blob under a history directory"""
+    return Path(base_dir) / BLOB_DIRNAME / key[:2] / key
+
+
+class BlobStore:
+    """Hash-named files with reference counts"""
+
+    def __init__(self, root: Path, index: HistoryIndex):
+        self.root = Path(root)
+        self.index = index
+        # put/release must not interleave: a release dropping a blob to 0
+        # refs could otherwise unlink a file a concurrent put just wrote
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def compute_key(data: bytes, ext: str) -> str:
+        return f"{hashlib.sha256(data).hexdigest()}.{ext}"
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def put(self, data: bytes, ext: str) -> str:
+        """Store data (or add a reference to the identical blob). Returns its key."""
+        key = self.compute_key(data, ext)
+        path = self.path(key)
+
+        with self._lock:
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(f"{key}.{threading.get_ident()}.tmp")
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, path)
+
+            with self.index.connection() as conn:
+                conn.execute(
+                    "INSERT INTO blobs (key, size, refs) VALUES (?, ?, 1) "
+                    "ON CONFLICT(key) DO UPDATE SET refs = refs + 1",
+                    (key, len(data))
+                )
+        return key
+
+    def release(self, keys: Iterable[str]) -> int:
+        """Drop one reference per key; unlink blobs nobody uses. Returns bytes freed."""
+        counts = Counter(k for k in keys if k)
+        if not counts:
+            return 0
+
+        with self._lock:
+            with self.index.connection() as conn:
+                conn.executemany(
+                    "UPDATE blobs SET refs = refs - ? WHERE key = ?",
+                    [(n, key) for key, n in counts.items()]
+                )
+                placeholders = ",".join("?" * len(counts))
+                dead = conn.execute(
+                    f"SELECT key, size FROM blobs WHERE refs <= 0 AND key IN ({placeholders})",
+                    list(counts)
+                ).fetchall()
+                conn.executemany("DELETE FROM blobs WHERE key = ?", [(row["key"],) for row in dead])
+
+            freed = 0
+            for row in dead:
+                self.path(row["key"]).unlink(missing_ok=True)
+                freed += row["size"]
+        return freed
+
+    def recount(self, metas: Iterable[Dict]) -> int:
+        """
+        Rebuild reference counts from sidecar metadata and delete blob
+        files no render references. Returns the number of blobs kept.
+
+        Only safe while no save is in flight: save_render() puts its blobs
+        before its sidecar exists, so they would look unreferenced. It runs
+        from index rebuilds at startup (app.py), before the history writer
+        thread exists.
+        """
+        # The writer thread (core/history_writer.py) is the only code path that saves
+        assert not any(t.name == "history-writer" for t in threading.enumerate()), \
+            "BlobStore.recount() must run before the history writer starts"
+        counts = Counter(
+            key for meta in metas for key in (meta.get("blobs") or {}).values() if key
+        )
+
+        # One pass under the lock: no put/release interleaves with it
+        with self._lock:
+            rows = []
+            for key, refs in counts.items():
+                path = self.path(key)
+                if path.is_file():
+                    rows.append((key, path.stat().st_size, refs))
+
+            with self.index.connection() as conn:
+                conn.execute("DELETE FROM blobs")
+                conn.executemany("INSERT INTO blobs (key, size, refs) VALUES (?, ?, ?)", rows)
+
+            # Orphans: files left behind by a crash or by deleted sidecars
+            if self.root.is_dir():
+                for subdir in os.scandir(self.root):
+                    if not subdir.is_dir():
+                        continue
+                    for entry in os.scandir(subdir.path):
+                        if entry.name not in counts:
+                            os.unlink(entry.path)
+        return len(rows)
+
+    def get_stats(self) -> Dict:
+        # Single row kept up to date by triggers on the blobs table
+        row = self.index.connection().execute(
+            "SELECT blobs, stored, referenced FROM blob_stats"
+        ).fetchone()
+        return {
+            "blobs": row["blobs"],
+            "bytes_stored": row["stored"],
+            "bytes_referenced": row["referenced"],
+            "bytes_saved": row["referenced"] - row["stored"]
+        }
+
+
+# One store per history directory (shares its lock between managers)
+_stores: Dict[Path, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_blob_store(base_dir: Path, index: HistoryIndex) -> BlobStore:
+    root = Path(base_dir) / BLOB_DIRNAME
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = BlobStore(root, index)
+            _stores[root] = store
+        return store
@@ -0,0 +1,107 @@
+"""
+core/byte_lru.py - Thread-safe LRU bounded by entry count AND byte budget
+
+Shared building block for in-process caches that hold images or encoded
+bytes, where entry count alone says nothing about memory use.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class ByteBudgetLRU:
+    """
+    LRU cache evicting least recently used entries when either
+    max_entries or max_bytes is exceeded.
+
+    The caller supplies each entry's size; sizes can be re-reported
+    later with resize() when a cached object grows.
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value (marking it recently used) or None"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any, nbytes: int) -> None:
+        """Insert or replace an entry, then evict down to the budget"""
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._sizes[key]
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = nbytes
+            self._total_bytes += nbytes
+            self._evict_locked()
+
+    def resize(self, key: Hashable, nbytes: int) -> None:
+        """Update the recorded size of an existing entry"""
+        with self._lock:
+            if key not in self._entries:
+                return
+            self._total_bytes += nbytes - self._sizes[key]
+            self._sizes[key] = nbytes
+            self._evict_locked()
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._total_bytes -= self._sizes.pop(key)
+            return self._entries.pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict_locked(self) -> None:
+        # Always keep the newest entry, even if it alone exceeds the budget
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+        ):
+            oldest_key, _ = self._entries.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(oldest_key)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict:
+        total_requests = self.hits + self.misses
+        hit_rate = (self.hits / total_requests * 100) if total_requests > 0 else 0
+
+        return {
+            'size': len(self._entries),
+            'maxsize': self.max_entries,
+            'bytes': self._total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': f"{hit_rate:.1f}%"
+        }
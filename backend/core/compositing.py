@@ -0,0 +1,170 @@
+"""
+core/compositing.py - Mask compositing shared by the inpainting engines
+
+- ROI helpers: for small edits (a sofa in one corner of a 2K scene) only
+  the mask's bounding box plus a context margin goes to Gemini, and the
+  result is composited back into the full-resolution original.
+- Blending kernels: soft (feathered) and hard preservation of the
+  non-masked area, in uint8/float32 and restricted to the area the mask
+  can actually affect.
+"""
+
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import InpaintingConfig
+
+# (x0, y0, x1, y1), end-exclusive
+ROI = Tuple[int, int, int, int]
+
+
+def mask_roi(
+    mask: np.ndarray,
+    margin_ratio: float = InpaintingConfig.ROI_MARGIN_RATIO,
+    min_margin: int = InpaintingConfig.ROI_MIN_MARGIN,
+    min_size: int = InpaintingConfig.ROI_MIN_SIZE,
+    max_area_ratio: float = InpaintingConfig.ROI_MAX_AREA_RATIO
+) -> Optional[ROI]:
+    """
+    Bounding box of the edit area (mask > 127) grown by a context margin.
+
+    Args:
+        mask: Grayscale mask (255=edit, 0=preserve)
+        margin_ratio: Margin as a fraction of the box's longest side
+        min_margin: Lower bound for the margin in pixels
+        min_size: Minimum crop side, so Gemini still sees enough of the scene
+        max_area_ratio: Above this fraction of the image, cropping saves
+                        too little and the full image is used instead
+
+    Returns:
+        ROI, or None if the mask is empty or the ROI is not worth it
+    """
+    _, mask_binary = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+    x, y, w, h = cv2.boundingRect(mask_binary)
+    if w == 0 or h == 0:
+        return None
+
+    img_h, img_w = mask.shape[:2]
+    margin = max(min_margin, int(max(w, h) * margin_ratio))
+
+    x0, y0 = x - margin, y - margin
+    x1, y1 = x + w + margin, y + h + margin
+
+    # Grow small boxes around their center up to min_size
+    x0, x1 = _grow_span(x0, x1, min(min_size, img_w), img_w)
+    y0, y1 = _grow_span(y0, y1, min(min_size, img_h), img_h)
+
+    if (x1 - x0) * (y1 - y0) > max_area_ratio * img_w * img_h:
+        return None
+    return x0, y0, x1, y1
+
+
+def _grow_span(start: int, end: int, min_len: int, limit: int) -> Tuple[int, int]:
+    """Widen [start, end) to at least min_len, then shift it inside [0, limit)"""
+    missing = min_len - (end - start)
+    if missing > 0:
+        start -= missing // 2
+        end += missing - missing // 2
+    if start < 0:
+        end, start = end - start, 0
+    if end > limit:
+        start, end = max(0, start - (end - limit)), limit
+    return start, end
+
+
+def crop(array: np.ndarray, roi: ROI) -> np.ndarray:
+    """View of array inside roi"""
+    x0, y0, x1, y1 = roi
+    return array[y0:y1, x0:x1]
+
+
+def paste(base: np.ndarray, patch: np.ndarray, roi: ROI) -> np.ndarray:
+    """Copy of base with patch written into roi"""
+    x0, y0, x1, y1 = roi
+    result = base.copy()
+    result[y0:y1, x0:x1] = patch
+    return result
+
+
+def fit_to(image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """Resize a generated image to the size it has to replace"""
+    if image.size == size:
+        return image
+    return image.resize(size, Image.LANCZOS)
+
+
+def context_thumbnail(
+    image: np.ndarray,
+    max_size: int = InpaintingConfig.ROI_CONTEXT_MAX_SIZE
+) -> Image.Image:
+    """Downscaled whole scene sent next to an ROI crop for global context"""
+    h, w = image.shape[:2]
+    scale = min(1.0, max_size / max(h, w))
+    if scale < 1.0:
+        image = cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return Image.fromarray(image)
+
+
+def soft_blend(
+    original: np.ndarray,
+    edited: np.ndarray,
+    mask: np.ndarray,
+    dilate_size: int = 11,
+    blur_size: int = 21
+) -> np.ndarray:
+    """
+    original * (1 - a) + edited * a, where a is the mask dilated by
+    dilate_size and feathered with a blur_size Gaussian.
+
+    Pixels the feathered mask cannot reach are copied from original
+    untouched; only that bounding box gets a float32 alpha, and the blend
+    itself runs in one cv2.blendLinear pass on uint8 data.
+
+    Args:
+        original: HxWx3 uint8
+        edited: HxWx3 uint8, same size
+        mask: HxW grayscale (255=edit, 0=preserve)
+    """
+    _, mask_binary = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+    kernel = np.ones((dilate_size, dilate_size), np.uint8)
+    mask_dilated = cv2.dilate(mask_binary, kernel, iterations=1)
+
+    result = original.copy()
+    x, y, w, h = cv2.boundingRect(mask_dilated)
+    if w == 0 or h == 0:
+        return result
+
+    # The blur spreads the mask by blur_size // 2 pixels; twice that keeps
+    # the blur's border reflection inside the all-zero margin, so the crop
+    # gives exactly the full-frame alpha
+    img_h, img_w = mask.shape[:2]
+    pad = 2 * (blur_size // 2)
+    x0, y0 = max(0, x - pad), max(0, y - pad)
+    x1, y1 = min(img_w, x + w + pad), min(img_h, y + h + pad)
+
+    alpha = mask_dilated[y0:y1, x0:x1].astype(np.float32)
+    alpha *= 1.0 / 255.0
+    cv2.GaussianBlur(alpha, (blur_size, blur_size), 0, dst=alpha)
+    inverse = 1.0 - alpha
+
+    result[y0:y1, x0:x1] = cv2.blendLinear(
+        np.ascontiguousarray(edited[y0:y1, x0:x1]),
+        np.ascontiguousarray(original[y0:y1, x0:x1]),
+        alpha,
+        inverse
+    )
+    return result
+
+
+def hard_blend(original: np.ndarray, edited: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Edited pixels where mask > 127, original everywhere else.
+    The 2D mask drives a masked copy directly instead of a 3D float mask.
+    """
+    _, mask_binary = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+    result = original.copy()
+    cv2.copyTo(np.ascontiguousarray(edited), mask_binary, result)
+    return result
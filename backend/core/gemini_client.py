@@ -29,6 +29,18 @@ except ImportError:
 
 # Assumes config.py exists with these variables
 from config import GEMINI_API_KEY, Models, Defaults
+from core.image_processor import decode_png_aware, encode_png
+
+# Input images may be PIL Images or PNG bytes that were already encoded
+# (e.g. memoized per upload handle), which are sent as-is.
+ImageInput = Union[Image.Image, bytes]
+
+
+def _to_png_bytes(image: ImageInput) -> bytes:
+    """PNG bytes for an input image, encoding only if needed"""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    return encode_png(image)
 
 
 class GeminiClient:
@@ -129,8 +141,8 @@ class GeminiClient:
     def generate_image(
         self,
         prompt: str,
-        source_image: Optional[Image.Image] = None,
-        reference_image: Optional[Image.Image] = None,
+        source_image: Optional[ImageInput] = None,
+        reference_image: Optional[ImageInput] = None,
         model_name: str = Models.FLASH_IMAGE,
         temperature: float = Defaults.TEMPERATURE_GENERATION
     ) -> Image.Image:
@@ -150,14 +162,10 @@ class GeminiClient:
             parts = []
             
             if source_image:
-                img_byte_arr = io.BytesIO()
-                source_image.save(img_byte_arr, format='PNG')
-                parts.append(types_new.Part.from_bytes(data=img_byte_arr.getvalue(), mime_type="image/png"))
+                parts.append(types_new.Part.from_bytes(data=_to_png_bytes(source_image), mime_type="image/png"))
             
             if reference_image:
-                img_byte_arr = io.BytesIO()
-                reference_image.save(img_byte_arr, format='PNG')
-                parts.append(types_new.Part.from_bytes(data=img_byte_arr.getvalue(), mime_type="image/png"))
+                parts.append(types_new.Part.from_bytes(data=_to_png_bytes(reference_image), mime_type="image/png"))
             
             parts.append(types_new.Part.from_text(text=prompt))
             contents = [types_new.Content(role="user", parts=parts)]
@@ -186,7 +194,7 @@ class GeminiClient:
                                 text_metadata.append(part.text)
                             if part.inline_data and part.inline_data.data:
                                 print(f"   ✅ Image received (SDK)!")
-                                return Image.open(io.BytesIO(part.inline_data.data))
+                                return decode_png_aware(part.inline_data.data)
 
             raise RuntimeError("Gemini API returned no image.")
 
@@ -206,8 +214,8 @@ class GeminiClient:
     def _generate_image_raw_rest(
         self,
         prompt: str,
-        source_image: Optional[Image.Image],
-        reference_image: Optional[Image.Image],
+        source_image: Optional[ImageInput],
+        reference_image: Optional[ImageInput],
         model_name: str,
         temperature: float
     ) -> Image.Image:
@@ -222,9 +230,7 @@ class GeminiClient:
         
         # Helper to convert image to base64 part
         def img_to_part(img):
-            buf = io.BytesIO()
-            img.save(buf, format='PNG')
-            b64_data = io.BytesIO(buf.getvalue()).read()
+            b64_data = _to_png_bytes(img)
             # Standard base64 encoding for JSON payload
             import base64
             return {
@@ -285,7 +291,7 @@ class GeminiClient:
                     import base64
                     img_data = base64.b64decode(b64_resp)
                     print(f"   ✅ Image received (Raw REST Fallback) - 2K Success!")
-                    return Image.open(io.BytesIO(img_data))
+                    return decode_png_aware(img_data)
                 
                 if 'text' in part:
                     print(f"   📝 Metadata: {part['text'][:50]}...")
@@ -313,7 +319,7 @@ class GeminiClient:
 
         Args:
             prompt: Text prompt
-            images: List of PIL Image objects (e.g., [scene, mask, new_object])
+            images: List of PIL Images or PNG bytes (e.g., [scene, mask, new_object])
             model_name: Gemini model name
             temperature: Generation temperature
 
@@ -329,9 +335,7 @@ class GeminiClient:
 
             for img in images:
                 if img is not None:
-                    buf = io.BytesIO()
-                    img.save(buf, format='PNG')
-                    parts.append(types_new.Part.from_bytes(data=buf.getvalue(), mime_type="image/png"))
+                    parts.append(types_new.Part.from_bytes(data=_to_png_bytes(img), mime_type="image/png"))
 
             parts.append(types_new.Part.from_text(text=prompt))
             contents = [types_new.Content(role="user", parts=parts)]
@@ -354,7 +358,7 @@ class GeminiClient:
                         for part in candidate.content.parts:
                             if part.inline_data and part.inline_data.data:
                                 print(f"   ✅ Image received (multi-image SDK)!")
-                                return Image.open(io.BytesIO(part.inline_data.data))
+                                return decode_png_aware(part.inline_data.data)
 
             raise RuntimeError("Gemini API returned no image.")
 
@@ -382,12 +386,10 @@ class GeminiClient:
         parts = []
         for img in images:
             if img is not None:
-                buf = io.BytesIO()
-                img.save(buf, format='PNG')
                 parts.append({
                     "inlineData": {
                         "mimeType": "image/png",
-                        "data": b64lib.b64encode(buf.getvalue()).decode('utf-8')
+                        "data": b64lib.b64encode(_to_png_bytes(img)).decode('utf-8')
                     }
                 })
         parts.append({"text": prompt})
@@ -416,7 +418,7 @@ class GeminiClient:
                     import base64 as b64lib2
                     img_data = b64lib2.b64decode(part['inlineData']['data'])
                     print(f"   ✅ Image received (multi-image Raw REST)!")
-                    return Image.open(io.BytesIO(img_data))
+                    return decode_png_aware(img_data)
 
             raise RuntimeError("Raw REST returned no image.")
         except urllib.error.HTTPError as e:
@@ -427,11 +429,30 @@ class GeminiClient:
         original: Image.Image,
         mask: Image.Image,
         prompt: str,
-        reference: Optional[Image.Image] = None
+        reference: Optional[Image.Image] = None,
+        context: Optional[ImageInput] = None
     ) -> Optional[Image.Image]:
         """
         Simulate inpainting using Multimodal Prompting.
+
+        If context is given (ROI mode), Input 1/2 are a crop of the scene and
+        Input 3 is the whole scene downscaled, for lighting/style only.
         """
+        if context is not None:
+            inpaint_prompt = f"""
+        TASK: IMAGE EDITING / INPAINTING (CROPPED REGION)
+        - Input 1: Original Image (a crop of the full scene)
+        - Input 2: Mask (White = Edit, Black = Keep)
+        - Input 3: Full scene, downscaled - context only, do NOT return it
+        - Instruction: {prompt}
+        - Return ONLY the edited Input 1, with exactly its framing.
+        """
+            return self.generate_image_multi(
+                prompt=inpaint_prompt,
+                images=[original, mask, context],
+                model_name=Models.FLASH_IMAGE
+            )
+
         inpaint_prompt = f"""
         TASK: IMAGE EDITING / INPAINTING
         - Input 1: Original Image
@@ -0,0 +1,609 @@
+"""
+core/history_index.py - SQLite metadata index for render history
+
+The JSON sidecars next to each PNG stay the source of truth; this index
+holds the list-view metadata of every render so that listing a page is an
+indexed query instead of reading every sidecar on disk.
+
+File: render_history/history_index.db (rebuilt from the sidecars when
+missing or when SCHEMA_VERSION changes). It also holds the reference
+counts of core/blob_store.py, and per-mode render/byte totals kept by
+triggers (mode_stats) and cached in memory, so stats are O(1).
+
+Search: renders_fts is an FTS5 index over search_text (prompt summary +
+settings values, folded with utils.text.fold_diacritics so "phong khach"
+matches "Phòng khách"), kept in sync by triggers. The settings used for
+filtering/facets are copied into indexed columns (SETTINGS_FACETS).
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.text import fold_diacritics, tokenize
+
+SCHEMA_VERSION = 6
+INDEX_FILENAME = "history_index.db"
+
+# Fields dropped from the list-view copy of the metadata (heavy, detail only)
+DETAIL_ONLY_FIELDS = ("thumbnail_b64", "source_thumbnail_b64")
+
+# settings keys copied into their own indexed column (filters + facet counts)
+SETTINGS_FACETS = ("aspect_ratio", "viewpoint", "style", "preserve_mode", "camera_angle", "time_of_day")
+FACET_FIELDS = ("mode",) + SETTINGS_FACETS
+
+RENDER_COLUMNS = ("id", "mode", "timestamp", "stem", "bytes", "meta", "search_text") + SETTINGS_FACETS
+_INSERT_RENDER = (
+    f"INSERT OR REPLACE INTO renders ({', '.join(RENDER_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(RENDER_COLUMNS))})"
+)
+
+# rebuild() hook: (sidecar metadata, mode dir, stem) -> metadata to index
+SidecarUpgrade = Callable[[Dict, Path, str], Dict]
+
+# Called with the index after a rebuild (e.g. to recount blob references)
+RebuildHook = Callable[["HistoryIndex"], None]
+
+
+class HistoryIndex:
+    """Indexed store of render metadata, one row per render."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+
+        # In-memory copy of mode_stats; the generation counter keeps a
+        # reload that raced with a write from caching stale totals
+        self._usage_cache: Optional[Dict[str, Dict]] = None
+        self._usage_generation = 0
+        self._usage_lock = threading.Lock()
+
+        self.needs_rebuild = self._init_schema()
+
+    # ------------------------------------------------------------------ #
+    # Connection / schema
+    # ------------------------------------------------------------------ #
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not shareable)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # INSERT OR REPLACE must fire the delete trigger of the old row
+            conn.execute("PRAGMA recursive_triggers=ON")
+            self._local.conn = conn
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """This thread's connection, for stores sharing the index DB."""
+        return self._connect()
+
+    def _init_schema(self) -> bool:
+        """Create tables; returns True if the index is new or outdated."""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return False
+
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS renders_fts")
+            conn.execute("DROP TABLE IF EXISTS renders")
+            conn.execute("DROP TABLE IF EXISTS blobs")
+            conn.execute("DROP TABLE IF EXISTS mode_stats")
+            conn.execute("DROP TABLE IF EXISTS blob_stats")
+            conn.execute("DROP TABLE IF EXISTS facet_stats")
+            conn.execute("""
+                CREATE TABLE renders (
+                    id TEXT PRIMARY KEY,
+                    mode TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    stem TEXT NOT NULL,
+                    bytes INTEGER NOT NULL DEFAULT 0,
+                    meta TEXT NOT NULL,
+                    search_text TEXT NOT NULL DEFAULT '',
+                    {facet_columns}
+                )
+            """.format(facet_columns=",\n".join(f"{name} TEXT NOT NULL DEFAULT ''" for name in SETTINGS_FACETS)))
+            conn.execute("CREATE INDEX idx_renders_time ON renders (timestamp DESC, id DESC)")
+            conn.execute("CREATE INDEX idx_renders_mode_time ON renders (mode, timestamp DESC, id DESC)")
+            for name in SETTINGS_FACETS:
+                conn.execute(f"CREATE INDEX idx_renders_{name} ON renders ({name}, timestamp DESC)")
+
+            # External-content FTS5 table: the text lives in renders.search_text,
+            # the FTS table only holds the inverted index (keyed by rowid)
+            conn.execute("""
+                CREATE VIRTUAL TABLE renders_fts USING fts5(
+                    search_text, content='renders', content_rowid='rowid', prefix='2 3'
+                )
+            """)
+            conn.execute("""
+                CREATE TRIGGER renders_fts_insert AFTER INSERT ON renders BEGIN
+                    INSERT INTO renders_fts (rowid, search_text) VALUES (NEW.rowid, NEW.search_text);
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER renders_fts_delete AFTER DELETE ON renders BEGIN
+                    INSERT INTO renders_fts (renders_fts, rowid, search_text)
+                    VALUES ('delete', OLD.rowid, OLD.search_text);
+                END
+            """)
+
+            # Render count per combination of facet values (a few dozen rows):
+            # unfiltered facet counts without scanning renders
+            facet_columns = ", ".join(FACET_FIELDS)
+            conn.execute(f"""
+                CREATE TABLE facet_stats (
+                    {", ".join(f"{name} TEXT NOT NULL" for name in FACET_FIELDS)},
+                    renders INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY ({facet_columns})
+                )
+            """)
+            conn.execute(f"""
+                CREATE TRIGGER renders_facets_insert AFTER INSERT ON renders BEGIN
+                    INSERT INTO facet_stats ({facet_columns}, renders)
+                    VALUES ({", ".join(f"NEW.{name}" for name in FACET_FIELDS)}, 1)
+                    ON CONFLICT({facet_columns}) DO UPDATE SET renders = renders + 1;
+                END
+            """)
+            conn.execute(f"""
+                CREATE TRIGGER renders_facets_delete AFTER DELETE ON renders BEGIN
+                    UPDATE facet_stats SET renders = renders - 1
+                    WHERE {" AND ".join(f"{name} = OLD.{name}" for name in FACET_FIELDS)};
+                END
+            """)
+            conn.execute("""
+                CREATE TABLE blobs (
+                    key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    refs INTEGER NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE mode_stats (
+                    mode TEXT PRIMARY KEY,
+                    renders INTEGER NOT NULL DEFAULT 0,
+                    bytes INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TRIGGER renders_stats_insert AFTER INSERT ON renders BEGIN
+                    INSERT INTO mode_stats (mode, renders, bytes) VALUES (NEW.mode, 1, NEW.bytes)
+                    ON CONFLICT(mode) DO UPDATE SET renders = renders + 1, bytes = bytes + NEW.bytes;
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER renders_stats_delete AFTER DELETE ON renders BEGIN
+                    UPDATE mode_stats SET renders = renders - 1, bytes = bytes - OLD.bytes
+                    WHERE mode = OLD.mode;
+                END
+            """)
+            conn.execute("""
+                CREATE TABLE blob_stats (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    blobs INTEGER NOT NULL,
+                    stored INTEGER NOT NULL,
+                    referenced INTEGER NOT NULL
+                )
+            """)
+            conn.execute("INSERT INTO blob_stats VALUES (0, 0, 0, 0)")
+            conn.execute("""
+                CREATE TRIGGER blobs_stats_insert AFTER INSERT ON blobs BEGIN
+                    UPDATE blob_stats SET blobs = blobs + 1, stored = stored + NEW.size,
+                        referenced = referenced + NEW.size * NEW.refs;
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER blobs_stats_update AFTER UPDATE OF refs ON blobs BEGIN
+                    UPDATE blob_stats SET referenced = referenced + NEW.size * (NEW.refs - OLD.refs);
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER blobs_stats_delete AFTER DELETE ON blobs BEGIN
+                    UPDATE blob_stats SET blobs = blobs - 1, stored = stored - OLD.size,
+                        referenced = referenced - OLD.size * OLD.refs;
+                END
+            """)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return True
+
+    # ------------------------------------------------------------------ #
+    # Writes
+    # ------------------------------------------------------------------ #
+
+    @staticmethod
+    def _search_text(metadata: Dict) -> str:
+        """Folded text the FTS index sees: prompt summary + settings values"""
+        settings = metadata.get("settings") or {}
+        parts = [metadata.get("prompt_summary", ""), metadata.get("mode", "")]
+        parts.extend(str(v) for v in settings.values() if isinstance(v, (str, int, float)) and not isinstance(v, bool))
+        return fold_diacritics(" ".join(p for p in parts if p))
+
+    @staticmethod
+    def _facet_value(value) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return str(value)
+
+    @classmethod
+    def _row(cls, metadata: Dict, stem: str) -> Tuple:
+        """Values for RENDER_COLUMNS"""
+        meta = {k: v for k, v in metadata.items() if k not in DETAIL_ONLY_FIELDS}
+        settings = metadata.get("settings") or {}
+        return (
+            metadata["id"],
+            metadata["mode"],
+            metadata.get("timestamp", ""),
+            stem,
+            metadata.get("bytes", 0),
+            json.dumps(meta, ensure_ascii=False),
+            cls._search_text(metadata),
+            *(cls._facet_value(settings.get(name)) for name in SETTINGS_FACETS)
+        )
+
+    def _invalidate_usage(self) -> None:
+        with self._usage_lock:
+            self._usage_generation += 1
+            self._usage_cache = None
+
+    def add(self, metadata: Dict, stem: str) -> None:
+        """Insert or replace one render (metadata = sidecar contents)."""
+        with self._connect() as conn:
+            conn.execute(_INSERT_RENDER, self._row(metadata, stem))
+        self._invalidate_usage()
+
+    def add_many(self, entries: Iterable[Tuple[Dict, str]]) -> None:
+        with self._connect() as conn:
+            conn.executemany(_INSERT_RENDER, (self._row(meta, stem) for meta, stem in entries))
+        self._invalidate_usage()
+
+    def remove(self, render_id: str) -> bool:
+        with self._connect() as conn:
+            cur = conn.execute("DELETE FROM renders WHERE id = ?", (render_id,))
+        self._invalidate_usage()
+        return cur.rowcount > 0
+
+    def remove_many(self, render_ids: List[str]) -> int:
+        with self._connect() as conn:
+            cur = conn.executemany("DELETE FROM renders WHERE id = ?", [(i,) for i in render_ids])
+        self._invalidate_usage()
+        return cur.rowcount
+
+    def remove_mode(self, mode: str) -> int:
+        with self._connect() as conn:
+            cur = conn.execute("DELETE FROM renders WHERE mode = ?", (mode,))
+        self._invalidate_usage()
+        return cur.rowcount
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM renders")
+            conn.execute("DELETE FROM mode_stats")
+            conn.execute("DELETE FROM facet_stats")
+        self._invalidate_usage()
+
+    # ------------------------------------------------------------------ #
+    # Reads
+    # ------------------------------------------------------------------ #
+
+    def count(self, mode: Optional[str] = None) -> int:
+        usage = self.usage()
+        if mode:
+            return usage.get(mode, {}).get("renders", 0)
+        return sum(u["renders"] for u in usage.values())
+
+    def page(
+        self,
+        mode: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+        cursor: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Newest-first page of list-view metadata.
+
+        With a cursor (from make_cursor() of the last item of the previous
+        page) this is keyset pagination: cost depends on the page size only,
+        not on how deep the page is. Without one, offset is used.
+        """
+        where, params = [], []
+        if mode:
+            where.append("mode = ?")
+            params.append(mode)
+        if cursor:
+            timestamp, _, render_id = cursor.rpartition("|")
+            where.append("(timestamp, id) < (?, ?)")
+            params.extend([timestamp, render_id])
+            offset = 0
+
+        sql = "SELECT meta FROM renders"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+
+        rows = self._connect().execute(sql, params).fetchall()
+        return [json.loads(row["meta"]) for row in rows]
+
+    @staticmethod
+    def _match_expression(query: str) -> Optional[str]:
+        """FTS5 MATCH for a free-text query: every folded word, as a prefix"""
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        return " ".join(f'"{token}"*' for token in tokens)
+
+    def _collect_hits(self, conn: sqlite3.Connection, match: str) -> int:
+        """
+        Run the FTS query once into this connection's temp table, so the
+        facet and page queries join a rowid set instead of re-running it.
+        """
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS search_hits (rowid INTEGER PRIMARY KEY)")
+        with conn:
+            conn.execute("DELETE FROM temp.search_hits")
+            conn.execute("INSERT INTO temp.search_hits "
+                         "SELECT rowid FROM renders_fts WHERE renders_fts MATCH ?", (match,))
+        return conn.execute("SELECT COUNT(*) FROM temp.search_hits").fetchone()[0]
+
+    def _facet_combinations(
+        self,
+        conn: sqlite3.Connection,
+        with_hits: bool,
+        date_from: Optional[str],
+        date_to: Optional[str]
+    ) -> List[Tuple]:
+        """(facet values..., renders) per combination, before facet filters"""
+        columns = ", ".join(FACET_FIELDS)
+        if not (with_hits or date_from or date_to):
+            return conn.execute(
+                f"SELECT {columns}, renders FROM facet_stats WHERE renders > 0").fetchall()
+
+        where, params = [], []
+        if with_hits:
+            where.append("rowid IN temp.search_hits")
+        if date_from:
+            where.append("timestamp >= ?")
+            params.append(date_from)
+        if date_to:
+            where.append("timestamp < ?")
+            params.append(date_to)
+        return conn.execute(
+            f"SELECT {columns}, COUNT(*) FROM renders WHERE {' AND '.join(where)} GROUP BY {columns}",
+            params
+        ).fetchall()
+
+    def search(
+        self,
+        query: str = "",
+        filters: Optional[Dict[str, str]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+        cursor: Optional[str] = None
+    ) -> Dict:
+        """
+        Newest-first renders matching a free-text query (prompt summary and
+        settings, diacritics-insensitive, prefix match on every word) and
+        exact facet filters ({field: value}, fields from FACET_FIELDS),
+        within [date_from, date_to) (ISO timestamps).
+
+        Returns {"items", "total", "facets"}. Each facet's counts apply
+        every filter except its own, so the UI can offer the alternatives
+        to a selected value. Counts are rolled up from per-combination
+        totals (facet_stats, or one GROUP BY over the text/date matches).
+        """
+        filters = {k: str(v) for k, v in (filters or {}).items() if v not in (None, "")}
+        unknown = set(filters) - set(FACET_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown filter(s): {', '.join(sorted(unknown))}")
+
+        conn = self._connect()
+        match = self._match_expression(query)
+        hits = self._collect_hits(conn, match) if match else None
+
+        # Total and facet counts
+        total = 0
+        facets: Dict[str, Dict[str, int]] = {name: {} for name in FACET_FIELDS}
+        if hits != 0:
+            for row in self._facet_combinations(conn, match is not None, date_from, date_to):
+                values, n = row[:-1], row[-1]
+                failed = [name for name, value in zip(FACET_FIELDS, values)
+                          if name in filters and filters[name] != value]
+                if not failed:
+                    total += n
+                for name, value in zip(FACET_FIELDS, values):
+                    if value and (not failed or failed == [name]):
+                        facets[name][value] = facets[name].get(value, 0) + n
+        facets = {
+            name: dict(sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])))
+            for name, counts in facets.items()
+        }
+
+        # Page
+        items = []
+        if total:
+            where, params = [], []
+            if match:
+                # Many hits: walk the time index and probe the hit set (stops
+                # after one page). Few hits: look them up and sort them.
+                walk = hits * hits > (offset + limit) * max(self.count(), 1)
+                where.append(("+rowid" if walk else "rowid") + " IN temp.search_hits")
+            for name, value in filters.items():
+                where.append(f"{name} = ?")
+                params.append(value)
+            if date_from:
+                where.append("timestamp >= ?")
+                params.append(date_from)
+            if date_to:
+                where.append("timestamp < ?")
+                params.append(date_to)
+            if cursor:
+                timestamp, _, render_id = cursor.rpartition("|")
+                where.append("(timestamp, id) < (?, ?)")
+                params.extend([timestamp, render_id])
+                offset = 0
+
+            sql = "SELECT meta FROM renders"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += " ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?"
+            rows = conn.execute(sql, params + [limit, offset]).fetchall()
+            items = [json.loads(row["meta"]) for row in rows]
+
+        return {"items": items, "total": total, "facets": facets}
+
+    def usage(self) -> Dict[str, Dict]:
+        """
+        {mode: {"renders", "bytes"}} (bytes = each render's own files).
+        Served from memory; reloaded from the trigger-maintained
+        mode_stats table (a handful of rows) after a write.
+        """
+        with self._usage_lock:
+            if self._usage_cache is not None:
+                return {mode: dict(u) for mode, u in self._usage_cache.items()}
+            generation = self._usage_generation
+
+        rows = self._connect().execute("SELECT mode, renders, bytes FROM mode_stats WHERE renders > 0")
+        usage = {row["mode"]: {"renders": row["renders"], "bytes": row["bytes"]} for row in rows}
+
+        with self._usage_lock:
+            if generation == self._usage_generation:
+                self._usage_cache = usage
+        return {mode: dict(u) for mode, u in usage.items()}
+
+    def ids_over_limits(
+        self,
+        mode: str,
+        max_count: Optional[int] = None,
+        before: Optional[str] = None,
+        max_bytes: Optional[int] = None
+    ) -> List[str]:
+        """
+        IDs of renders of a mode outside its retention limits: older than
+        `before` (ISO timestamp), beyond the newest max_count, or past
+        max_bytes counting from the newest render.
+        """
+        conn = self._connect()
+        ids = set()
+        if before:
+            rows = conn.execute(
+                "SELECT id FROM renders WHERE mode = ? AND timestamp < ?", (mode, before))
+            ids.update(row["id"] for row in rows)
+        if max_count:
+            rows = conn.execute(
+                "SELECT id FROM renders WHERE mode = ? "
+                "ORDER BY timestamp DESC, id DESC LIMIT -1 OFFSET ?", (mode, max_count))
+            ids.update(row["id"] for row in rows)
+        if max_bytes:
+            rows = conn.execute("""
+                SELECT id FROM (
+                    SELECT id, SUM(bytes) OVER (ORDER BY timestamp DESC, id DESC) AS running
+                    FROM renders WHERE mode = ?
+                ) WHERE running > ?
+            """, (mode, max_bytes))
+            ids.update(row["id"] for row in rows)
+        return sorted(ids)
+
+    def ids_with_image_ext(self, ext: str, before: str, limit: int) -> List[str]:
+        """Oldest renders (before an ISO timestamp) whose image blob has ext."""
+        rows = self._connect().execute(
+            "SELECT id FROM renders WHERE timestamp < ? "
+            "AND json_extract(meta, '$.blobs.image') LIKE ? "
+            "ORDER BY timestamp LIMIT ?", (before, f"%.{ext}", limit))
+        return [row["id"] for row in rows]
+
+    def metas(self, mode: Optional[str] = None) -> Iterable[Dict]:
+        """Indexed metadata of every render (of one mode)."""
+        conn = self._connect()
+        if mode:
+            rows = conn.execute("SELECT meta FROM renders WHERE mode = ?", (mode,))
+        else:
+            rows = conn.execute("SELECT meta FROM renders")
+        for row in rows:
+            yield json.loads(row["meta"])
+
+    def get(self, render_id: str) -> Optional[Dict]:
+        """{"mode", "stem", "meta"} of one render, or None."""
+        row = self._connect().execute(
+            "SELECT mode, stem, meta FROM renders WHERE id = ?", (render_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"mode": row["mode"], "stem": row["stem"], "meta": json.loads(row["meta"])}
+
+    @staticmethod
+    def make_cursor(item: Dict) -> str:
+        return f"{item.get('timestamp', '')}|{item['id']}"
+
+    # ------------------------------------------------------------------ #
+    # Rebuild
+    # ------------------------------------------------------------------ #
+
+    def rebuild(
+        self,
+        base_dir: Path,
+        modes: List[str],
+        upgrade: Optional[SidecarUpgrade] = None
+    ) -> int:
+        """
+        Re-index every JSON sidecar under base_dir/<mode>/. Returns count.
+        upgrade, if given, migrates each sidecar's metadata first.
+        """
+        entries = []
+        for mode in modes:
+            mode_dir = base_dir / mode
+            if not mode_dir.exists():
+                continue
+            for json_file in list(mode_dir.glob("*.json")):
+                try:
+                    with open(json_file, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                    meta["mode"] = mode  # the directory is authoritative
+                    if upgrade is not None:
+                        meta = upgrade(meta, mode_dir, json_file.stem)
+                    entries.append((meta, json_file.stem))
+                except Exception:
+                    pass
+
+        with self._connect() as conn:
+            conn.execute("DELETE FROM renders")
+            conn.execute("DELETE FROM mode_stats")
+            conn.execute("DELETE FROM facet_stats")
+            conn.executemany(_INSERT_RENDER, (self._row(meta, stem) for meta, stem in entries))
+        self._invalidate_usage()
+        self.needs_rebuild = False
+        return len(entries)
+
+
+# One index per history directory, shared by every HistoryManager
+_indexes: Dict[Path, HistoryIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_history_index(
+    base_dir: Path,
+    modes: List[str],
+    upgrade: Optional[SidecarUpgrade] = None,
+    on_rebuild: Optional[RebuildHook] = None
+) -> HistoryIndex:
+    """Get (and on first use migrate/rebuild) the index for base_dir."""
+    base_dir = Path(base_dir)
+    with _indexes_lock:
+        index = _indexes.get(base_dir)
+        if index is None:
+            index = HistoryIndex(base_dir / INDEX_FILENAME)
+            if index.needs_rebuild:
+                count = index.rebuild(base_dir, modes, upgrade)
+                if on_rebuild is not None:
+                    on_rebuild(index)
+                print(f"📇 History index built from {count} existing renders")
+            _indexes[base_dir] = index
+        return index
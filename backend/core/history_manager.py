@@ -3,7 +3,12 @@ core/history_manager.py - Render History Manager
 
 Saves rendered images + metadata locally on disk.
 Directory: backend/render_history/ (gitignored, not synced to git)
-Each render = 1 PNG file + 1 JSON metadata file.
+Each render = 1 JSON metadata file ({mode}/{stem}.json) referencing its
+PNG and thumbnails in the content-addressed blob store (blobs/, see
+core/blob_store.py); identical files are stored once. Renders saved
+before the blob store keep their files next to the sidecar.
+List-view metadata is mirrored in a SQLite index (core/history_index.py)
+so listing does not read every JSON file.
 """
 
 import os
@@ -11,17 +16,44 @@ import json
 import uuid
 import base64
 import io
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
-from PIL import Image
+from PIL import Image, features
+
+from core.blob_store import BlobStore, blob_path, get_blob_store
+from core.history_index import HistoryIndex, get_history_index
+from core.image_processor import encode_png
 
 # History directory inside backend/ folder
 HISTORY_BASE_DIR = Path(__file__).parent.parent / "render_history"
 
 VALID_MODES = ["building", "interior", "planning", "planning_detail", "object_swap", "floorplan"]
 
+# Thumbnails: (max side, quality). WebP when Pillow supports it, else JPEG.
+THUMBNAIL_SPECS = {
+    "thumbnail": (400, 75),
+    "source": (200, 70),
+}
+THUMBNAIL_FORMAT, THUMBNAIL_EXT = ("WEBP", "webp") if features.check("webp") else ("JPEG", "jpg")
+THUMBNAIL_MIMETYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+
+# Metadata key holding each thumbnail's blob key (or legacy filename)
+THUMBNAIL_FIELDS = {"thumbnail": "thumbnail", "source": "source_thumbnail"}
+
+# Deletes, clears and transcodes of one history directory are serialized
+# across managers (the API's and the compactor's): each re-reads the index
+# row under the lock, so a blob reference is never released twice
+_render_locks: Dict[Path, threading.Lock] = {}
+_render_locks_guard = threading.Lock()
+
+
+def _render_lock(base_dir: Path) -> threading.Lock:
+    with _render_locks_guard:
+        return _render_locks.setdefault(Path(base_dir).resolve(), threading.Lock())
+
 
 class HistoryManager:
     """Manages saved render history to local disk."""
@@ -29,6 +61,13 @@ class HistoryManager:
     def __init__(self, base_dir: Optional[Path] = None):
         self.base_dir = base_dir or HISTORY_BASE_DIR
         self._ensure_dirs()
+        self.index = get_history_index(
+            self.base_dir, VALID_MODES,
+            upgrade=self._upgrade_sidecar,
+            on_rebuild=self._recount_blobs
+        )
+        self.blobs = get_blob_store(self.base_dir, self.index)
+        self._lock = _render_lock(self.base_dir)
 
     def _ensure_dirs(self):
         """Create mode subdirectories if missing."""
@@ -55,25 +94,18 @@ class HistoryManager:
         ts_str = timestamp.strftime("%Y%m%d_%H%M%S")
         filename = f"{ts_str}_{render_id}.png"
         mode_dir = self.base_dir / mode
+        stem = f"{ts_str}_{render_id}"
 
-        # Save full-resolution image
-        image_pil.save(mode_dir / filename, format="PNG")
-
-        # Create thumbnail (400px max side) for gallery
-        thumb = image_pil.copy()
-        thumb.thumbnail((400, 400))
-        thumb_buf = io.BytesIO()
-        thumb.save(thumb_buf, format="JPEG", quality=75)
-        thumb_b64 = base64.b64encode(thumb_buf.getvalue()).decode("utf-8")
-
-        # Source image thumbnail (optional, 200px)
-        source_thumb_b64 = ""
+        # ✅ OPTIMIZED: Full-resolution PNG (reusing the bytes of the HTTP
+        # response / Gemini output) and thumbnails go to the deduplicating
+        # blob store; thumbnails are standalone cacheable files
+        files = {
+            "image": (encode_png(image_pil), "png"),
+            "thumbnail": (self._encode_thumbnail(image_pil, "thumbnail"), THUMBNAIL_EXT)
+        }
         if source_image_pil:
-            src_thumb = source_image_pil.copy()
-            src_thumb.thumbnail((200, 200))
-            src_buf = io.BytesIO()
-            src_thumb.save(src_buf, format="JPEG", quality=70)
-            source_thumb_b64 = base64.b64encode(src_buf.getvalue()).decode("utf-8")
+            files["source_thumbnail"] = (self._encode_thumbnail(source_image_pil, "source"), THUMBNAIL_EXT)
+        blobs = {field: self.blobs.put(data, ext) for field, (data, ext) in files.items()}
 
         # Build metadata
         metadata = {
@@ -81,99 +113,351 @@ class HistoryManager:
             "timestamp": timestamp.isoformat(),
             "mode": mode,
             "filename": filename,
-            "thumbnail_b64": thumb_b64,
-            "source_thumbnail_b64": source_thumb_b64,
+            "blobs": blobs,
+            "bytes": sum(len(data) for data, _ in files.values()),
             "prompt_summary": prompt_summary[:300],
             "settings": settings or {}
         }
 
-        meta_path = mode_dir / f"{ts_str}_{render_id}.json"
-        with open(meta_path, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        self._write_sidecar(mode_dir, stem, metadata)
+        self.index.add(metadata, stem)
 
         print(f"📁 History saved: {mode}/{filename}")
         return render_id
 
+    @staticmethod
+    def _thumbnail_filename(stem: str, kind: str) -> str:
+        suffix = "thumb" if kind == "thumbnail" else kind
+        return f"{stem}.{suffix}.{THUMBNAIL_EXT}"
+
+    @staticmethod
+    def _encode_thumbnail(image: Image.Image, kind: str) -> bytes:
+        """Downscaled copy encoded as THUMBNAIL_FORMAT."""
+        max_side, quality = THUMBNAIL_SPECS[kind]
+        thumb = image.copy()
+        thumb.thumbnail((max_side, max_side))
+        if thumb.mode not in ("RGB", "L"):
+            thumb = thumb.convert("RGB")
+        buf = io.BytesIO()
+        thumb.save(buf, format=THUMBNAIL_FORMAT, quality=quality)
+        return buf.getvalue()
+
+    def _save_thumbnail(self, image: Image.Image, mode_dir: Path, stem: str, kind: str) -> str:
+        """Write a thumbnail next to a legacy render; returns its filename."""
+        filename = self._thumbnail_filename(stem, kind)
+        (mode_dir / filename).write_bytes(self._encode_thumbnail(image, kind))
+        return filename
+
+    def _recount_blobs(self, index: HistoryIndex) -> None:
+        """Index rebuild hook: blob reference counts from the sidecars."""
+        get_blob_store(self.base_dir, index).recount(index.metas())
+
+    def _file_path(self, entry: Dict, field: str) -> Optional[Path]:
+        """
+        Path of a render's file (field: image | thumbnail | source_thumbnail),
+        from its blob key, or next to the sidecar for older renders.
+        """
+        meta = entry["meta"]
+        key = (meta.get("blobs") or {}).get(field)
+        if key:
+            path = self.blobs.path(key)
+        elif field == "image":
+            path = self.base_dir / entry["mode"] / (meta.get("filename") or f"{entry['stem']}.png")
+        elif meta.get(field):
+            path = self.base_dir / entry["mode"] / meta[field]
+        else:
+            return None
+        return path if path.is_file() else None
+
+    @staticmethod
+    def _write_sidecar(mode_dir: Path, stem: str, meta: Dict) -> None:
+        """Write {stem}.json atomically (temp file + rename)."""
+        tmp_path = mode_dir / f"{stem}.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, mode_dir / f"{stem}.json")
+
+    def _files_size(self, meta: Dict, mode_dir: Path, stem: str) -> int:
+        """Total size of a render's image and thumbnails on disk."""
+        if meta.get("blobs"):
+            paths = [blob_path(self.base_dir, key) for key in meta["blobs"].values() if key]
+        else:
+            paths = [mode_dir / (meta.get("filename") or f"{stem}.png")]
+            paths += [mode_dir / meta[field] for field in THUMBNAIL_FIELDS.values() if meta.get(field)]
+        return sum(p.stat().st_size for p in paths if p.is_file())
+
+    def _upgrade_sidecar(self, meta: Dict, mode_dir: Path, stem: str) -> Dict:
+        """
+        Index rebuild hook for older sidecars: move base64 thumbnails into
+        files, record the render's size on disk, and rewrite the sidecar.
+        """
+        changed = False
+        for kind, field in THUMBNAIL_FIELDS.items():
+            b64 = meta.pop(f"{field}_b64", None)
+            if b64 is None:
+                continue
+            changed = True
+            if not b64 or meta.get(field):
+                meta.setdefault(field, "")
+                continue
+            try:
+                image = Image.open(io.BytesIO(base64.b64decode(b64)))
+                meta[field] = self._save_thumbnail(image, mode_dir, stem, kind)
+            except Exception:
+                meta[field] = ""
+
+        if "bytes" not in meta:
+            meta["bytes"] = self._files_size(meta, mode_dir, stem)
+            changed = True
+
+        if changed:
+            self._write_sidecar(mode_dir, stem, meta)
+        return meta
+
+    def get_thumbnail_path(self, render_id: str, kind: str = "thumbnail") -> Optional[Path]:
+        """Path of a render's thumbnail file (kind: thumbnail | source)."""
+        field = THUMBNAIL_FIELDS.get(kind)
+        entry = self._locate(render_id)
+        if not field or entry is None:
+            return None
+        return self._file_path(entry, field)
+
     def list_renders(
         self,
         mode: Optional[str] = None,
         page: int = 1,
-        limit: int = 20
+        limit: int = 20,
+        cursor: Optional[str] = None
     ) -> Dict:
         """
         List renders, newest first.
-        Returns paginated result with thumbnail (no source_thumb to keep payload small).
+        Items carry thumbnail filenames; the API turns them into URLs.
+
+        ✅ OPTIMIZED: Served from the SQLite index instead of reading every
+        JSON file. Pass the previous response's next_cursor as cursor for
+        keyset pagination (constant cost however deep); page still works.
         """
-        all_items = []
-        modes_to_scan = [mode] if mode and mode in VALID_MODES else VALID_MODES
+        if mode not in VALID_MODES:
+            mode = None
 
-        for m in modes_to_scan:
-            mode_dir = self.base_dir / m
-            if not mode_dir.exists():
-                continue
-            for json_file in mode_dir.glob("*.json"):
-                try:
-                    with open(json_file, "r", encoding="utf-8") as f:
-                        meta = json.load(f)
-                    # Strip source thumbnail from list view (heavy)
-                    meta.pop("source_thumbnail_b64", None)
-                    all_items.append(meta)
-                except Exception:
-                    pass
+        offset = (page - 1) * limit
+        items = self.index.page(mode=mode, limit=limit, offset=offset, cursor=cursor)
+        total = self.index.count(mode)
+
+        next_cursor = None
+        if len(items) == limit:
+            next_cursor = HistoryIndex.make_cursor(items[-1])
+
+        return {
+            "items": items,
+            "total": total,
+            "page": page,
+            "limit": limit,
+            "pages": max(1, (total + limit - 1) // limit),
+            "next_cursor": next_cursor
+        }
+
+    def search(
+        self,
+        query: str = "",
+        filters: Optional[Dict[str, str]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        page: int = 1,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict:
+        """
+        Search renders by prompt summary / settings text (accents optional)
+        with facet filters and a date range; newest first, with facet counts.
 
-        # Sort newest first
-        all_items.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+        Dates are ISO dates or timestamps; a bare date_to includes that day.
+        Raises ValueError for an unknown filter or a malformed date.
+        """
+        if date_from:
+            date_from = datetime.fromisoformat(date_from).isoformat()
+        if date_to:
+            end = datetime.fromisoformat(date_to)
+            if len(date_to) == 10:
+                end += timedelta(days=1)
+            date_to = end.isoformat()
 
-        total = len(all_items)
-        start = (page - 1) * limit
-        end = start + limit
+        result = self.index.search(
+            query=query,
+            filters=filters,
+            date_from=date_from,
+            date_to=date_to,
+            limit=limit,
+            offset=(page - 1) * limit,
+            cursor=cursor
+        )
+        items, total = result["items"], result["total"]
+        next_cursor = HistoryIndex.make_cursor(items[-1]) if len(items) == limit else None
 
         return {
-            "items": all_items[start:end],
+            "items": items,
             "total": total,
+            "facets": result["facets"],
             "page": page,
             "limit": limit,
-            "pages": max(1, (total + limit - 1) // limit)
+            "pages": max(1, (total + limit - 1) // limit),
+            "next_cursor": next_cursor
         }
 
-    def get_render_detail(self, render_id: str, mode: Optional[str] = None) -> Optional[Dict]:
-        """Get full metadata including source_thumbnail_b64."""
-        modes_to_scan = [mode] if mode and mode in VALID_MODES else VALID_MODES
-        for m in modes_to_scan:
+    def _locate(self, render_id: str, mode: Optional[str] = None) -> Optional[Dict]:
+        """
+        {"mode", "stem", "meta"} of a render.
+
+        ✅ OPTIMIZED: Primary-key lookup in the index instead of globbing
+        every mode directory. Renders missing from the index (e.g. files
+        copied in by hand) are found by the old scan once and then indexed.
+        """
+        entry = self.index.get(render_id)
+        if entry is None:
+            entry = self._scan_for(render_id)
+        if entry is None or (mode in VALID_MODES and entry["mode"] != mode):
+            return None
+        return entry
+
+    def _scan_for(self, render_id: str) -> Optional[Dict]:
+        for m in VALID_MODES:
             mode_dir = self.base_dir / m
-            if not mode_dir.exists():
-                continue
             for json_file in mode_dir.glob(f"*_{render_id}.json"):
                 try:
                     with open(json_file, "r", encoding="utf-8") as f:
-                        return json.load(f)
+                        meta = json.load(f)
                 except Exception:
                     return None
+                meta["mode"] = m
+                meta = self._upgrade_sidecar(meta, mode_dir, json_file.stem)
+                self.index.add(meta, json_file.stem)
+                return {"mode": m, "stem": json_file.stem, "meta": meta}
         return None
 
+    def get_render_detail(self, render_id: str, mode: Optional[str] = None) -> Optional[Dict]:
+        """Get full metadata (as stored in the JSON sidecar)."""
+        entry = self._locate(render_id, mode)
+        if entry is None:
+            return None
+        json_path = self.base_dir / entry["mode"] / f"{entry['stem']}.json"
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # Deleted behind our back: drop the stale index row
+            self.index.remove(render_id)
+            return None
+        except Exception:
+            return None
+
+    def get_render_image_path(self, render_id: str, mode: Optional[str] = None) -> Optional[Path]:
+        """Path of the full-resolution PNG, or None."""
+        entry = self._locate(render_id, mode)
+        if entry is None:
+            return None
+        return self._file_path(entry, "image")
+
     def get_render_image_bytes(self, render_id: str, mode: Optional[str] = None) -> Optional[bytes]:
         """Return raw PNG bytes for download."""
-        modes_to_scan = [mode] if mode and mode in VALID_MODES else VALID_MODES
-        for m in modes_to_scan:
-            mode_dir = self.base_dir / m
-            if not mode_dir.exists():
-                continue
-            for img_file in mode_dir.glob(f"*_{render_id}.png"):
-                return img_file.read_bytes()
-        return None
+        path = self.get_render_image_path(render_id, mode)
+        return path.read_bytes() if path else None
 
     def delete_render(self, render_id: str, mode: Optional[str] = None) -> bool:
-        """Delete render image + metadata files. Returns True if found."""
-        modes_to_scan = [mode] if mode and mode in VALID_MODES else VALID_MODES
-        deleted = False
-        for m in modes_to_scan:
-            mode_dir = self.base_dir / m
-            if not mode_dir.exists():
-                continue
-            for f in list(mode_dir.glob(f"*_{render_id}.*")):
-                f.unlink(missing_ok=True)
-                deleted = True
-        return deleted
+        """Delete render image, thumbnails and metadata files. Returns True if found."""
+        entry = self._locate(render_id, mode)
+        if entry is None:
+            return False
+
+        return self._delete_entries([entry])[0] > 0
+
+    def delete_renders(self, render_ids: List[str]) -> int:
+        """Delete several renders in one batch. Returns the number deleted."""
+        return self.evict_renders(render_ids)[0]
+
+    def evict_renders(self, render_ids: List[str]) -> Tuple[int, int]:
+        """delete_renders() for retention. Returns (renders deleted, disk bytes freed)."""
+        entries = [e for e in (self.index.get(render_id) for render_id in render_ids) if e]
+        return self._delete_entries(entries)
+
+    def _delete_entries(self, entries: List[Dict]) -> Tuple[int, int]:
+        """
+        Remove sidecars and index rows, then release/unlink their files.
+        Returns (renders deleted, disk bytes freed).
+        """
+        with self._lock:
+            # Re-read under the lock: skips renders deleted meanwhile and
+            # sees blob keys changed by a concurrent transcode
+            entries = [e for e in (self.index.get(entry["meta"]["id"]) for entry in entries) if e]
+            blob_keys = []
+            freed = 0
+            for entry in entries:
+                mode_dir = self.base_dir / entry["mode"]
+                meta = entry["meta"]
+                (mode_dir / f"{entry['stem']}.json").unlink(missing_ok=True)
+                if meta.get("blobs"):
+                    blob_keys.extend(meta["blobs"].values())
+                else:
+                    # Legacy layout: files next to the sidecar
+                    filenames = {meta.get("filename") or f"{entry['stem']}.png"}
+                    filenames.update(meta[field] for field in THUMBNAIL_FIELDS.values() if meta.get(field))
+                    for filename in filenames:
+                        try:
+                            freed += (mode_dir / filename).stat().st_size
+                            (mode_dir / filename).unlink()
+                        except FileNotFoundError:
+                            pass
+
+            self.index.remove_many([entry["meta"]["id"] for entry in entries])
+            freed += self.blobs.release(blob_keys)
+        return len(entries), freed
+
+    def transcode_render(self, render_id: str) -> Optional[int]:
+        """
+        Re-store a render's full-resolution PNG as lossless WebP (same
+        pixels, usually 25-35% smaller). Returns the disk bytes freed
+        (negative while the PNG is still shared with other renders), or
+        None if the render was skipped.
+        """
+        entry = self.index.get(render_id)
+        if entry is None or THUMBNAIL_EXT != "webp":
+            return None
+        old_key = (entry["meta"].get("blobs") or {}).get("image", "")
+        path = self._file_path(entry, "image")
+        if not old_key.endswith(".png") or path is None:
+            return None
+
+        # Encoded outside the lock (slow); the render is re-checked below
+        with Image.open(path) as image:
+            buf = io.BytesIO()
+            image.save(buf, format="WEBP", lossless=True, quality=80, method=4)
+        webp = buf.getvalue()
+        saved = path.stat().st_size - len(webp)
+        if saved <= 0:
+            return None
+
+        with self._lock:
+            current = self.index.get(render_id)
+            if current is None or (current["meta"].get("blobs") or {}).get("image") != old_key:
+                return None  # deleted or changed while encoding
+
+            new_blob = not self.blobs.path(BlobStore.compute_key(webp, "webp")).exists()
+            new_key = self.blobs.put(webp, "webp")
+            meta = self.get_render_detail(render_id) or current["meta"]
+            if meta.get("blobs", {}).get("image") != old_key:
+                self.blobs.release([new_key])
+                return None
+            meta["blobs"]["image"] = new_key
+            meta["bytes"] = max(0, meta.get("bytes", 0) - saved)
+            self._write_sidecar(self.base_dir / current["mode"], current["stem"], meta)
+            self.index.add(meta, current["stem"])
+            freed = self.blobs.release([old_key])
+        return freed - (len(webp) if new_blob else 0)
+
+    def rebuild_index(self) -> int:
+        """Re-index every sidecar on disk. Returns the number of renders."""
+        count = self.index.rebuild(self.base_dir, VALID_MODES, self._upgrade_sidecar)
+        self._recount_blobs(self.index)
+        return count
 
     def clear_mode(self, mode: str) -> int:
         """Delete all renders for a specific mode. Returns count of renders deleted."""
@@ -182,23 +466,53 @@ class HistoryManager:
         mode_dir = self.base_dir / mode
         if not mode_dir.exists():
             return 0
-        count = 0
-        for f in list(mode_dir.glob("*.json")):
-            f.unlink(missing_ok=True)
-            count += 1
-        for f in list(mode_dir.glob("*.png")):
-            f.unlink(missing_ok=True)
+        with self._lock:
+            blob_keys = [
+                key for meta in self.index.metas(mode) for key in (meta.get("blobs") or {}).values()
+            ]
+            # One directory pass: sidecars plus legacy images/thumbnails
+            count = 0
+            with os.scandir(mode_dir) as entries:
+                for f in entries:
+                    if f.is_file():
+                        count += f.name.endswith(".json")
+                        os.unlink(f.path)
+            self.index.remove_mode(mode)
+            self.blobs.release(blob_keys)
         return count  # count = number of renders (json files)
 
+    def reconcile(self) -> bool:
+        """
+        Startup check: compare the index's per-mode counts with a scandir
+        count of the sidecars on disk (names only, no stat/reads) and
+        rebuild the index if they disagree. Returns True if rebuilt.
+        """
+        usage = self.index.usage()
+        for mode in VALID_MODES:
+            with os.scandir(self.base_dir / mode) as entries:
+                on_disk = sum(1 for e in entries if e.name.endswith(".json"))
+            indexed = usage.get(mode, {}).get("renders", 0)
+            if on_disk != indexed:
+                print(f"📇 History index out of sync for {mode} "
+                      f"({on_disk} sidecars, {indexed} indexed) - rebuilding")
+                self.rebuild_index()
+                return True
+        return False
+
     def get_stats(self) -> Dict:
-        """Return stats: total renders and per-mode counts."""
-        stats = {"total": 0, "by_mode": {}}
+        """
+        Return stats: total renders and per-mode counts/bytes.
+
+        ✅ OPTIMIZED: O(1) - totals are maintained incrementally by the
+        index on save/delete/clear instead of listing every JSON file.
+        """
+        usage = self.index.usage()
+        stats = {"total": 0, "by_mode": {}, "total_bytes": 0, "bytes_by_mode": {}}
         for m in VALID_MODES:
-            mode_dir = self.base_dir / m
-            if not mode_dir.exists():
-                stats["by_mode"][m] = 0
-                continue
-            count = len(list(mode_dir.glob("*.json")))
-            stats["by_mode"][m] = count
-            stats["total"] += count
+            mode_usage = usage.get(m, {"renders": 0, "bytes": 0})
+            stats["by_mode"][m] = mode_usage["renders"]
+            stats["bytes_by_mode"][m] = mode_usage["bytes"]
+            stats["total"] += mode_usage["renders"]
+            stats["total_bytes"] += mode_usage["bytes"]
+        stats["storage"] = self.blobs.get_stats()
         return stats
@@ -0,0 +1,169 @@
+"""
+core/history_retention.py - Retention policies and background compaction
+
+Without limits render_history/ grows for as long as the container runs.
+Each mode gets a RetentionPolicy (max renders, max age, max bytes; from
+HistoryConfig with per-mode environment overrides). HistoryCompactor
+periodically:
+  1. evicts the oldest renders that fall outside their mode's policy
+  2. optionally transcodes full-resolution PNGs older than
+     TRANSCODE_AFTER_DAYS to lossless WebP (identical pixels, smaller file)
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from config import HistoryConfig
+from core.history_manager import HistoryManager, VALID_MODES
+
+
+def _env_override(name: str, mode: str, default: float) -> float:
+    value = os.environ.get(f"{name}_{mode.upper()}")
+    return float(value) if value else default
+
+
+@dataclass
+class RetentionPolicy:
+    """Limits for one mode; 0 means unlimited"""
+    max_count: int = 0
+    max_age_days: float = 0
+    max_bytes: int = 0
+
+    @classmethod
+    def for_mode(cls, mode: str) -> "RetentionPolicy":
+        return cls(
+            max_count=int(_env_override("HISTORY_MAX_COUNT", mode, HistoryConfig.MAX_COUNT)),
+            max_age_days=_env_override("HISTORY_MAX_AGE_DAYS", mode, HistoryConfig.MAX_AGE_DAYS),
+            max_bytes=int(_env_override("HISTORY_MAX_MB", mode, HistoryConfig.MAX_MB) * 1024 * 1024)
+        )
+
+    @property
+    def unlimited(self) -> bool:
+        return not (self.max_count or self.max_age_days or self.max_bytes)
+
+
+class HistoryCompactor:
+    """Applies retention policies (and PNG -> WebP transcoding) in the background"""
+
+    def __init__(
+        self,
+        manager: HistoryManager,
+        policies: Optional[Dict[str, RetentionPolicy]] = None,
+        interval: float = HistoryConfig.COMPACT_INTERVAL_SECONDS,
+        transcode_after_days: float = HistoryConfig.TRANSCODE_AFTER_DAYS
+    ):
+        self.manager = manager
+        self.policies = policies or {mode: RetentionPolicy.for_mode(mode) for mode in VALID_MODES}
+        self.interval = interval
+        self.transcode_after_days = transcode_after_days
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+
+        # Statistics
+        self.runs = 0
+        self.last_run: Optional[str] = None
+        self.last_report: Dict = {}
+        self.total_evicted = 0
+        self.total_bytes_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Anything to do at all?"""
+        return self.transcode_after_days > 0 or any(
+            not policy.unlimited for policy in self.policies.values()
+        )
+
+    def run_once(self) -> Dict:
+        """One compaction pass. Returns what it did."""
+        with self._run_lock:
+            start = time.perf_counter()
+            report = {"evicted": {}, "transcoded": 0, "bytes_saved": 0}
+            # Disk bytes actually freed (a blob shared by dedup frees
+            # nothing until its last render lets it go)
+            freed = 0
+
+            now = datetime.now()
+            for mode, policy in self.policies.items():
+                if policy.unlimited:
+                    continue
+                before = None
+                if policy.max_age_days:
+                    before = (now - timedelta(days=policy.max_age_days)).isoformat()
+                ids = self.manager.index.ids_over_limits(
+                    mode,
+                    max_count=policy.max_count or None,
+                    before=before,
+                    max_bytes=policy.max_bytes or None
+                )
+                if ids:
+                    report["evicted"][mode], mode_freed = self.manager.evict_renders(ids)
+                    freed += mode_freed
+
+            if self.transcode_after_days > 0:
+                cutoff = (now - timedelta(days=self.transcode_after_days)).isoformat()
+                for render_id in self.manager.index.ids_with_image_ext(
+                    "png", cutoff, HistoryConfig.TRANSCODE_BATCH
+                ):
+                    if self._stop.is_set():
+                        break
+                    try:
+                        saved = self.manager.transcode_render(render_id)
+                    except Exception as e:
+                        print(f"⚠️  History transcode failed for {render_id}: {e}")
+                        continue
+                    if saved is not None:
+                        report["transcoded"] += 1
+                        freed += saved
+
+            report["bytes_saved"] = max(0, freed)
+            report["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+            self.runs += 1
+            self.last_run = now.isoformat()
+            self.last_report = report
+            self.total_evicted += sum(report["evicted"].values())
+            self.total_bytes_saved += report["bytes_saved"]
+
+            if report["evicted"] or report["transcoded"]:
+                print(f"🧹 History compaction: evicted {report['evicted']}, "
+                      f"transcoded {report['transcoded']}, "
+                      f"{report['bytes_saved'] / (1024 * 1024):.1f} MB freed")
+            return report
+
+    def start(self) -> None:
+        """Run run_once() every `interval` seconds on a daemon thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="history-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️  History compaction failed: {e}")
+            self._stop.wait(self.interval)
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "interval_seconds": self.interval,
+            "transcode_after_days": self.transcode_after_days,
+            "policies": {mode: asdict(policy) for mode, policy in self.policies.items()},
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_report": self.last_report,
+            "total_evicted": self.total_evicted,
+            "total_bytes_saved": self.total_bytes_saved
+        }
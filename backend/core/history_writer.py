@@ -0,0 +1,173 @@
+"""
+core/history_writer.py - Background persistence of render history
+
+Render endpoints hand the generated image to the writer and respond right
+away; a single worker thread runs HistoryManager.save_render (PNG encode,
+thumbnails, sidecar, index) off the request thread.
+
+- Bounded queue: when it is full, submit() waits up to PUT_TIMEOUT and
+  then saves on the calling thread, so a slow disk slows producers down
+  instead of growing memory or dropping renders.
+- Pending saves are flushed when the process exits (atexit).
+- get_stats(): queue depth and write latency.
+"""
+
+import atexit
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from PIL import Image
+
+from config import HistoryConfig
+from core.history_manager import HistoryManager
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """Single-threaded, bounded background queue of save_render calls"""
+
+    def __init__(
+        self,
+        manager_factory: Callable[[], HistoryManager] = HistoryManager,
+        max_queue: int = HistoryConfig.WRITER_QUEUE_SIZE,
+        put_timeout: float = HistoryConfig.WRITER_PUT_TIMEOUT
+    ):
+        self._manager_factory = manager_factory
+        self._manager: Optional[HistoryManager] = None
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self.put_timeout = put_timeout
+        self._closed = False
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.inline_writes = 0
+        self.max_depth = 0
+        self._write_ms_total = 0.0
+        self._write_ms_max = 0.0
+        self._last_write_ms = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def manager(self) -> HistoryManager:
+        if self._manager is None:
+            self._manager = self._manager_factory()
+        return self._manager
+
+    def submit(
+        self,
+        image_pil: Image.Image,
+        mode: str,
+        prompt_summary: str = "",
+        source_image_pil: Optional[Image.Image] = None,
+        settings: Optional[Dict] = None
+    ) -> None:
+        """
+        Queue a render for saving (same arguments as save_render).
+        The images must not be modified by the caller afterwards.
+        """
+        # Lazily-decoded images must be loaded before two threads read them
+        image_pil.load()
+        if source_image_pil is not None:
+            source_image_pil.load()
+
+        job = (image_pil, mode, prompt_summary, source_image_pil, settings)
+        with self._lock:
+            self.submitted += 1
+
+        if not self._closed:
+            try:
+                self._queue.put(job, timeout=self.put_timeout)
+                with self._lock:
+                    self.max_depth = max(self.max_depth, self._queue.qsize())
+                return
+            except queue.Full:
+                pass
+
+        # Back-pressure: queue full (or writer closed), save on this thread
+        with self._lock:
+            self.inline_writes += 1
+        self._write(job)
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                self._write(job)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, job) -> None:
+        image_pil, mode, prompt_summary, source_image_pil, settings = job
+        start = time.perf_counter()
+        try:
+            self.manager.save_render(
+                image_pil=image_pil,
+                mode=mode,
+                prompt_summary=prompt_summary,
+                source_image_pil=source_image_pil,
+                settings=settings
+            )
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f"⚠️  History save failed (non-critical): {e}")
+            return
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.written += 1
+            self._last_write_ms = elapsed_ms
+            self._write_ms_total += elapsed_ms
+            self._write_ms_max = max(self._write_ms_max, elapsed_ms)
+
+    def flush(self) -> None:
+        """Block until every queued render is saved"""
+        self._queue.join()
+
+    def close(self, timeout: float = HistoryConfig.WRITER_SHUTDOWN_TIMEOUT) -> None:
+        """Save what is queued, then stop the worker thread"""
+        if self._closed:
+            return
+        self._closed = True
+        pending = self._queue.qsize()
+        if pending:
+            print(f"💾 Flushing {pending} pending history save(s)...")
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+        # Renders submitted while closing land behind the stop marker
+        if not self._thread.is_alive():
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not _STOP:
+                    self._write(job)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            avg_ms = self._write_ms_total / self.written if self.written else 0.0
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_max_depth': self.max_depth,
+                'queue_capacity': self._queue.maxsize,
+                'submitted': self.submitted,
+                'written': self.written,
+                'failed': self.failed,
+                'inline_writes': self.inline_writes,
+                'write_ms_last': round(self._last_write_ms, 1),
+                'write_ms_avg': round(avg_ms, 1),
+                'write_ms_max': round(self._write_ms_max, 1)
+            }
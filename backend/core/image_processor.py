@@ -5,12 +5,12 @@ core/image_processor.py - Image Processing with CV2
 import base64
 import io
 import re
-from typing import Optional, Tuple
+from typing import Any, Callable, Dict, Optional, Tuple
 from dataclasses import dataclass
 
 import cv2
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
 
 from config import SUPPORTED_ASPECT_RATIOS, ImageConfig
 
@@ -25,16 +25,164 @@ class SketchInfo:
     edge_density: float
 
 
+class ImageContext:
+    """
+    One decoded upload plus lazily computed derivatives.
+
+    Created by ImageProcessor.ingest(): the image is decoded once, EXIF
+    orientation is applied and the mode is normalized to RGB (or L), then
+    every derived product (resized copies, grayscale, edge map, sketch info,
+    preprocessed sketch) is computed on first use and memoized here, so a
+    request never converts the same upload twice.
+    """
+
+    def __init__(self, image: Image.Image, mime_type: str, raw_bytes: bytes,
+                 processor: 'ImageProcessor'):
+        self.image = image
+        self.mime_type = mime_type
+        self.raw_bytes = raw_bytes
+        self.handle: Optional[str] = None  # Set when kept in the UploadStore
+        # Called after a product is memoized (the UploadStore re-measures the entry)
+        self.on_grow: Optional[Callable[['ImageContext'], None]] = None
+        self._processor = processor
+        self._products: Dict[Any, Any] = {}
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.image.size
+
+    @property
+    def is_grayscale(self) -> bool:
+        return self.image.mode == 'L'
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the upload and its memoized products"""
+        return len(self.raw_bytes) + _sizeof(self.image) + sum(
+            _sizeof(value) for value in list(self._products.values())
+        )
+
+    def _memo(self, key: Any, factory: Callable[[], Any]) -> Any:
+        if key not in self._products:
+            self._products[key] = factory()
+            if self.on_grow is not None:
+                self.on_grow(self)
+        return self._products[key]
+
+    def array(self) -> np.ndarray:
+        """Pixels as a uint8 array (HxWx3 for RGB, HxW for L)"""
+        return self._memo('array', lambda: np.asarray(self.image))
+
+    def grayscale(self) -> np.ndarray:
+        """Single-channel uint8 array"""
+        def _gray():
+            arr = self.array()
+            if arr.ndim == 3:
+                return cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
+            return arr
+        return self._memo('grayscale', _gray)
+
+    def edge_map(self) -> np.ndarray:
+        """Canny edges of the grayscale image"""
+        return self._memo('edges', lambda: cv2.Canny(
+            self.grayscale(),
+            ImageConfig.EDGE_DETECTION_THRESHOLD_LOW,
+            ImageConfig.EDGE_DETECTION_THRESHOLD_HIGH
+        ))
+
+    def sketch_info(self) -> SketchInfo:
+        """Sketch classification of the full-resolution upload"""
+        return self._memo('sketch_info', lambda: self._processor.classify_sketch(
+            self.grayscale(), self.edge_map(), is_colored=not self.is_grayscale
+        ))
+
+    def resized(self, max_size: int = 2048) -> Image.Image:
+        """Downscaled copy whose longest side is at most max_size"""
+        return self._memo(('resized', max_size),
+                          lambda: self._processor.resize_image(self.image, max_size=max_size))
+
+    def resized_to(self, size: Tuple[int, int]) -> Image.Image:
+        """Copy stretched to an exact size (used to align masks with their source)"""
+        size = tuple(size)
+        if size == self.image.size:
+            return self.image
+        return self._memo(('resized_to', size), lambda: self.image.resize(size))
+
+    def preprocessed(self, target_aspect_ratio: str = "16:9", preserve_quality: bool = True) -> Image.Image:
+        """Sketch prepared for rendering (see ImageProcessor.preprocess_sketch)"""
+        return self._memo(('preprocessed', target_aspect_ratio, preserve_quality),
+                          lambda: self._processor.preprocess_sketch(
+                              self.image,
+                              target_aspect_ratio=target_aspect_ratio,
+                              sketch_info=self.sketch_info(),
+                              preserve_quality=preserve_quality
+                          ))
+
+    def preprocessed_png(self, target_aspect_ratio: str = "16:9", preserve_quality: bool = True) -> bytes:
+        """PNG bytes of preprocessed(), ready to send upstream"""
+        return self._memo(('preprocessed_png', target_aspect_ratio, preserve_quality),
+                          lambda: encode_png(self.preprocessed(target_aspect_ratio, preserve_quality)))
+
+    def png(self) -> bytes:
+        """PNG bytes of the normalized image"""
+        return self._memo('png', lambda: encode_png(self.image))
+
+
+# Attribute holding the PNG bytes an image was decoded from / last encoded to
+_PNG_BYTES_ATTR = 's2r_png_bytes'
+
+
+def decode_png_aware(image_bytes: bytes) -> Image.Image:
+    """
+    Image.open() that keeps the original bytes when they are a PNG, so
+    encode_png() of the result costs nothing (e.g. Gemini output that is
+    saved to history and returned to the browser).
+    """
+    pil_image = Image.open(io.BytesIO(image_bytes))
+    if pil_image.format == 'PNG':
+        setattr(pil_image, _PNG_BYTES_ATTR, bytes(image_bytes))
+    return pil_image
+
+
+def encode_png(pil_image: Image.Image) -> bytes:
+    """
+    Encode an image as PNG bytes.
+
+    ✅ OPTIMIZED: The result is remembered on the image object, so the
+    history writer and the HTTP response share one encode; images from
+    decode_png_aware() reuse their upstream bytes. Callers must not modify
+    an image in place after encoding it.
+    """
+    cached = getattr(pil_image, _PNG_BYTES_ATTR, None)
+    if cached is not None:
+        return cached
+    buf = io.BytesIO()
+    pil_image.save(buf, format='PNG')
+    data = buf.getvalue()
+    setattr(pil_image, _PNG_BYTES_ATTR, data)
+    return data
+
+
+def _sizeof(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return 0
+
+
 class ImageProcessor:
     """Handle all image processing operations"""
-    
-    def process_base64_image(self, base64_string: str) -> Tuple[Optional[Image.Image], Optional[str]]:
+
+    def decode_base64(self, base64_string: str) -> Tuple[Optional[bytes], Optional[str]]:
         """
-        Convert base64 string to PIL Image
+        Split a (data URL or bare) base64 string into raw bytes + mime type
         """
         try:
             if base64_string.startswith('data:'):
-                match = re.match(r'data:([^;]+);base64,(.+)', base64_string)
+                match = re.match(r'data:([^;]+);base64,(.+)', base64_string, re.DOTALL)
                 if match:
                     mime_type = match.group(1)
                     base64_data = match.group(2)
@@ -43,16 +191,82 @@ class ImageProcessor:
             else:
                 base64_data = base64_string
                 mime_type = 'image/jpeg'
-            
-            image_bytes = base64.b64decode(base64_data)
+
+            return base64.b64decode(base64_data), mime_type
+
+        except Exception as e:
+            print(f"Error decoding base64 image: {e}")
+            return None, None
+
+    def process_base64_image(self, base64_string: str) -> Tuple[Optional[Image.Image], Optional[str]]:
+        """
+        Convert base64 string to PIL Image
+        """
+        image_bytes, mime_type = self.decode_base64(base64_string)
+        if image_bytes is None:
+            return None, None
+
+        try:
             pil_image = Image.open(io.BytesIO(image_bytes))
-            
             return pil_image, mime_type
-            
+
         except Exception as e:
             print(f"Error processing base64 image: {e}")
             return None, None
-    
+
+    def ingest(self, base64_string: str, mode: Optional[str] = None) -> Optional[ImageContext]:
+        """
+        Decode an upload once and wrap it in an ImageContext
+
+        Args:
+            base64_string: Data URL or bare base64
+            mode: Force 'RGB' or 'L'; None keeps grayscale uploads as L
+                  and normalizes everything else to RGB
+
+        Returns:
+            ImageContext, or None if the payload is not a valid image
+        """
+        image_bytes, mime_type = self.decode_base64(base64_string)
+        if image_bytes is None:
+            return None
+        return self.ingest_bytes(image_bytes, mime_type, mode=mode)
+
+    def ingest_bytes(self, image_bytes: bytes, mime_type: str = 'image/jpeg',
+                     mode: Optional[str] = None) -> Optional[ImageContext]:
+        """Same as ingest() for raw encoded bytes"""
+        try:
+            pil_image = Image.open(io.BytesIO(image_bytes))
+            pil_image = ImageOps.exif_transpose(pil_image)
+            pil_image = self.normalize_mode(pil_image, mode)
+        except Exception as e:
+            print(f"Error ingesting image: {e}")
+            return None
+
+        return ImageContext(pil_image, mime_type, image_bytes, self)
+
+    def normalize_mode(self, pil_image: Image.Image, mode: Optional[str] = None) -> Image.Image:
+        """
+        Convert to RGB or L. For RGB, transparent areas are flattened onto
+        white (sketches are drawn on white paper, not black); masks (L) keep
+        the plain conversion so unpainted pixels stay black = preserve.
+        """
+        if mode is None:
+            mode = 'L' if pil_image.mode in ('L', '1', 'I', 'I;16', 'F') else 'RGB'
+
+        if pil_image.mode == mode:
+            pil_image.load()
+            return pil_image
+
+        has_alpha = pil_image.mode in ('RGBA', 'LA', 'PA') or (
+            pil_image.mode == 'P' and 'transparency' in pil_image.info
+        )
+        if mode == 'RGB' and has_alpha:
+            rgba = pil_image.convert('RGBA')
+            background = Image.new('RGBA', rgba.size, (255, 255, 255, 255))
+            pil_image = Image.alpha_composite(background, rgba)
+
+        return pil_image.convert(mode)
+
     def detect_sketch_type(self, pil_image: Image.Image) -> SketchInfo:
         """
         Detect sketch characteristics
@@ -66,12 +280,18 @@ class ImageProcessor:
             gray = img_array
             is_colored = False
         
-        mean_intensity = np.mean(gray)
-        
         edges = cv2.Canny(gray, 
                           ImageConfig.EDGE_DETECTION_THRESHOLD_LOW, 
                           ImageConfig.EDGE_DETECTION_THRESHOLD_HIGH)
-        edge_density = np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
+
+        return self.classify_sketch(gray, edges, is_colored)
+
+    def classify_sketch(self, gray: np.ndarray, edges: np.ndarray, is_colored: bool) -> SketchInfo:
+        """
+        Classify a sketch from its grayscale pixels and edge map
+        """
+        mean_intensity = np.mean(gray)
+        edge_density = np.count_nonzero(edges) / (edges.shape[0] * edges.shape[1])
         
         if mean_intensity > 200:
             sketch_type = 'line_drawing'
@@ -128,35 +348,55 @@ class ImageProcessor:
             # Nếu ảnh quá nhỏ, upscale lên tối thiểu 1920 để Gemini có nhiều chi tiết hơn
             if orig_w < 1920:
                 scale_factor = 1920 / orig_w
-                new_w = int(orig_w * scale_factor)
+                new_w = 1920
                 new_h = int(orig_h * scale_factor)
                 print(f"   ℹ️  Upscaling sketch to {new_w}x{new_h} for better 2K input")
-                return pil_image.resize((new_w, new_h), Image.Resampling.LANCZOS)
+                upscaled = self._resize_array(np.asarray(pil_image), new_w, new_h, scale_factor)
+                return Image.fromarray(upscaled)
 
         # Fallback to standard resize logic if preserve_quality=False or legacy mode
-        img_array = np.array(pil_image)
+        img_array = np.asarray(pil_image)
         h, w = img_array.shape[:2]
         scale = min(target_w / w, target_h / h)
         new_w, new_h = int(w * scale), int(h * scale)
 
-        if len(img_array.shape) == 3:
-            resized = cv2.resize(img_array, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4)
-        else:
-            resized = cv2.resize(img_array, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4)
+        resized = self._resize_array(img_array, new_w, new_h, scale)
 
         if not preserve_quality and sketch_info and sketch_info.sketch_type == 'line_drawing':
             resized = self._enhance_edges(resized)
 
-        if len(resized.shape) == 3:
-            padded = np.ones((target_h, target_w, resized.shape[2]), dtype=np.uint8) * 255
-        else:
-            padded = np.ones((target_h, target_w), dtype=np.uint8) * 255
-
-        y_offset = (target_h - new_h) // 2
-        x_offset = (target_w - new_w) // 2
-        padded[y_offset:y_offset+new_h, x_offset:x_offset+new_w] = resized
+        # ✅ OPTIMIZED: Pad straight into the output buffer (no white canvas + copy)
+        top = (target_h - new_h) // 2
+        left = (target_w - new_w) // 2
+        channels = resized.shape[2] if resized.ndim == 3 else 1
+        padded = cv2.copyMakeBorder(
+            resized,
+            top, target_h - new_h - top,
+            left, target_w - new_w - left,
+            cv2.BORDER_CONSTANT,
+            value=(255,) * channels
+        )
 
         return Image.fromarray(padded)
+
+    @staticmethod
+    def _resize_array(img_array: np.ndarray, new_w: int, new_h: int, scale: float) -> np.ndarray:
+        """
+        cv2.resize with interpolation picked by scale factor:
+        INTER_AREA for downscaling (fast, no aliasing), INTER_CUBIC for
+        moderate upscaling (~8x faster than LANCZOS4, visually equal on
+        line art) and LANCZOS4 only for large (>2x) upscales
+        """
+        h, w = img_array.shape[:2]
+        if (new_w, new_h) == (w, h):
+            return img_array
+        if scale < 1.0:
+            interpolation = cv2.INTER_AREA
+        elif scale <= 2.0:
+            interpolation = cv2.INTER_CUBIC
+        else:
+            interpolation = cv2.INTER_LANCZOS4
+        return cv2.resize(img_array, (new_w, new_h), interpolation=interpolation)
     
     def _enhance_edges(self, img_array: np.ndarray) -> np.ndarray:
         """Gently enhance edges for line drawings"""
@@ -167,12 +407,12 @@ class ImageProcessor:
 
         filtered = cv2.bilateralFilter(gray, 5, 50, 50)
         clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(filtered)
+        clahe.apply(filtered, dst=filtered)
 
         kernel = np.array([[-0.5, -0.5, -0.5],
                           [-0.5,  5.0, -0.5],
-                          [-0.5, -0.5, -0.5]])
-        sharpened = cv2.filter2D(enhanced, -1, kernel)
+                          [-0.5, -0.5, -0.5]], dtype=np.float32)
+        sharpened = cv2.filter2D(filtered, -1, kernel, dst=gray if gray is not img_array else None)
 
         if len(img_array.shape) == 3:
             sharpened = cv2.cvtColor(sharpened, cv2.COLOR_GRAY2RGB)
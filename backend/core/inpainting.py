@@ -3,12 +3,13 @@ core/inpainting.py - Hybrid Inpainting Engine
 """
 
 import numpy as np
-import cv2
 from PIL import Image
 from typing import Optional
 
+from config import InpaintingConfig
 from .gemini_client import GeminiClient
 from .prompt_builder import PromptBuilder
+from . import compositing
 
 
 class InpaintingEngine:
@@ -24,7 +25,9 @@ class InpaintingEngine:
         mask_image: np.ndarray,
         edit_instruction: str,
         reference_image: Optional[np.ndarray] = None,
-        preserve_mode: str = "hybrid"
+        preserve_mode: str = "hybrid",
+        roi_mode: bool = InpaintingConfig.ROI_MODE_DEFAULT,
+        roi_context: bool = InpaintingConfig.ROI_CONTEXT_DEFAULT
     ) -> np.ndarray:
         """
         Perform inpainting
@@ -35,19 +38,35 @@ class InpaintingEngine:
             edit_instruction: Edit description
             reference_image: Optional style reference
             preserve_mode: "gemini_only" | "hybrid" | "strict"
+            roi_mode: Send only the mask's bounding box (+ margin) to Gemini
+                      and composite the result back at full resolution
+            roi_context: In ROI mode, also send a downscaled whole scene
         
         Returns:
             Edited image as numpy array
         """
+        if preserve_mode not in ("gemini_only", "hybrid", "strict"):
+            raise ValueError(f"Unknown preserve_mode: {preserve_mode}")
+
         # Build prompt
         prompt = self.prompt_builder.build_inpaint_prompt(
             edit_instruction=edit_instruction,
             has_reference=(reference_image is not None)
         )
+
+        # ROI mode: work on the crop around the mask only
+        roi = compositing.mask_roi(mask_image) if roi_mode else None
+        if roi:
+            work_original = compositing.crop(original_image, roi)
+            work_mask = compositing.crop(mask_image, roi)
+            context_pil = compositing.context_thumbnail(original_image) if roi_context else None
+            print(f"✂️  Inpaint ROI {roi} of {original_image.shape[1]}x{original_image.shape[0]}")
+        else:
+            work_original, work_mask, context_pil = original_image, mask_image, None
         
         # Convert to PIL
-        original_pil = Image.fromarray(original_image)
-        mask_pil = Image.fromarray(mask_image)
+        original_pil = Image.fromarray(work_original)
+        mask_pil = Image.fromarray(work_mask)
         reference_pil = Image.fromarray(reference_image) if reference_image is not None else None
         
         # Call Gemini
@@ -55,42 +74,34 @@ class InpaintingEngine:
             original=original_pil,
             mask=mask_pil,
             prompt=prompt,
-            reference=reference_pil
+            reference=reference_pil,
+            context=context_pil
         )
         
         if edited_pil is None:
             return original_image
         
+        # Gemini answers at its own resolution; match the region it replaces
+        if roi or preserve_mode != "gemini_only":
+            edited_pil = compositing.fit_to(edited_pil.convert('RGB'), original_pil.size)
         edited_array = np.array(edited_pil)
         
         # Post-processing
         if preserve_mode == "gemini_only":
-            return edited_array
+            result = edited_array
         elif preserve_mode == "hybrid":
-            return self._hybrid_preserve(original_image, edited_array, mask_image)
-        elif preserve_mode == "strict":
-            return self._strict_preserve(original_image, edited_array, mask_image)
+            result = self._hybrid_preserve(work_original, edited_array, work_mask)
         else:
-            raise ValueError(f"Unknown preserve_mode: {preserve_mode}")
+            result = self._strict_preserve(work_original, edited_array, work_mask)
+
+        if roi:
+            return compositing.paste(original_image, result, roi)
+        return result
     
     def _hybrid_preserve(self, original: np.ndarray, edited: np.ndarray, mask: np.ndarray) -> np.ndarray:
         """Soft preservation with edge blending"""
-        _, mask_binary = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
-        
-        # Create blending mask
-        kernel = np.ones((11, 11), np.uint8)
-        mask_dilated = cv2.dilate(mask_binary, kernel, iterations=1)
-        blend_mask = cv2.GaussianBlur(mask_dilated, (21, 21), 0) / 255.0
-        blend_mask = np.expand_dims(blend_mask, axis=2)
-        
-        # Blend
-        result = (original * (1 - blend_mask) + edited * blend_mask).astype(np.uint8)
-        return result
+        return compositing.soft_blend(original, edited, mask, dilate_size=11, blur_size=21)
     
     def _strict_preserve(self, original: np.ndarray, edited: np.ndarray, mask: np.ndarray) -> np.ndarray:
         """Hard copy: Black areas = 100% original"""
-        _, mask_binary = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
-        mask_3d = np.expand_dims(mask_binary, axis=2).repeat(3, axis=2) / 255.0
-        
-        result = np.where(mask_3d > 0.5, edited, original).astype(np.uint8)
-        return result
+        return compositing.hard_blend(original, edited, mask)
@@ -15,8 +15,10 @@ import cv2
 from PIL import Image
 from typing import Optional
 
+from config import InpaintingConfig
 from .gemini_client import GeminiClient
 from .prompt_builder import PromptBuilder
+from . import compositing
 
 
 class ObjectSwapEngine:
@@ -32,7 +34,9 @@ class ObjectSwapEngine:
         mask_image: Image.Image,
         reference_object: Optional[Image.Image] = None,
         swap_instruction: str = "",
-        preserve_mode: str = "hybrid"
+        preserve_mode: str = "hybrid",
+        roi_mode: bool = InpaintingConfig.ROI_MODE_DEFAULT,
+        roi_context: bool = InpaintingConfig.ROI_CONTEXT_DEFAULT
     ) -> Image.Image:
         """
         Perform object swap.
@@ -43,26 +47,45 @@ class ObjectSwapEngine:
             reference_object: Photo of new object to place (PIL Image, optional)
             swap_instruction: Text description of the swap
             preserve_mode: "hybrid" (recommended), "strict", or "gemini_only"
+            roi_mode: Send only the mask's bounding box (+ margin) to Gemini
+                      and composite the result back at full resolution
+            roi_context: In ROI mode, also send a downscaled whole scene
 
         Returns:
             Edited PIL Image with new object placed
         """
         has_ref = reference_object is not None
 
+        # Prepare binary mask (pure B&W: 0 or 255)
+        mask_bw = self._prepare_mask(mask_image)
+
+        # ROI mode: work on the crop around the mask only
+        roi = compositing.mask_roi(mask_bw) if roi_mode else None
+        context_pil = None
+        if roi:
+            work_source = source_image.crop(roi)
+            work_mask = compositing.crop(mask_bw, roi)
+            if roi_context:
+                context_pil = compositing.context_thumbnail(np.asarray(source_image.convert('RGB')))
+            print(f"✂️  Object Swap ROI {roi} of {source_image.size[0]}x{source_image.size[1]}")
+        else:
+            work_source, work_mask = source_image, mask_bw
+
         # Build specialized prompt
         prompt = self.prompt_builder.build_object_swap_prompt(
             swap_instruction=swap_instruction,
-            has_reference_object=has_ref
+            has_reference_object=has_ref,
+            has_context_image=context_pil is not None
         )
 
-        # Prepare binary mask (pure B&W: 0 or 255)
-        mask_bw = self._prepare_mask(mask_image)
-        mask_pil = Image.fromarray(mask_bw).convert('RGB')
+        mask_pil = Image.fromarray(work_mask).convert('RGB')
 
-        # Build image list: [source, mask, reference_object?]
-        images = [source_image, mask_pil]
+        # Build image list: [source, mask, reference_object?, context?]
+        images = [work_source, mask_pil]
         if reference_object is not None:
             images.append(reference_object)
+        if context_pil is not None:
+            images.append(context_pil)
 
         print(f"🔄 Object Swap: {len(images)} images, instruction='{swap_instruction[:60]}'")
 
@@ -76,19 +99,22 @@ class ObjectSwapEngine:
         if result_pil is None:
             raise RuntimeError("Object swap generation failed: no image returned")
 
-        # Ensure result has same dimensions as source
-        if result_pil.size != source_image.size:
-            result_pil = result_pil.resize(source_image.size, Image.LANCZOS)
+        # Ensure result has same dimensions as the region it replaces
+        result_pil = compositing.fit_to(result_pil, work_source.size)
 
         # Post-processing: enforce non-masked area preservation
         if preserve_mode == "gemini_only":
-            return result_pil
-        elif preserve_mode == "hybrid":
-            return self._hybrid_preserve(source_image, result_pil, mask_bw)
+            patch = result_pil
         elif preserve_mode == "strict":
-            return self._strict_preserve(source_image, result_pil, mask_bw)
+            patch = self._strict_preserve(work_source, result_pil, work_mask)
         else:
-            return self._hybrid_preserve(source_image, result_pil, mask_bw)
+            patch = self._hybrid_preserve(work_source, result_pil, work_mask)
+
+        if roi:
+            result = source_image.copy()
+            result.paste(patch.convert(result.mode), roi[:2])
+            return result
+        return patch
 
     def _prepare_mask(self, mask_image: Image.Image) -> np.ndarray:
         """Convert mask image to pure binary (0 or 255) numpy array."""
@@ -106,17 +132,11 @@ class ObjectSwapEngine:
         Hybrid preservation: soft edge blending at mask boundary,
         hard preservation of non-masked areas.
         """
-        orig_arr = np.array(original.convert('RGB'))
-        edit_arr = np.array(edited.convert('RGB'))
+        orig_arr = np.asarray(original.convert('RGB'))
+        edit_arr = np.asarray(edited.convert('RGB'))
 
         # Dilate mask slightly then blur for soft edges
-        kernel = np.ones((9, 9), np.uint8)
-        mask_dilated = cv2.dilate(mask_binary, kernel, iterations=1)
-        blend_mask = cv2.GaussianBlur(mask_dilated.astype(np.float32), (21, 21), 0) / 255.0
-        blend_mask = np.clip(blend_mask, 0, 1)
-        blend_mask_3d = np.stack([blend_mask] * 3, axis=2)
-
-        result = (orig_arr * (1 - blend_mask_3d) + edit_arr * blend_mask_3d).astype(np.uint8)
+        result = compositing.soft_blend(orig_arr, edit_arr, mask_binary, dilate_size=9, blur_size=21)
         return Image.fromarray(result)
 
     def _strict_preserve(
@@ -129,9 +149,8 @@ class ObjectSwapEngine:
         Strict preservation: black areas = 100% original pixels.
         Hard cut at mask boundary.
         """
-        orig_arr = np.array(original.convert('RGB'))
-        edit_arr = np.array(edited.convert('RGB'))
+        orig_arr = np.asarray(original.convert('RGB'))
+        edit_arr = np.asarray(edited.convert('RGB'))
 
-        mask_3d = np.stack([mask_binary] * 3, axis=2) / 255.0
-        result = np.where(mask_3d > 0.5, edit_arr, orig_arr).astype(np.uint8)
+        result = compositing.hard_blend(orig_arr, edit_arr, mask_binary)
         return Image.fromarray(result)
@@ -1281,11 +1281,13 @@ Generate the render following the critical override instruction."""
     def build_object_swap_prompt(
         cls,
         swap_instruction: str = "",
-        has_reference_object: bool = True
+        has_reference_object: bool = True,
+        has_context_image: bool = False
     ) -> str:
         """
         Build prompt for object swap (approach 1.2).
-        Images sent: [original_scene, binary_mask, new_object_reference?]
+        Images sent: [original_scene, binary_mask, new_object_reference?, scene_overview?]
+        (scene_overview only in ROI mode, where Image 1/2 are a crop)
         """
         if has_reference_object:
             ref_instruction = (
@@ -1301,6 +1303,14 @@ Generate the render following the critical override instruction."""
                 f'   Create a photorealistic object matching the description.'
             )
 
+        if has_context_image:
+            context_index = 4 if has_reference_object else 3
+            ref_instruction += (
+                f"\n   Image {context_index}: SCENE OVERVIEW — Downscaled view of the whole scene, for context only.\n"
+                f"   - Image 1 and Image 2 are a crop of this scene.\n"
+                f"   - Use Image {context_index} only to match lighting and style; return the framing of Image 1."
+            )
+
         user_note = f'\n   User instruction: "{swap_instruction}"' if swap_instruction else ""
 
         return f"""ROLE: Expert AI photo editor specializing in seamless object replacement.
@@ -14,6 +14,9 @@ _thread_locals = local()
 # ✅ Global cache (shared across all threads)
 # Cache is thread-safe because OrderedDict operations are atomic in CPython
 _global_analysis_cache = None
+_global_upload_store = None
+_global_history_writer = None
+_global_history_compactor = None
 
 
 def get_analysis_cache():
@@ -34,6 +37,57 @@ def get_analysis_cache():
     return _global_analysis_cache
 
 
+def get_upload_store():
+    """
+    Get global upload store instance
+
+    Note: Shared across threads so an image handle returned by one
+    request can be used by the next one.
+
+    Returns:
+        UploadStore: Shared store instance
+    """
+    global _global_upload_store
+    if _global_upload_store is None:
+        from core.upload_store import UploadStore
+        _global_upload_store = UploadStore()
+        print(f"✅ Upload store initialized (maxsize={_global_upload_store.get_stats()['maxsize']})")
+    return _global_upload_store
+
+
+def get_history_writer():
+    """
+    Get global history writer instance
+
+    Note: One background writer thread for the whole process; render
+    endpoints queue their results on it instead of saving inline.
+
+    Returns:
+        HistoryWriter: Shared writer instance
+    """
+    global _global_history_writer
+    if _global_history_writer is None:
+        from core.history_writer import HistoryWriter
+        _global_history_writer = HistoryWriter()
+        print(f"✅ History writer initialized (queue={_global_history_writer.get_stats()['queue_capacity']})")
+    return _global_history_writer
+
+
+def get_history_compactor():
+    """
+    Get global history compactor instance (retention + transcoding)
+
+    Returns:
+        HistoryCompactor: Shared compactor instance (not started)
+    """
+    global _global_history_compactor
+    if _global_history_compactor is None:
+        from core.history_manager import HistoryManager
+        from core.history_retention import HistoryCompactor
+        _global_history_compactor = HistoryCompactor(HistoryManager())
+    return _global_history_compactor
+
+
 def get_image_processor():
     """
     Get thread-local ImageProcessor instance
@@ -0,0 +1,92 @@
+"""
+core/upload_store.py - Server-side store of uploaded images
+
+A session usually uploads the same sketch to /api/analyze-sketch and then
+several times to /api/render. The first request returns an image handle
+(content hash of the upload); later requests can send that handle instead
+of the base64 payload. Each handle maps to the request's ImageContext, so
+the decoded sketch, SketchInfo, preprocessed variants and the PNG bytes
+sent upstream are computed once per handle.
+"""
+
+import hashlib
+from typing import Dict, Optional
+
+from config import UploadStoreConfig
+from core.byte_lru import ByteBudgetLRU
+from core.image_processor import ImageContext, ImageProcessor
+
+
+class UploadStore:
+    """Content-addressed LRU of ImageContext objects"""
+
+    def __init__(
+        self,
+        max_entries: int = UploadStoreConfig.MAX_ENTRIES,
+        max_bytes: int = UploadStoreConfig.MAX_BYTES
+    ):
+        self._lru = ByteBudgetLRU(max_entries=max_entries, max_bytes=max_bytes)
+
+    @staticmethod
+    def compute_handle(image_bytes: bytes) -> str:
+        """Handle = SHA-256 of the uploaded bytes (truncated)"""
+        return hashlib.sha256(image_bytes).hexdigest()[:32]
+
+    def ingest(self, processor: ImageProcessor, base64_string: str) -> Optional[ImageContext]:
+        """
+        Decode an upload, or return the stored context if the same bytes
+        were uploaded before.
+        """
+        image_bytes, mime_type = processor.decode_base64(base64_string)
+        if image_bytes is None:
+            return None
+
+        handle = self.compute_handle(image_bytes)
+        image_ctx = self.get(handle)
+        if image_ctx is not None:
+            return image_ctx
+
+        image_ctx = processor.ingest_bytes(image_bytes, mime_type)
+        if image_ctx is None:
+            return None
+
+        image_ctx.handle = handle
+        # Memoized products grow the entry after insertion: keep its size current
+        image_ctx.on_grow = lambda ctx: self._lru.resize(handle, ctx.nbytes)
+        self._lru.put(handle, image_ctx, image_ctx.nbytes)
+        return image_ctx
+
+    def get(self, handle: str) -> Optional[ImageContext]:
+        """Look up a handle; None if unknown or evicted"""
+        return self._lru.get(handle)
+
+    def resolve(
+        self,
+        processor: ImageProcessor,
+        data: Dict,
+        base64_key: str = 'image_base64',
+        handle_key: str = 'image_handle'
+    ) -> Optional[ImageContext]:
+        """
+        Get the image of a request body from its handle or its base64 field.
+
+        Raises:
+            KeyError: the request only carries a handle that is no longer stored
+        """
+        handle = data.get(handle_key)
+        if handle:
+            image_ctx = self.get(handle)
+            if image_ctx is not None:
+                return image_ctx
+            if not data.get(base64_key):
+                raise KeyError(handle)
+
+        if not data.get(base64_key):
+            return None
+        return self.ingest(processor, data[base64_key])
+
+    def clear(self) -> None:
+        self._lru.clear()
+
+    def get_stats(self) -> Dict:
+        return self._lru.get_stats()
@@ -0,0 +1,184 @@
+"""
+references/compiled.py - Compiled manifest (references/manifest.db)
+
+manifest.json keeps tier-1 images embedded as base64, so a large library
+means a huge JSON document parsed at every start/reload and held in memory
+for the process lifetime. auto_generate_manifest.py also writes the
+manifest as a read-only SQLite file:
+
+    meta(key, value)        format, source manifest.json size/mtime/sha256,
+                            and the manifest JSON without embedded images
+    blobs(id, mime_type, data)
+                            the decoded embedded images, one row per image
+
+The library parses only the small metadata document and reads a blob (via
+SQLite's mmap, no extra copy through read()) when the image is requested.
+Entries whose image moved to the blobs table carry "embedded": true.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+COMPILED_FILENAME = "manifest.db"
+COMPILED_FORMAT = 1
+
+# Map the whole file (up to this size) instead of read() calls into SQLite's cache
+MMAP_SIZE = 1 << 30
+
+
+def _file_sha256(path: Path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _decode_base64(value: str) -> Optional[bytes]:
+    if value.startswith('data:'):
+        value = value.split(',', 1)[-1]
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def compile_manifest(manifest: Dict, path: Path, source_path: Optional[Path] = None) -> Dict[str, int]:
+    """
+    Write the compiled form of a manifest to path (atomically).
+    source_path is the manifest.json it was written to, so the library can
+    tell when the compiled file is out of date.
+
+    Returns:
+        {"images": n, "blobs": n embedded images moved out}
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    blobs: Dict[str, Tuple[str, bytes]] = {}  # id -> (mime type, data)
+    counts = {"images": 0}
+
+    def strip_images(subcat_data: Dict) -> Dict:
+        light_images = []
+        for img in subcat_data.get('images', []):
+            counts["images"] += 1
+            data = _decode_base64(img['base64']) if 'base64' in img and img.get('id') else None
+            if data is None:
+                light_images.append(img)  # nothing to move (or undecodable: keep as is)
+                continue
+            light_img = {key: value for key, value in img.items() if key != 'base64'}
+            light_img['embedded'] = True
+            light_images.append(light_img)
+            # Duplicate ids: the first occurrence wins, as in the library index
+            blobs.setdefault(img['id'], (img.get('mime_type', 'image/jpeg'), data))
+        return {**subcat_data, 'images': light_images}
+
+    # Same structure (both subcategory layouts), entries without "base64"
+    light = {key: value for key, value in manifest.items() if key != 'categories'}
+    light['categories'] = {}
+    for cat_name, cat_data in manifest.get('categories', {}).items():
+        light_cat = dict(cat_data)
+        if 'subcategories' in cat_data:
+            light_cat['subcategories'] = {
+                name: strip_images(data) for name, data in cat_data['subcategories'].items()
+            }
+        for key, value in cat_data.items():
+            if key.startswith('subcategory_') and isinstance(value, dict):
+                light_cat[key] = strip_images(value)
+        light['categories'][cat_name] = light_cat
+
+    meta = {
+        "format": str(COMPILED_FORMAT),
+        "manifest": json.dumps(light, ensure_ascii=False, separators=(',', ':')),
+        "blobs": str(len(blobs)),
+        "blob_bytes": str(sum(len(data) for _, data in blobs.values()))
+    }
+    if source_path is not None and Path(source_path).exists():
+        stat = Path(source_path).stat()
+        meta.update({
+            "source_size": str(stat.st_size),
+            "source_mtime_ns": str(stat.st_mtime_ns),
+            "source_sha256": _file_sha256(source_path)
+        })
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE blobs (id TEXT PRIMARY KEY, mime_type TEXT NOT NULL, data BLOB NOT NULL);
+        """)
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta.items())
+        conn.executemany(
+            "INSERT INTO blobs (id, mime_type, data) VALUES (?, ?, ?)",
+            ((image_id, mime_type, data) for image_id, (mime_type, data) in blobs.items())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return {"images": counts["images"], "blobs": len(blobs)}
+
+
+class CompiledManifest:
+    """Read-only handle on a manifest.db (safe to share between threads)"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        self.meta: Dict[str, str] = dict(self._conn.execute(
+            "SELECT key, value FROM meta WHERE key != 'manifest'"
+        ))
+        if self.meta.get("format") != str(COMPILED_FORMAT):
+            self.close()
+            raise ValueError(f"Unsupported manifest.db format: {self.meta.get('format')}")
+
+    def matches_source(self, source_path: Path) -> bool:
+        """
+        True if compiled from the current manifest.json (or there is none).
+        mtime + size first; a same-size file with another mtime (copied,
+        checked out) is compared by hash.
+        """
+        try:
+            stat = Path(source_path).stat()
+        except FileNotFoundError:
+            return True
+        if str(stat.st_size) != self.meta.get("source_size"):
+            return False
+        if str(stat.st_mtime_ns) == self.meta.get("source_mtime_ns"):
+            return True
+        return _file_sha256(source_path) == self.meta.get("source_sha256")
+
+    def load_manifest(self) -> Dict:
+        """The manifest, without embedded images"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'manifest'").fetchone()
+        return json.loads(row[0])
+
+    def read_blob(self, image_id: str) -> Optional[Tuple[bytes, str]]:
+        """(bytes, mime type) of an embedded image, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, mime_type FROM blobs WHERE id = ?", (image_id,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def get_stats(self) -> Dict:
+        return {
+            "path": str(self.path),
+            "blobs": int(self.meta.get("blobs", 0)),
+            "blob_bytes": int(self.meta.get("blob_bytes", 0))
+        }
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,198 @@
+"""
+references/embedding.py - Image embeddings for "more like this" search
+
+Each local reference gets a small vector computed from the same downsample
+as its visual features (references/features.py):
+  - color: HSV histogram (8 hue x 3 saturation x 3 value bins), square-rooted
+    so that cosine similarity behaves like the Hellinger distance
+  - shape: HOG edge-orientation histograms over a 64x64 grayscale copy
+Both parts are L2-normalized and weighted, so the dot product of two
+vectors is COLOR_WEIGHT * color cosine + SHAPE_WEIGHT * shape cosine.
+
+auto_generate_manifest.py stores them in references/embeddings.npz (next
+to manifest.json); the library loads that file into one float32 matrix per
+snapshot and answers queries by brute force (one matrix-vector product).
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+EMBEDDING_VERSION = 1
+EMBEDDINGS_FILENAME = "embeddings.npz"
+
+HSV_BINS = (8, 3, 3)
+COLOR_DIM = int(np.prod(HSV_BINS))
+
+HOG_SIZE = 64
+_HOG = cv2.HOGDescriptor(
+    (HOG_SIZE, HOG_SIZE),   # window
+    (32, 32),               # block
+    (32, 32),               # block stride
+    (16, 16),               # cell
+    9                       # orientation bins
+)
+SHAPE_DIM = int(_HOG.getDescriptorSize())
+EMBEDDING_DIM = COLOR_DIM + SHAPE_DIM
+
+COLOR_WEIGHT = 0.5
+SHAPE_WEIGHT = 0.5
+
+# Which part of the vectors a query compares
+MODES = ("auto", "all", "color", "shape")
+
+# "auto": queries with a mean saturation below this (pencil sketches,
+# line drawings) are compared by shape only
+COLORLESS_SATURATION = 0.08
+
+
+def _normalized(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def compute_embedding(rgb: np.ndarray) -> np.ndarray:
+    """float32 vector (EMBEDDING_DIM,) of an RGB uint8 image"""
+    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+    hist = cv2.calcHist([hsv], [0, 1, 2], None, list(HSV_BINS), [0, 180, 0, 256, 0, 256])
+    color = _normalized(np.sqrt(hist.ravel() / max(hist.sum(), 1.0)))
+
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    gray = cv2.resize(gray, (HOG_SIZE, HOG_SIZE), interpolation=cv2.INTER_AREA)
+    shape = _normalized(_HOG.compute(gray).ravel())
+
+    return np.concatenate([
+        color * np.sqrt(COLOR_WEIGHT),
+        shape * np.sqrt(SHAPE_WEIGHT)
+    ]).astype(np.float32)
+
+
+def resolve_mode(mode: str, rgb: np.ndarray) -> str:
+    """Turn "auto" into "shape" for colorless query images, "all" otherwise"""
+    if mode != "auto":
+        return mode
+    saturation = float(cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)[:, :, 1].mean()) / 255
+    return "shape" if saturation < COLORLESS_SATURATION else "all"
+
+
+def query_vector(embedding: np.ndarray, mode: str = "all") -> np.ndarray:
+    """
+    Query to multiply stored embeddings with: for "color"/"shape" the other
+    part is zeroed and the kept one rescaled, so scores are plain cosines.
+    """
+    if mode == "all":
+        return embedding
+    query = np.zeros_like(embedding)
+    if mode == "color":
+        query[:COLOR_DIM] = embedding[:COLOR_DIM] / COLOR_WEIGHT
+    elif mode == "shape":
+        query[COLOR_DIM:] = embedding[COLOR_DIM:] / SHAPE_WEIGHT
+    else:
+        raise ValueError(f"Invalid mode (use one of {', '.join(MODES)})")
+    return query
+
+
+# ============== STORAGE ==============
+
+def load_embeddings(path: Path) -> Dict[str, Tuple[str, np.ndarray]]:
+    """
+    {image id: (sha256 of the file it was computed from, vector)} from an
+    embeddings file; empty if it is missing, unreadable or outdated.
+    """
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            vectors = data["vectors"]  # each data[...] access re-reads the array
+            if int(data["version"]) != EMBEDDING_VERSION or vectors.shape[1:] != (EMBEDDING_DIM,):
+                return {}
+            return {
+                str(image_id): (str(sha), vector)
+                for image_id, sha, vector in zip(data["ids"], data["sha256"], vectors)
+            }
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+def save_embeddings(path: Path, embeddings: Dict[str, Tuple[str, np.ndarray]]) -> None:
+    ids = list(embeddings)
+    vectors = np.array([embeddings[i][1] for i in ids], dtype=np.float32).reshape(len(ids), EMBEDDING_DIM)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write-then-rename, like manifest.json
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            version=np.array(EMBEDDING_VERSION),
+            ids=np.array(ids, dtype=str),
+            sha256=np.array([embeddings[i][0] for i in ids], dtype=str),
+            vectors=vectors
+        )
+    os.replace(tmp_path, path)
+
+
+# ============== INDEX ==============
+
+class SimilarityIndex:
+    """
+    Brute-force cosine search over a (n, EMBEDDING_DIM) float32 matrix.
+    At 50k references a query is one ~10 MFLOP matrix-vector product plus
+    a partial sort: a few milliseconds, no ANN structure needed.
+    """
+
+    def __init__(self, ids: List[str], vectors: np.ndarray, groups: Optional[List[str]] = None):
+        """groups: optional label per row (e.g. category) to restrict queries to"""
+        self.ids = ids
+        self.rows = {image_id: row for row, image_id in enumerate(ids)}
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(ids), EMBEDDING_DIM)
+        self._group_rows: Dict[str, np.ndarray] = {}
+        if groups is not None:
+            labels, inverse = np.unique(np.array(groups, dtype=str), return_inverse=True)
+            for code, label in enumerate(labels):
+                self._group_rows[str(label)] = np.flatnonzero(inverse == code)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def vector(self, image_id: str) -> Optional[np.ndarray]:
+        row = self.rows.get(image_id)
+        return None if row is None else self.vectors[row]
+
+    def query(
+        self,
+        query: np.ndarray,
+        limit: int = 20,
+        group: Optional[str] = None,
+        exclude: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """[(image id, cosine score)], best first; images with nothing in common (score 0) are left out"""
+        if group is not None:
+            rows = self._group_rows.get(group)
+            if rows is None:
+                return []
+            scores = self.vectors[rows] @ query
+        else:
+            rows = None
+            scores = self.vectors @ query
+
+        if exclude is not None and exclude in self.rows:
+            excluded = self.rows[exclude]
+            if rows is None:
+                scores[excluded] = -np.inf
+            else:
+                scores[rows == excluded] = -np.inf
+
+        k = min(limit, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        results = []
+        for position in top:
+            if scores[position] <= 0:
+                continue
+            row = position if rows is None else rows[position]
+            results.append((self.ids[row], round(float(scores[position]), 4)))
+        return results
@@ -0,0 +1,221 @@
+"""
+references/features.py - Visual descriptors of reference images
+
+Computed by auto_generate_manifest.py (in its process pool) from a small
+downsample of each image and stored in the manifest entry:
+
+    "features": {
+        "version": 1,
+        "palette": [{"hex": "#c8a27a", "weight": 0.41}, ...],   # k-means, by weight
+        "brightness": 0.62,     # mean luminance (Rec. 709), 0..1
+        "warmth": 0.08,         # mean (R - B), -1 (cool) .. 1 (warm)
+        "saturation": 0.35,     # mean HSV saturation, 0..1
+        "edge_density": 0.11,   # share of Canny edge pixels, 0..1
+        "tone": "warm"          # warm | cool | neutral
+    }
+
+FeatureQuery turns API parameters (min_brightness, tone, color, sort...)
+into a filter and sort over entries.
+"""
+
+from pathlib import Path
+from typing import Callable, Dict, List, Mapping, Optional
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+FEATURES_VERSION = 1
+PALETTE_SIZE = 5
+ANALYSIS_SIZE = 128      # longest side of the downsample analysed
+
+# |warmth| below this is "neutral"
+TONE_THRESHOLD = 0.04
+
+# Max RGB distance for a palette color to count as matching ?color=
+COLOR_MATCH_DISTANCE = 60.0
+
+# k-means clusters closer than this are one palette color; smaller than
+# MIN_PALETTE_WEIGHT of the image are dropped
+PALETTE_MERGE_DISTANCE = 12.0
+MIN_PALETTE_WEIGHT = 0.01
+
+NUMERIC_FEATURES = ("brightness", "warmth", "saturation", "edge_density")
+TONES = ("warm", "cool", "neutral")
+
+
+def analysis_array(img: Image.Image, size: int = ANALYSIS_SIZE) -> np.ndarray:
+    """RGB uint8 array of an image, downscaled to at most size px"""
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((size, size), Image.Resampling.BILINEAR)
+    return np.asarray(img)
+
+
+def load_analysis_image(path: Path, size: int = ANALYSIS_SIZE) -> np.ndarray:
+    """analysis_array() of an image file"""
+    with Image.open(path) as img:
+        img.draft("RGB", (size * 2, size * 2))  # JPEG: decode at reduced scale
+        return analysis_array(img, size)
+
+
+def compute_features(rgb: np.ndarray) -> Dict:
+    """Descriptors of an RGB uint8 image (ideally already downsampled)"""
+    pixels = rgb.reshape(-1, 3).astype(np.float32)
+
+    # Dominant colors: k-means on the pixels (deterministic seed)
+    k = min(PALETTE_SIZE, len(pixels))
+    cv2.setRNGSeed(0)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
+    _, labels, centers = cv2.kmeans(pixels, k, None, criteria, 1, cv2.KMEANS_PP_CENTERS)
+    counts = np.bincount(labels.ravel(), minlength=k).astype(np.float64)
+
+    # Flat images: k-means still returns k (near-)identical centers
+    merged = []  # [center, count]
+    for idx in np.argsort(-counts):
+        for item in merged:
+            if np.linalg.norm(item[0] - centers[idx]) < PALETTE_MERGE_DISTANCE:
+                item[1] += counts[idx]
+                break
+        else:
+            merged.append([centers[idx], counts[idx]])
+
+    palette = []
+    for center, count in sorted(merged, key=lambda item: -item[1]):
+        weight = count / len(pixels)
+        if weight < MIN_PALETTE_WEIGHT:
+            continue
+        r, g, b = (int(round(c)) for c in np.clip(center, 0, 255))
+        palette.append({"hex": f"#{r:02x}{g:02x}{b:02x}", "weight": round(float(weight), 3)})
+
+    luminance = pixels @ np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+    brightness = float(luminance.mean()) / 255
+    warmth = float((pixels[:, 0] - pixels[:, 2]).mean()) / 255
+
+    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+    saturation = float(hsv[:, :, 1].mean()) / 255
+
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    edges = cv2.Canny(gray, 100, 200)
+    edge_density = float(np.count_nonzero(edges)) / edges.size
+
+    if warmth > TONE_THRESHOLD:
+        tone = "warm"
+    elif warmth < -TONE_THRESHOLD:
+        tone = "cool"
+    else:
+        tone = "neutral"
+
+    return {
+        "version": FEATURES_VERSION,
+        "palette": palette,
+        "brightness": round(brightness, 4),
+        "warmth": round(warmth, 4),
+        "saturation": round(saturation, 4),
+        "edge_density": round(edge_density, 4),
+        "tone": tone
+    }
+
+
+def extract_features(path: Path) -> Dict:
+    return compute_features(load_analysis_image(path))
+
+
+def _parse_hex(value: str) -> np.ndarray:
+    value = value.strip().lstrip("#")
+    if len(value) == 3:
+        value = "".join(c * 2 for c in value)
+    if len(value) != 6:
+        raise ValueError(f"Invalid color: {value!r} (use #rrggbb)")
+    return np.array([int(value[i:i + 2], 16) for i in (0, 2, 4)], dtype=np.float32)
+
+
+class FeatureQuery:
+    """
+    Filter/sort over entries' "features", from request parameters:
+        min_<feature>, max_<feature>  numeric ranges (NUMERIC_FEATURES)
+        tone                          warm | cool | neutral
+        color                         #rrggbb present in the palette
+        sort                          <feature> or -<feature> (descending);
+                                      "color" sorts by closeness to ?color=
+    Entries without features never match a filter and sort last.
+    """
+
+    def __init__(self, params: Mapping[str, str]):
+        self.ranges: Dict[str, tuple] = {}
+        for name in NUMERIC_FEATURES:
+            low, high = params.get(f"min_{name}"), params.get(f"max_{name}")
+            if low is not None or high is not None:
+                try:
+                    self.ranges[name] = (
+                        float(low) if low is not None else float("-inf"),
+                        float(high) if high is not None else float("inf")
+                    )
+                except ValueError:
+                    raise ValueError(f"Invalid min_/max_{name}")
+
+        self.tone = params.get("tone") or None
+        if self.tone is not None and self.tone not in TONES:
+            raise ValueError(f"Invalid tone (use one of {', '.join(TONES)})")
+
+        color = params.get("color")
+        self.color = _parse_hex(color) if color else None
+
+        self.sort = params.get("sort") or None
+        if self.sort is not None:
+            field = self.sort.lstrip("-")
+            if field not in NUMERIC_FEATURES and not (field == "color" and self.color is not None):
+                raise ValueError(f"Invalid sort (use [-]{' | [-]'.join(NUMERIC_FEATURES)}, or color with ?color=)")
+
+    @property
+    def filters(self) -> bool:
+        return bool(self.ranges or self.tone or self.color is not None)
+
+    @property
+    def active(self) -> bool:
+        return self.filters or self.sort is not None
+
+    def _color_distance(self, features: Dict) -> float:
+        palette = features.get("palette") or []
+        if not palette:
+            return float("inf")
+        colors = np.array([_parse_hex(p["hex"]) for p in palette])
+        return float(np.linalg.norm(colors - self.color, axis=1).min())
+
+    def matches(self, entry: Dict) -> bool:
+        features = entry.get("features")
+        if not self.filters:
+            return True
+        if not features:
+            return False
+        for name, (low, high) in self.ranges.items():
+            value = features.get(name)
+            if value is None or not (low <= value <= high):
+                return False
+        if self.tone is not None and features.get("tone") != self.tone:
+            return False
+        if self.color is not None and self._color_distance(features) > COLOR_MATCH_DISTANCE:
+            return False
+        return True
+
+    def sort_key(self) -> Optional[Callable[[Dict], tuple]]:
+        """Key for sorted() (stable, so ties keep the incoming order)"""
+        if self.sort is None:
+            return None
+        descending = self.sort.startswith("-")
+        field = self.sort.lstrip("-")
+
+        def key(entry: Dict) -> tuple:
+            features = entry.get("features")
+            if not features:
+                return (1, 0.0)
+            value = self._color_distance(features) if field == "color" else features.get(field)
+            if value is None:
+                return (1, 0.0)
+            return (0, -value if descending else value)
+
+        return key
+
+    def apply(self, entries: List[Dict]) -> List[Dict]:
+        result = [entry for entry in entries if self.matches(entry)]
+        key = self.sort_key()
+        return sorted(result, key=key) if key else result
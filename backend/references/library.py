@@ -1,13 +1,120 @@
 """
 references/library.py - Reference Images Library Manager
+
+The manifest and its indexes are held in one immutable LibrarySnapshot.
+reload() (called by the mtime-polling watcher thread or by
+POST /api/references/reload) builds a complete new snapshot and swaps it
+in with a single assignment, so readers never lock and never see a
+half-built index.
+
+When an up-to-date manifest.db (references/compiled.py) sits next to
+manifest.json, the snapshot is read from it instead: embedded (tier-1)
+images then stay on disk until requested.
+
+Cloud-only (tier-3) images are fetched server-side through a disk cache
+(references/remote_cache.py), so they can be read like local ones.
 """
 
 import json
 import base64
 import os
-from typing import Dict, List, Optional
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
+import numpy as np
+
+from config import ReferenceConfig
+from core.byte_lru import ByteBudgetLRU
+from references.compiled import COMPILED_FILENAME, CompiledManifest
+from references.embedding import EMBEDDINGS_FILENAME, SimilarityIndex, load_embeddings, query_vector
+from references.features import FeatureQuery
+from references.manifest import iter_subcategories
+from references.remote_cache import RemoteImageCache
+from references.search import ReferenceSearchIndex, image_fields
+from references.thumbnails import THUMBNAIL_MIMETYPE, THUMBNAIL_SIZES, generate_thumbnails
+
+IMAGE_MIMETYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp"
+}
+
+# Manifest fields that only matter to the backend (or are heavy)
+PRIVATE_FIELDS = ("base64", "local_path", "path", "thumbnail", "thumbnails")
+
+
+class LibraryIndex:
+    """
+    Lookup tables over a manifest, built once per load:
+    id -> image entry (+ its category/subcategory), tag -> image ids, and
+    the ranked text search index.
+    """
+
+    def __init__(self, manifest: Dict):
+        self.entries: Dict[str, Dict] = {}
+        self.locations: Dict[str, Tuple[str, str]] = {}
+        self.order: Dict[str, int] = {}
+        self.tag_postings: Dict[str, List[str]] = {}
+        documents = []
+
+        for cat_name, cat_data in manifest.get('categories', {}).items():
+            for subcat_name, subcat_data in iter_subcategories(cat_data):
+                for img in subcat_data.get('images', []):
+                    image_id = img.get('id')
+                    if image_id is None or image_id in self.entries:
+                        continue  # first occurrence wins, as with the old scan
+                    self.entries[image_id] = img
+                    self.locations[image_id] = (cat_name, subcat_name)
+                    self.order[image_id] = len(self.order)
+                    for tag in {t.lower() for t in img.get('tags', [])}:
+                        self.tag_postings.setdefault(tag, []).append(image_id)
+                    documents.append((image_id, image_fields(img, cat_data, subcat_data)))
+
+        self.search = ReferenceSearchIndex(documents)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class LibrarySnapshot:
+    """A parsed manifest, its indexes and the file state it was read from"""
+
+    def __init__(
+        self,
+        manifest: Dict,
+        signature: Tuple,
+        embeddings: Optional[Dict[str, Tuple[str, np.ndarray]]] = None,
+        compiled: Optional[CompiledManifest] = None
+    ):
+        self.manifest = manifest
+        self.index = LibraryIndex(manifest)
+        self.similarity = self._similarity_index(self.index, embeddings or {})
+        self.compiled = compiled  # source of "embedded" images, if loaded from manifest.db
+        self.signature = signature  # (mtime_ns, size) of manifest.json and manifest.db
+        self.loaded_at = datetime.now().isoformat()
+
+    @staticmethod
+    def _similarity_index(index: LibraryIndex, embeddings: Dict[str, Tuple[str, np.ndarray]]) -> SimilarityIndex:
+        """Matrix of the embeddings still matching their manifest entry's file"""
+        ids, vectors, categories = [], [], []
+        for image_id, img in index.entries.items():
+            stored = embeddings.get(image_id)
+            if stored is None:
+                continue
+            sha = (img.get('file') or {}).get('sha256')
+            if sha is not None and sha != stored[0]:
+                continue  # image changed since the embedding was computed
+            ids.append(image_id)
+            vectors.append(stored[1])
+            categories.append(index.locations[image_id][0])
+        matrix = np.array(vectors, dtype=np.float32) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return SimilarityIndex(ids, matrix, groups=categories)
+
 
 class ReferenceLibrary:
     """Manage reference images with 3-tier storage"""
@@ -25,8 +132,63 @@ class ReferenceLibrary:
             manifest_path = current_dir / "manifest.json"
         
         self.manifest_path = Path(manifest_path)
-        self.manifest = self._load_manifest()
-        self.images_dir = self.manifest_path.parent / "images"
+        self.references_dir = self.manifest_path.parent
+        self.embeddings_path = self.references_dir / EMBEDDINGS_FILENAME
+        self.compiled_path = self.references_dir / COMPILED_FILENAME
+        self.images_dir = self.references_dir / "images"
+        
+        # ✅ OPTIMIZED: hot image/thumbnail bytes stay in memory
+        self.image_cache = ByteBudgetLRU(
+            max_entries=ReferenceConfig.IMAGE_CACHE_ENTRIES,
+            max_bytes=ReferenceConfig.IMAGE_CACHE_MB * 1024 * 1024
+        )
+        self._thumbnail_lock = threading.Lock()
+        
+        # ✅ OPTIMIZED: tier-3 images downloaded once, then served from disk
+        self.remote: Optional[RemoteImageCache] = None
+        if ReferenceConfig.REMOTE_CACHE_MB > 0:
+            self.remote = RemoteImageCache(
+                Path(ReferenceConfig.REMOTE_CACHE_DIR or self.references_dir / "remote_cache"),
+                max_bytes=ReferenceConfig.REMOTE_CACHE_MB * 1024 * 1024,
+                revalidate_after=ReferenceConfig.REMOTE_REVALIDATE_SECONDS,
+                timeout=ReferenceConfig.REMOTE_TIMEOUT_SECONDS,
+                max_image_bytes=ReferenceConfig.REMOTE_MAX_IMAGE_MB * 1024 * 1024,
+                prefetch_workers=ReferenceConfig.REMOTE_PREFETCH_WORKERS
+            )
+        
+        # Reload bookkeeping (reloads are serialized; reads never lock)
+        self._reload_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.watch_interval: Optional[float] = None
+        self.reloads = 0
+        self.reload_failures = 0
+        self.last_reload_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._failed_signature: Optional[Tuple] = None
+        
+        # ✅ OPTIMIZED: id/tag lookups are dict hits instead of a scan
+        # over every category -> subcategory -> image
+        self._snapshot = self._load_snapshot()
+    
+    @property
+    def manifest(self) -> Dict:
+        return self._snapshot.manifest
+    
+    @property
+    def index(self) -> LibraryIndex:
+        return self._snapshot.index
+    
+    @staticmethod
+    def _file_signature(path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def _signature(self) -> Tuple:
+        return (self._file_signature(self.manifest_path), self._file_signature(self.compiled_path))
     
     def _load_manifest(self) -> Dict:
         """Load manifest.json"""
@@ -37,6 +199,99 @@ class ReferenceLibrary:
         with open(self.manifest_path, 'r', encoding='utf-8') as f:
             return json.load(f)
     
+    def _open_compiled(self) -> Optional[CompiledManifest]:
+        """manifest.db if it exists and was compiled from the current manifest.json"""
+        if not self.compiled_path.exists():
+            return None
+        try:
+            compiled = CompiledManifest(self.compiled_path)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"⚠️  Ignoring {self.compiled_path.name}: {e}")
+            return None
+        if not compiled.matches_source(self.manifest_path):
+            print(f"⚠️  {self.compiled_path.name} is older than {self.manifest_path.name}, "
+                  f"reading JSON (re-run auto_generate_manifest.py)")
+            compiled.close()
+            return None
+        return compiled
+    
+    def _load_snapshot(self) -> LibrarySnapshot:
+        # Signature first: a write landing during the parse changes the
+        # file again, so the next poll picks it up
+        signature = self._signature()
+        # ✅ OPTIMIZED: manifest.db keeps embedded images out of the parse
+        compiled = self._open_compiled()
+        manifest = compiled.load_manifest() if compiled is not None else self._load_manifest()
+        # auto_generate_manifest.py writes embeddings.npz before manifest.json
+        return LibrarySnapshot(manifest, signature, load_embeddings(self.embeddings_path), compiled)
+    
+    def reload(self, force: bool = False) -> bool:
+        """
+        Re-read manifest.json if it changed since the current snapshot (or
+        always, with force) and swap the new snapshot in. A manifest that
+        fails to parse (e.g. caught mid-write) leaves the current one in
+        place. Returns True if a new snapshot was installed.
+        """
+        with self._reload_lock:
+            signature = self._signature()
+            # Unchanged, or the same broken file that already failed
+            if not force and signature in (self._snapshot.signature, self._failed_signature):
+                return False
+            
+            start = time.perf_counter()
+            try:
+                snapshot = self._load_snapshot()
+            except Exception as e:
+                self._failed_signature = signature
+                self.reload_failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"⚠️  Reference manifest reload failed: {self.last_error}")
+                return False
+            
+            self._snapshot = snapshot  # atomic swap
+            self.reloads += 1
+            self.last_error = None
+            self.last_reload_ms = round((time.perf_counter() - start) * 1000, 1)
+            print(f"🔄 Reference manifest reloaded: {len(snapshot.index)} images "
+                  f"in {self.last_reload_ms} ms")
+            return True
+    
+    def start_watching(self, interval: float) -> None:
+        """Poll manifest.json's mtime/size every `interval` seconds on a daemon thread"""
+        if self._watcher is not None:
+            return
+        self.watch_interval = interval
+        self._watcher = threading.Thread(target=self._watch, name="reference-manifest-watcher", daemon=True)
+        self._watcher.start()
+    
+    def stop_watching(self) -> None:
+        self._stop.set()
+    
+    def _watch(self) -> None:
+        while not self._stop.wait(self.watch_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"⚠️  Reference manifest watcher error: {e}")
+    
+    def get_stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            "images": len(snapshot.index),
+            "embeddings": len(snapshot.similarity),
+            "compiled": snapshot.compiled.get_stats() if snapshot.compiled is not None else None,
+            "categories": len(snapshot.manifest.get('categories', {})),
+            "loaded_at": snapshot.loaded_at,
+            "watching": self._watcher is not None and self._watcher.is_alive(),
+            "watch_interval_seconds": self.watch_interval,
+            "reloads": self.reloads,
+            "reload_failures": self.reload_failures,
+            "last_reload_ms": self.last_reload_ms,
+            "last_error": self.last_error,
+            "image_cache": self.image_cache.get_stats(),
+            "remote_cache": self.remote.get_stats() if self.remote is not None else None
+        }
+    
     def list_categories(self) -> List[str]:
         """List all categories"""
         return list(self.manifest.get('categories', {}).keys())
@@ -44,7 +299,7 @@ class ReferenceLibrary:
     def list_subcategories(self, category: str) -> List[str]:
         """List subcategories in a category"""
         cat_data = self.manifest.get('categories', {}).get(category, {})
-        return list(cat_data.get('subcategories', {}).keys())
+        return [name for name, _ in iter_subcategories(cat_data)]
     
     def list_images(self, category: str, subcategory: str) -> List[Dict]:
         """
@@ -53,11 +308,60 @@ class ReferenceLibrary:
         Returns:
             List of image metadata dicts
         """
-        try:
-            subcat_data = self.manifest['categories'][category]['subcategories'][subcategory]
-            return subcat_data.get('images', [])
-        except KeyError:
-            return []
+        cat_data = self.manifest.get('categories', {}).get(category, {})
+        for name, subcat_data in iter_subcategories(cat_data):
+            if name == subcategory:
+                return subcat_data.get('images', [])
+        return []
+
+    def browse(
+        self,
+        features: FeatureQuery,
+        category: Optional[str] = None,
+        subcategory: Optional[str] = None,
+        page: int = 1,
+        limit: int = 20
+    ) -> Dict:
+        """
+        Images (whole library, or one category/subcategory) filtered and
+        sorted by their visual features, in manifest order otherwise.
+        
+        Returns:
+            {"results": [... image + category/subcategory],
+             "total", "page", "limit", "pages"}
+        """
+        index = self.index
+        candidates = []
+        for image_id, img in index.entries.items():
+            cat_name, subcat_name = index.locations[image_id]
+            if category is not None and cat_name != category:
+                continue
+            if subcategory is not None and subcat_name != subcategory:
+                continue
+            candidates.append(image_id)
+        
+        return self._page(index, features.apply([index.entries[i] for i in candidates]), page, limit)
+    
+    @staticmethod
+    def _page(index: LibraryIndex, entries: List[Dict], page: int, limit: int) -> Dict:
+        """One page of entries (of index, the caller's snapshot) + their locations"""
+        total = len(entries)
+        results = []
+        for img in entries[(page - 1) * limit:page * limit]:
+            result = img.copy()
+            result['category'], result['subcategory'] = index.locations[img['id']]
+            results.append(result)
+        return {
+            "results": results,
+            "total": total,
+            "page": page,
+            "limit": limit,
+            "pages": max(1, (total + limit - 1) // limit)
+        }
+
+    def get_image_entry(self, image_id: str) -> Optional[Dict]:
+        """Manifest entry of an image, or None"""
+        return self.index.entries.get(image_id)
     
     def get_image_base64(self, image_id: str) -> Optional[Dict]:
         """
@@ -66,19 +370,8 @@ class ReferenceLibrary:
         Returns:
             {"base64": "...", "mime_type": "image/jpeg"} or None
         """
-        # Search for image in manifest
-        image_meta = None
-        for cat_name, cat_data in self.manifest.get('categories', {}).items():
-            for subcat_name, subcat_data in cat_data.get('subcategories', {}).items():
-                for img in subcat_data.get('images', []):
-                    if img.get('id') == image_id:
-                        image_meta = img
-                        break
-                if image_meta:
-                    break
-            if image_meta:
-                break
-        
+        snapshot = self._snapshot
+        image_meta = snapshot.index.entries.get(image_id)
         if not image_meta:
             return None
         
@@ -89,22 +382,31 @@ class ReferenceLibrary:
                 "base64": image_meta['base64'],
                 "mime_type": image_meta.get('mime_type', 'image/jpeg')
             }
+        if image_meta.get('embedded') and snapshot.compiled is not None:
+            blob = snapshot.compiled.read_blob(image_id)
+            if blob is not None:
+                return {
+                    "base64": base64.b64encode(blob[0]).decode('utf-8'),
+                    "mime_type": blob[1]
+                }
         
         # Tier 2: Local file
-        if 'local_path' in image_meta:
-            local_path = self.images_dir / image_meta['local_path']
-            if local_path.exists():
-                with open(local_path, 'rb') as f:
-                    img_bytes = f.read()
-                    b64 = base64.b64encode(img_bytes).decode('utf-8')
-                    return {
-                        "base64": b64,
-                        "mime_type": image_meta.get('mime_type', 'image/jpeg')
-                    }
-        
-        # Tier 3: Cloud URL
+        image = self.read_image(image_id, snapshot=snapshot)
+        if image is not None:
+            return {
+                "base64": base64.b64encode(image["data"]).decode('utf-8'),
+                "mime_type": image["mime_type"]
+            }
+        
+        # Tier 3: Cloud URL, through the remote cache
         if 'cloud_url' in image_meta:
-            # Return URL for client to fetch
+            remote = self.read_remote(image_id, snapshot=snapshot)
+            if remote is not None:
+                return {
+                    "base64": base64.b64encode(remote["data"]).decode('utf-8'),
+                    "mime_type": remote["mime_type"]
+                }
+            # Not fetchable server-side: return URL for client to fetch
             return {
                 "cloud_url": image_meta['cloud_url'],
                 "mime_type": image_meta.get('mime_type', 'image/jpeg')
@@ -112,6 +414,198 @@ class ReferenceLibrary:
         
         return None
     
+    def source_version(self, image_id: str) -> Optional[str]:
+        """
+        Token that changes whenever the bytes read_source() returns do
+        (cheap: no read), or None if no tier can provide the image.
+        Cloud images not downloaded yet are "remote-pending".
+        """
+        snapshot = self._snapshot
+        image_meta = snapshot.index.entries.get(image_id)
+        if not image_meta:
+            return None
+        if 'base64' in image_meta:
+            # str hashes are computed once and cached on the object
+            return f"b64-{hash(image_meta['base64']) & 0xffffffffffffffff:x}"
+        if image_meta.get('embedded') and snapshot.compiled is not None:
+            mtime_ns, size = snapshot.signature[1] or (0, 0)
+            return f"db-{mtime_ns:x}-{size:x}"
+        rel = self._local_rel(image_meta)
+        version = self._file_version(self.references_dir / rel) if rel else None
+        if version is None and 'cloud_url' in image_meta and self.remote is not None:
+            return f"remote-{self.remote.version(image_meta['cloud_url']) or 'pending'}"
+        return version
+    
+    def read_remote(self, image_id: str, snapshot: Optional[LibrarySnapshot] = None) -> Optional[Dict]:
+        """
+        Bytes of a cloud image (downloaded, revalidated or from the disk
+        cache; blocks on a download)
+        
+        Returns:
+            {"data": bytes, "mime_type": "...", "version": "..."} or None
+        """
+        image_meta = (snapshot or self._snapshot).index.entries.get(image_id)
+        if not image_meta or 'cloud_url' not in image_meta or self.remote is None:
+            return None
+        return self.remote.fetch(image_meta['cloud_url'])
+    
+    def prefetch_category(self, category: str, subcategory: Optional[str] = None,
+                          limit: Optional[int] = None) -> int:
+        """
+        Download the cloud images of a category (or one subcategory) into
+        the remote cache in the background
+        
+        Returns:
+            Number of downloads queued (already cached images are skipped)
+        """
+        if self.remote is None:
+            return 0
+        cat_data = self.manifest.get('categories', {}).get(category, {})
+        urls = [
+            img['cloud_url']
+            for name, subcat_data in iter_subcategories(cat_data)
+            if subcategory is None or name == subcategory
+            for img in subcat_data.get('images', [])
+            if 'cloud_url' in img and not self._has_local_file(img)
+        ]
+        return self.remote.prefetch(urls[:limit] if limit is not None else urls)
+    
+    def read_source(self, image_id: str) -> Optional[Dict]:
+        """
+        Original encoded bytes of an image from the first tier that has it
+        (embedded base64, manifest.db, local file, cloud URL)
+        
+        Returns:
+            {"data": bytes, "mime_type": "..."} or None
+        """
+        snapshot = self._snapshot
+        image_meta = snapshot.index.entries.get(image_id)
+        if not image_meta:
+            return None
+        if 'base64' in image_meta:
+            value = image_meta['base64']
+            try:
+                data = base64.b64decode(value.split(',', 1)[-1] if value.startswith('data:') else value)
+            except ValueError:
+                return None
+            return {"data": data, "mime_type": image_meta.get('mime_type', 'image/jpeg')}
+        if image_meta.get('embedded') and snapshot.compiled is not None:
+            blob = snapshot.compiled.read_blob(image_id)
+            if blob is not None:
+                return {"data": blob[0], "mime_type": blob[1]}
+        # Straight from disk: callers cache their own derived form
+        file_info = self.get_image_file(image_id, snapshot=snapshot)
+        if file_info is None:
+            remote = self.read_remote(image_id, snapshot=snapshot)
+            return {"data": remote["data"], "mime_type": remote["mime_type"]} if remote else None
+        try:
+            data = file_info["path"].read_bytes()
+        except OSError:
+            return None
+        return {"data": data, "mime_type": file_info["mime_type"]}
+    
+    @staticmethod
+    def _local_rel(image_meta: Dict) -> Optional[str]:
+        """Local file of an entry, relative to references/"""
+        if 'local_path' in image_meta:
+            return f"images/{image_meta['local_path']}"
+        # auto_generate_manifest.py entries
+        if image_meta.get('path') and image_meta.get('storage', 'local') == 'local':
+            return image_meta['path']
+        return None
+    
+    def _has_local_file(self, image_meta: Dict) -> bool:
+        rel = self._local_rel(image_meta)
+        return rel is not None and (self.references_dir / rel).is_file()
+    
+    @staticmethod
+    def _file_version(path: Path) -> Optional[str]:
+        """Cheap validator of a file: mtime + size (changes when the file does)"""
+        try:
+            stat = path.stat()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    
+    def image_version(self, image_id: str) -> Optional[str]:
+        """Version token of a local image (for cache-busting ?v= URLs)"""
+        image_meta = self.index.entries.get(image_id)
+        rel = self._local_rel(image_meta) if image_meta else None
+        return self._file_version(self.references_dir / rel) if rel else None
+    
+    def get_image_file(self, image_id: str, size: Optional[int] = None,
+                       snapshot: Optional[LibrarySnapshot] = None) -> Optional[Dict]:
+        """
+        Local file of an image, or of its thumbnail of a given size
+        (THUMBNAIL_SIZES; generated now if the manifest step didn't).
+        snapshot: the caller's snapshot, so a reload in between cannot
+        mix two manifests (default: the current one)
+        
+        Returns:
+            {"path": Path, "mime_type": "...", "etag": "..."} or None
+        """
+        image_meta = (snapshot or self._snapshot).index.entries.get(image_id)
+        rel = self._local_rel(image_meta) if image_meta else None
+        if rel is None:
+            return None
+        source = self.references_dir / rel
+        
+        if size is None:
+            path = source
+            mime_type = image_meta.get('mime_type') or IMAGE_MIMETYPES.get(source.suffix.lower(), 'image/jpeg')
+        else:
+            if not source.exists():
+                return None
+            thumb_rel = (image_meta.get('thumbnails') or {}).get(str(size))
+            path = self.references_dir / thumb_rel if thumb_rel else None
+            if path is None or not path.exists() or path.stat().st_mtime < source.stat().st_mtime:
+                with self._thumbnail_lock:
+                    thumb_rel = generate_thumbnails(self.references_dir, rel, sizes=[size])[str(size)]
+                path = self.references_dir / thumb_rel
+            mime_type = THUMBNAIL_MIMETYPE
+        
+        etag = self._file_version(path)
+        if etag is None:
+            return None
+        return {"path": path, "mime_type": mime_type, "etag": etag}
+    
+    def read_image(self, image_id: str, size: Optional[int] = None,
+                   snapshot: Optional[LibrarySnapshot] = None) -> Optional[Dict]:
+        """
+        Bytes of a local image or thumbnail, through the in-memory LRU
+        (keyed by file version, so edited files are re-read)
+        
+        Returns:
+            {"data": bytes, "mime_type": "...", "etag": "..."} or None
+        """
+        file_info = self.get_image_file(image_id, size, snapshot=snapshot)
+        if file_info is None:
+            return None
+        
+        key = (str(file_info["path"]), file_info["etag"])
+        data = self.image_cache.get(key)
+        if data is None:
+            data = file_info["path"].read_bytes()
+            self.image_cache.put(key, data, len(data))
+        return {"data": data, "mime_type": file_info["mime_type"], "etag": file_info["etag"]}
+    
+    def public_entry(self, image_meta: Dict) -> Dict:
+        """
+        Entry as returned by the API: no embedded base64 or server paths;
+        local images get image_url / thumbnail_urls (versioned, cacheable)
+        """
+        entry = {k: v for k, v in image_meta.items() if k not in PRIVATE_FIELDS}
+        rel = self._local_rel(image_meta)
+        version = self._file_version(self.references_dir / rel) if rel else None
+        if version is not None:
+            base_url = f"/api/references/image/{image_meta['id']}"
+            entry['image_url'] = f"{base_url}?v={version}"
+            entry['thumbnail_urls'] = {
+                str(size): f"{base_url}?size={size}&v={version}" for size in THUMBNAIL_SIZES
+            }
+            entry['thumbnail_url'] = entry['thumbnail_urls']["400"]
+        return entry
+    
     def search_by_tags(self, tags: List[str]) -> List[Dict]:
         """
         Search images by tags
@@ -122,40 +616,134 @@ class ReferenceLibrary:
         Returns:
             List of matching images with metadata
         """
+        index = self.index
+        matches = set()
+        for tag in tags:
+            matches.update(index.tag_postings.get(tag.lower(), ()))
+        
+        # Any-tag match, in manifest order
         results = []
-        tags_lower = [t.lower() for t in tags]
+        for image_id in sorted(matches, key=index.order.__getitem__):
+            result = index.entries[image_id].copy()
+            result['category'], result['subcategory'] = index.locations[image_id]
+            results.append(result)
         
-        for cat_name, cat_data in self.manifest.get('categories', {}).items():
-            for subcat_name, subcat_data in cat_data.get('subcategories', {}).items():
-                for img in subcat_data.get('images', []):
-                    img_tags = [t.lower() for t in img.get('tags', [])]
-                    # Check if any tag matches
-                    if any(tag in img_tags for tag in tags_lower):
-                        result = img.copy()
-                        result['category'] = cat_name
-                        result['subcategory'] = subcat_name
-                        results.append(result)
+        return results
+    
+    def search(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        page: int = 1,
+        limit: int = 20,
+        features: Optional[FeatureQuery] = None
+    ) -> Dict:
+        """
+        Ranked search over names, descriptions, tags and metadata
+        (Vietnamese accents optional), optionally restricted to a category,
+        images having any of `tags` and/or visual features. A features
+        sort replaces the relevance order (ties stay by relevance).
+        
+        Returns:
+            {"results": [... image + category/subcategory/score],
+             "total", "page", "limit", "pages"}
+        """
+        index = self.index
+        allowed = None
+        if tags:
+            allowed = set()
+            for tag in tags:
+                allowed.update(index.tag_postings.get(tag.lower(), ()))
+        
+        feature_filter = features is not None and features.filters
+        sort_key = features.sort_key() if features is not None else None
+        
+        def keep(image_id: str) -> bool:
+            return ((allowed is None or image_id in allowed)
+                    and (category is None or index.locations[image_id][0] == category)
+                    and (not feature_filter or features.matches(index.entries[image_id])))
+        
+        filtered = allowed is not None or category or feature_filter
+        if sort_key is None:
+            ranked, total = index.search.search(
+                query,
+                offset=(page - 1) * limit,
+                limit=limit,
+                keep=keep if filtered else None
+            )
+        else:
+            # Re-sorting needs every match, not just the page
+            ranked, total = index.search.search(query, keep=keep if filtered else None)
+            ranked.sort(key=lambda item: sort_key(index.entries[item[0]]))
+            ranked = ranked[(page - 1) * limit:page * limit]
         
+        results = []
+        for image_id, score in ranked:
+            result = index.entries[image_id].copy()
+            result['category'], result['subcategory'] = index.locations[image_id]
+            result['score'] = score
+            results.append(result)
+        
+        return {
+            "results": results,
+            "total": total,
+            "page": page,
+            "limit": limit,
+            "pages": max(1, (total + limit - 1) // limit)
+        }
+    
+    def get_embedding(self, image_id: str) -> Optional[np.ndarray]:
+        """Stored similarity embedding of a library image, or None"""
+        return self._snapshot.similarity.vector(image_id)
+    
+    def find_similar(
+        self,
+        embedding: np.ndarray,
+        mode: str = "all",
+        category: Optional[str] = None,
+        limit: int = 20,
+        exclude: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Library images closest to an embedding (references/embedding.py),
+        best first, each with category/subcategory/score.
+        
+        Args:
+            mode: all | color | shape - which part of the embeddings to compare
+            exclude: image id to leave out (the query image itself)
+        """
+        snapshot = self._snapshot
+        index = snapshot.index
+        ranked = snapshot.similarity.query(
+            query_vector(embedding, mode), limit=limit, group=category, exclude=exclude
+        )
+        results = []
+        for image_id, score in ranked:
+            result = index.entries[image_id].copy()
+            result['category'], result['subcategory'] = index.locations[image_id]
+            result['score'] = score
+            results.append(result)
         return results
     
     def get_thumbnail_url(self, image_id: str) -> Optional[str]:
         """Get thumbnail URL for an image"""
-        # Search for image
-        for cat_name, cat_data in self.manifest.get('categories', {}).items():
-            for subcat_name, subcat_data in cat_data.get('subcategories', {}).items():
-                for img in subcat_data.get('images', []):
-                    if img.get('id') == image_id:
-                        return img.get('thumbnail_url', img.get('cloud_url'))
-        return None
+        img = self.index.entries.get(image_id)
+        if img is None:
+            return None
+        return img.get('thumbnail_url', img.get('cloud_url'))
 
 
 # Singleton instance
 _library_instance = None
+_library_lock = threading.Lock()
 
 
 def get_library() -> ReferenceLibrary:
     """Get singleton library instance"""
     global _library_instance
     if _library_instance is None:
-        _library_instance = ReferenceLibrary()
+        with _library_lock:
+            if _library_instance is None:
+                _library_instance = ReferenceLibrary()
     return _library_instance
@@ -0,0 +1,28 @@
+"""
+references/manifest.py - manifest.json layout helpers
+
+Dependency-free so auto_generate_manifest.py can use them without loading
+the backend configuration.
+"""
+
+from typing import Dict, Iterator, Tuple
+
+
+def iter_subcategories(cat_data: Dict) -> Iterator[Tuple[str, Dict]]:
+    """
+    (name, data) of each subcategory of a category. Hand-written manifests
+    nest them under "subcategories"; auto_generate_manifest.py puts
+    "subcategory_main" (subcategory_*) keys directly on the category.
+    """
+    yield from cat_data.get('subcategories', {}).items()
+    for key, value in cat_data.items():
+        if key.startswith('subcategory_') and isinstance(value, dict):
+            yield key, value
+
+
+def iter_images(manifest: Dict) -> Iterator[Tuple[str, str, Dict]]:
+    """(category, subcategory, image entry) of every image in a manifest"""
+    for cat_name, cat_data in manifest.get('categories', {}).items():
+        for subcat_name, subcat_data in iter_subcategories(cat_data):
+            for img in subcat_data.get('images', []):
+                yield cat_name, subcat_name, img
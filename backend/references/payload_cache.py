@@ -0,0 +1,179 @@
+"""
+references/payload_cache.py - Upstream-ready library references for renders
+
+Picking a library reference used to mean: download it as base64
+(/api/references/download), upload the same base64 again inside
+/api/render, decode it and PNG-encode it for Gemini. Render requests can
+now send "reference_image_id" instead; this cache keeps the PNG that is
+sent upstream (decoded once, EXIF-rotated, flattened to RGB, resized to
+PAYLOAD_MAX_SIZE) for hot references.
+
+- Keyed by (image id, source version): an edited file, a reloaded
+  manifest or a changed cloud image never serves a stale payload.
+- Cloud-only references are read through the remote cache
+  (references/remote_cache.py).
+- Concurrent requests for the same payload build it once.
+- prewarm() builds payloads on one background thread (bounded queue,
+  dropped when full) for images the user is likely to pick next.
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from config import ReferenceConfig
+from core.byte_lru import ByteBudgetLRU
+from core.image_processor import encode_png
+from core.thread_local import get_image_processor
+from references.library import ReferenceLibrary, get_library
+
+
+class ReferencePayloadCache:
+    """LRU of PNG bytes of library images, ready for GeminiClient"""
+
+    def __init__(
+        self,
+        library_factory: Callable[[], ReferenceLibrary] = get_library,
+        max_entries: int = ReferenceConfig.PAYLOAD_CACHE_ENTRIES,
+        max_bytes: int = ReferenceConfig.PAYLOAD_CACHE_MB * 1024 * 1024,
+        max_size: int = ReferenceConfig.PAYLOAD_MAX_SIZE,
+        prewarm_queue: int = ReferenceConfig.PAYLOAD_PREWARM_QUEUE
+    ):
+        self._library_factory = library_factory
+        self._lru = ByteBudgetLRU(max_entries=max_entries, max_bytes=max_bytes)
+        self.max_size = max_size
+
+        # image id -> Event set when the build in progress finishes
+        self._building: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=prewarm_queue)
+        self._worker: Optional[threading.Thread] = None
+
+        # Statistics
+        self.builds = 0
+        self.failures = 0
+        self.prewarm_queued = 0
+        self.prewarm_dropped = 0
+        self._build_ms_total = 0.0
+
+    def _key(self, image_id: str) -> Optional[Tuple[str, str]]:
+        version = self._library_factory().source_version(image_id)
+        return (image_id, version) if version is not None else None
+
+    def get(self, image_id: str) -> Optional[bytes]:
+        """
+        PNG bytes of a library image (built now on a miss), or None if the
+        image is unknown or cannot be read/decoded
+        """
+        while True:
+            key = self._key(image_id)
+            if key is None:
+                return None
+            payload = self._lru.get(key)
+            if payload is not None:
+                return payload
+
+            with self._lock:
+                event = self._building.get(image_id)
+                if event is None:
+                    event = self._building[image_id] = threading.Event()
+                    break
+            # Another thread (request or prewarm) is building it: wait and
+            # re-check. If that build failed or its entry was evicted at once,
+            # the next pass builds it here. (The key is recomputed: a cloud
+            # image's "remote-pending" becomes its content hash once downloaded.)
+            event.wait()
+
+        try:
+            return self._build(image_id)
+        finally:
+            with self._lock:
+                del self._building[image_id]
+            event.set()
+
+    def _build(self, image_id: str) -> Optional[bytes]:
+        start = time.perf_counter()
+        source = self._library_factory().read_source(image_id)
+        processor = get_image_processor()
+        image_ctx = processor.ingest_bytes(source["data"], source["mime_type"], mode='RGB') if source else None
+        if image_ctx is None:
+            with self._lock:
+                self.failures += 1
+            return None
+
+        png = encode_png(processor.resize_image(image_ctx.image, max_size=self.max_size))
+        # Keyed by the version after reading (a download may have just set it)
+        key = self._key(image_id)
+        if key is not None:
+            self._lru.put(key, png, len(png))
+        with self._lock:
+            self.builds += 1
+            self._build_ms_total += (time.perf_counter() - start) * 1000
+        return png
+
+    def prewarm(self, image_ids: Iterable[str]) -> int:
+        """Queue background builds (never blocks); returns how many were queued"""
+        queued = 0
+        for image_id in image_ids:
+            key = self._key(image_id)
+            if key is None or key in self._lru:
+                continue
+            try:
+                self._queue.put_nowait(image_id)
+            except queue.Full:
+                with self._lock:
+                    self.prewarm_dropped += 1
+                continue
+            queued += 1
+        if queued:
+            with self._lock:
+                self.prewarm_queued += queued
+            self._ensure_worker()
+        return queued
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="reference-payload-prewarm", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            image_id = self._queue.get()
+            try:
+                self.get(image_id)
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                print(f"⚠️  Reference payload prewarm failed for {image_id}: {e}")
+
+    def clear(self) -> None:
+        self._lru.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            counters = {
+                "builds": self.builds,
+                "failures": self.failures,
+                "avg_build_ms": round(self._build_ms_total / self.builds, 1) if self.builds else None,
+                "prewarm_queued": self.prewarm_queued,
+                "prewarm_dropped": self.prewarm_dropped
+            }
+        return {**self._lru.get_stats(), **counters, "prewarm_pending": self._queue.qsize()}
+
+
+# Singleton instance
+_payload_cache: Optional[ReferencePayloadCache] = None
+_payload_cache_lock = threading.Lock()
+
+
+def get_payload_cache() -> ReferencePayloadCache:
+    """Get singleton payload cache instance"""
+    global _payload_cache
+    if _payload_cache is None:
+        with _payload_cache_lock:
+            if _payload_cache is None:
+                _payload_cache = ReferencePayloadCache()
+    return _payload_cache
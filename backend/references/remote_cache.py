@@ -0,0 +1,348 @@
+"""
+references/remote_cache.py - Fetch-through disk cache for tier-3 (cloud_url) images
+
+Cloud-only references used to be handed to the browser as a URL, so the
+backend could not use them (e.g. as a render reference) without the client
+downloading and re-uploading them. The library now fetches them itself
+through this cache:
+
+- Disk: <cache_dir>/<sha[:2]>/<sha256 of the URL> + a .json sidecar
+  (url, ETag, Last-Modified, mime type, content sha256, fetch times).
+  Survives restarts; the index is rebuilt from the sidecars.
+- Size-bounded LRU: least recently used files are deleted past max_bytes
+  (a hit touches the file, so the order also survives restarts).
+- Revalidation: after revalidate_after seconds an entry is re-requested
+  with If-None-Match / If-Modified-Since; 304 keeps the file. When the
+  origin is unreachable the stale copy is served.
+- Concurrent fetches of one URL share a single download.
+- prefetch(): background downloads on a small thread pool.
+
+`opener` (default urllib.request.urlopen) is injectable, so the cache can
+be pointed at a local HTTP stand-in.
+"""
+
+import hashlib
+import http.client
+import json
+import mimetypes
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+USER_AGENT = "S2RTool-reference-cache/1.0"
+
+
+class RemoteImageCache:
+    """Disk-backed LRU of downloaded reference images, keyed by URL"""
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_bytes: int,
+        revalidate_after: float = 3600,
+        timeout: float = 15,
+        max_image_bytes: int = 25 * 1024 * 1024,
+        prefetch_workers: int = 2,
+        opener: Optional[Callable] = None
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.timeout = timeout
+        self.max_image_bytes = max_image_bytes
+        self.prefetch_workers = prefetch_workers
+        self._opener = opener or urllib.request.urlopen
+
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()  # key -> sidecar, oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # Statistics
+        self.hits = 0
+        self.downloads = 0
+        self.revalidated = 0
+        self.stale_served = 0
+        self.failures = 0
+        self.evictions = 0
+        self.prefetch_queued = 0
+
+        self._load_index()
+
+    # ============== DISK ==============
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _data_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def _meta_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU from the sidecars (least recently used first)"""
+        if not self.cache_dir.exists():
+            return
+        found = []
+        for meta_path in self.cache_dir.glob("*/*.json"):
+            key = meta_path.stem
+            data_path = self._data_path(key)
+            try:
+                meta = json.loads(meta_path.read_text(encoding='utf-8'))
+                stat = data_path.stat()
+            except (OSError, ValueError):
+                self._delete_files(key)  # orphan or torn write
+                continue
+            if stat.st_size != meta.get("size"):
+                self._delete_files(key)
+                continue
+            found.append((stat.st_mtime, key, meta))
+        for _, key, meta in sorted(found):
+            self._entries[key] = meta
+            self._total_bytes += meta["size"]
+        self._evict()
+
+    def _delete_files(self, key: str) -> None:
+        for path in (self._data_path(key), self._meta_path(key)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _write_meta(self, key: str, meta: Dict) -> None:
+        meta_path = self._meta_path(key)
+        tmp_path = meta_path.with_name(meta_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(meta), encoding='utf-8')
+        os.replace(tmp_path, meta_path)
+
+    def _store(self, key: str, url: str, data: bytes, headers) -> Dict:
+        data_path = self._data_path(key)
+        data_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = data_path.with_name(data_path.name + ".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, data_path)
+
+        now = time.time()
+        mime_type = headers.get_content_type() if headers is not None else None
+        if not mime_type or not mime_type.startswith('image/'):
+            mime_type = mimetypes.guess_type(urlparse(url).path)[0] or 'image/jpeg'
+        meta = {
+            "url": url,
+            "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "mime_type": mime_type,
+            "etag": headers.get('ETag') if headers is not None else None,
+            "last_modified": headers.get('Last-Modified') if headers is not None else None,
+            "fetched_at": now,
+            "validated_at": now
+        }
+        self._write_meta(key, meta)
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old["size"]
+            self._entries[key] = meta
+            self._total_bytes += meta["size"]
+        self._evict(keep=key)
+        return meta
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        while True:
+            with self._lock:
+                if self._total_bytes <= self.max_bytes:
+                    return
+                victim = next((k for k in self._entries if k != keep and k not in self._inflight), None)
+                if victim is None:
+                    return
+                meta = self._entries.pop(victim)
+                self._total_bytes -= meta["size"]
+                self.evictions += 1
+            self._delete_files(victim)
+
+    # ============== FETCH ==============
+
+    def _read(self, key: str, meta: Dict) -> Optional[Dict]:
+        try:
+            data = self._data_path(key).read_bytes()
+        except FileNotFoundError:
+            return None  # evicted meanwhile
+        try:
+            os.utime(self._data_path(key))  # LRU order across restarts
+        except OSError:
+            pass
+        return {"data": data, "mime_type": meta["mime_type"], "version": meta["sha256"][:16]}
+
+    def fetch(self, url: str) -> Optional[Dict]:
+        """
+        Bytes of a remote image, downloading or revalidating as needed
+
+        Returns:
+            {"data": bytes, "mime_type": "...", "version": content hash}, or
+            None if it cannot be fetched and nothing is cached
+        """
+        if urlparse(url).scheme not in ('http', 'https'):
+            return None
+        key = self._key(url)
+
+        waited = False
+        while True:
+            with self._lock:
+                meta = self._entries.get(key)
+                # After waiting on another download, take whatever it left (even stale)
+                if meta is not None and (waited or time.time() - meta["validated_at"] < self.revalidate_after):
+                    self._entries.move_to_end(key)
+                else:
+                    if waited:
+                        return None  # the download we waited for failed
+                    event = self._inflight.get(key)
+                    if event is None:
+                        event = self._inflight[key] = threading.Event()
+                        break
+                    meta = None
+            if meta is not None:
+                result = self._read(key, meta)
+                if result is not None:
+                    self.hits += 1
+                    return result
+                # Data file gone (deleted by hand): forget the entry and download again
+                with self._lock:
+                    if self._entries.get(key) is meta:
+                        self._entries.pop(key)
+                        self._total_bytes -= meta["size"]
+                waited = False
+                continue
+            # ✅ OPTIMIZED: one download per URL, concurrent callers wait for it
+            event.wait()
+            waited = True
+
+        try:
+            return self._download(url, key, meta)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    def _download(self, url: str, key: str, cached: Optional[Dict]) -> Optional[Dict]:
+        headers = {"User-Agent": USER_AGENT}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        request = urllib.request.Request(url, headers=headers)
+
+        try:
+            try:
+                with self._opener(request, timeout=self.timeout) as response:
+                    status = getattr(response, 'status', 200)
+                    data = None if status == 304 else response.read(self.max_image_bytes + 1)
+                    response_headers = response.headers
+                if data is not None and len(data) <= self.max_image_bytes:
+                    # read(n) returns a short body instead of raising on a dropped connection
+                    length = response_headers.get('Content-Length', '')
+                    if length.isdigit() and len(data) < int(length):
+                        raise http.client.IncompleteRead(data, int(length) - len(data))
+            except urllib.error.HTTPError as e:
+                if e.code != 304:
+                    raise
+                status, data, response_headers = 304, None, e.headers
+
+            if status == 304 and cached is not None:
+                result = self._read(key, cached)
+                if result is None:
+                    # Our copy was removed meanwhile: a miss, fetch it again
+                    return self._download(url, key, None)
+                cached = {**cached, "validated_at": time.time()}
+                self._write_meta(key, cached)
+                with self._lock:
+                    if key in self._entries:
+                        self._entries[key] = cached
+                        self._entries.move_to_end(key)
+                self.revalidated += 1
+                return result
+            if status != 200 or data is None:
+                raise urllib.error.URLError(f"unexpected status {status}")
+            if len(data) > self.max_image_bytes:
+                raise ValueError(f"larger than {self.max_image_bytes} bytes")
+
+            meta = self._store(key, url, data, response_headers)
+            self.downloads += 1
+            return {"data": data, "mime_type": meta["mime_type"], "version": meta["sha256"][:16]}
+
+        except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError) as e:
+            # HTTPException: truncated body (IncompleteRead), dropped connection...
+            self.failures += 1
+            print(f"⚠️  Remote reference fetch failed ({url}): {e}")
+            if cached is not None:
+                # Origin down: better a stale copy than no reference
+                result = self._read(key, cached)
+                if result is not None:
+                    self.stale_served += 1
+                return result
+            return None
+
+    def version(self, url: str) -> Optional[str]:
+        """Content hash of the cached copy of url (None if not cached); no I/O"""
+        with self._lock:
+            meta = self._entries.get(self._key(url))
+        return meta["sha256"][:16] if meta is not None else None
+
+    def is_cached(self, url: str) -> bool:
+        with self._lock:
+            return self._key(url) in self._entries
+
+    # ============== PREFETCH ==============
+
+    def prefetch(self, urls: Iterable[str]) -> int:
+        """Download uncached URLs in the background; returns how many were queued"""
+        queued = 0
+        for url in dict.fromkeys(urls):
+            if urlparse(url).scheme not in ('http', 'https'):
+                continue
+            key = self._key(url)
+            with self._lock:
+                if key in self._entries or key in self._inflight:
+                    continue
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.prefetch_workers, thread_name_prefix="reference-prefetch"
+                    )
+            self._executor.submit(self._prefetch_one, url)
+            queued += 1
+        self.prefetch_queued += queued
+        return queued
+
+    def _prefetch_one(self, url: str) -> None:
+        try:
+            self.fetch(url)
+        except Exception as e:
+            print(f"⚠️  Remote reference prefetch failed ({url}): {e}")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            entries, total_bytes, inflight = len(self._entries), self._total_bytes, len(self._inflight)
+        return {
+            "cache_dir": str(self.cache_dir),
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "downloads": self.downloads,
+            "revalidated": self.revalidated,
+            "stale_served": self.stale_served,
+            "failures": self.failures,
+            "evictions": self.evictions,
+            "inflight": inflight,
+            "prefetch_queued": self.prefetch_queued
+        }
@@ -0,0 +1,159 @@
+"""
+references/search.py - Ranked text search over the reference library
+
+Inverted index over each image's names, descriptions, tags and metadata
+(style, lighting, time_of_day, floors, context, materials, ...) plus its
+category/subcategory names, scored with BM25. Text is folded with
+utils.text.fold_diacritics, so "dong duong" finds "Đông Dương".
+
+Per-field weights are applied to term frequencies before BM25 (as in
+BM25F), and the whole score of each (term, image) pair is computed at
+build time: a query only sums precomputed postings.
+"""
+
+import bisect
+import heapq
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.text import tokenize
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Term frequency multiplier per field
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "name_vi": 3.0,
+    "tags": 2.5,
+    "metadata": 1.5,
+    "description": 1.0,
+    "description_vi": 1.0,
+    "category": 1.0
+}
+
+# A query word that is not in the vocabulary matches words it is a
+# prefix of (type-ahead), at a discount
+PREFIX_WEIGHT = 0.7
+MAX_PREFIX_EXPANSIONS = 30
+
+
+def _metadata_text(value) -> Iterable[str]:
+    """String leaves of a metadata value (lists/dicts flattened)"""
+    if isinstance(value, dict):
+        for v in value.values():
+            yield from _metadata_text(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from _metadata_text(v)
+    elif isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        yield str(value)
+
+
+def image_fields(img: Dict, category: Optional[Dict] = None, subcategory: Optional[Dict] = None) -> Dict[str, str]:
+    """Searchable text of one manifest image, by field"""
+    category_names = []
+    for group in (category or {}, subcategory or {}):
+        category_names.extend(str(group.get(key, "")) for key in ("name", "name_vi"))
+    return {
+        "name": str(img.get("name", "")),
+        "name_vi": str(img.get("name_vi", "")),
+        "tags": " ".join(str(t) for t in img.get("tags", [])),
+        "metadata": " ".join(_metadata_text(img.get("metadata", {}))),
+        "description": str(img.get("description", "")),
+        "description_vi": str(img.get("description_vi", "")),
+        "category": " ".join(category_names)
+    }
+
+
+class ReferenceSearchIndex:
+    """BM25 inverted index over reference images"""
+
+    def __init__(self, documents: Iterable[Tuple[str, Dict[str, str]]]):
+        """documents: (image id, {field: text}) in manifest order"""
+        self.ids: List[str] = []
+        weighted_tfs: List[Dict[str, float]] = []
+        lengths: List[float] = []
+
+        # Category names, tags etc. repeat across thousands of images
+        tokenized: Dict[str, List[str]] = {}
+
+        for image_id, fields in documents:
+            tf: Dict[str, float] = {}
+            for field, text in fields.items():
+                weight = FIELD_WEIGHTS.get(field, 1.0)
+                tokens = tokenized.get(text)
+                if tokens is None:
+                    tokens = tokenized[text] = tokenize(text)
+                for token in tokens:
+                    tf[token] = tf.get(token, 0.0) + weight
+            self.ids.append(image_id)
+            weighted_tfs.append(tf)
+            lengths.append(sum(tf.values()))
+
+        n = len(self.ids)
+        avg_length = (sum(lengths) / n) if n else 0.0
+
+        document_frequency: Dict[str, int] = {}
+        for tf in weighted_tfs:
+            for token in tf:
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+
+        # term -> [(doc position, BM25 contribution)]
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        for doc, (tf, length) in enumerate(zip(weighted_tfs, lengths)):
+            norm = K1 * (1 - B + B * length / avg_length) if avg_length else K1
+            for token, freq in tf.items():
+                df = document_frequency[token]
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                score = idf * freq * (K1 + 1) / (freq + norm)
+                self.postings.setdefault(token, []).append((doc, score))
+
+        self.vocabulary = sorted(self.postings)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _expand(self, token: str) -> List[Tuple[str, float]]:
+        """(vocabulary term, weight) pairs a query word matches"""
+        if token in self.postings:
+            return [(token, 1.0)]
+        start = bisect.bisect_left(self.vocabulary, token)
+        expansions = []
+        for term in self.vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(token):
+                break
+            expansions.append((term, PREFIX_WEIGHT))
+        return expansions
+
+    def search(
+        self,
+        query: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        keep: Optional[Callable[[str], bool]] = None
+    ) -> Tuple[List[Tuple[str, float]], int]:
+        """
+        Images matching any query word, best first (ties in manifest order).
+        keep filters by image id. Returns ([(image id, score)] from offset,
+        at most limit of them; total matches).
+        """
+        scores: Dict[int, float] = {}
+        for token in dict.fromkeys(tokenize(query)):
+            for term, weight in self._expand(token):
+                for doc, score in self.postings[term]:
+                    scores[doc] = scores.get(doc, 0.0) + weight * score
+
+        if keep is not None:
+            scores = {doc: score for doc, score in scores.items() if keep(self.ids[doc])}
+
+        def rank(item):
+            return (-item[1], item[0])
+
+        if limit is None:
+            ranked = sorted(scores.items(), key=rank)[offset:]
+        else:
+            # Only the requested page needs ordering
+            ranked = heapq.nsmallest(offset + limit, scores.items(), key=rank)[offset:]
+        return [(self.ids[doc], round(score, 4)) for doc, score in ranked], len(scores)
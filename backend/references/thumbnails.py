@@ -0,0 +1,80 @@
+"""
+references/thumbnails.py - Pre-generated reference image thumbnails
+
+auto_generate_manifest.py writes every local reference image at a few
+fixed widths under references/thumbnails/<size>/ and records them in the
+manifest entry ("thumbnails": {"200": "thumbnails/200/..."}), so the
+gallery never downloads full-size photos. The API generates a missing
+one on first request (hand-written manifests) with the same function.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable
+
+from PIL import Image, ImageOps, features
+
+THUMBNAIL_SIZES = (200, 400, 800)
+THUMBNAIL_DIRNAME = "thumbnails"
+
+# WebP when Pillow has it (smaller at the same quality), JPEG otherwise
+if features.check("webp"):
+    THUMBNAIL_FORMAT, THUMBNAIL_EXT, THUMBNAIL_MIMETYPE = "WEBP", "webp", "image/webp"
+else:
+    THUMBNAIL_FORMAT, THUMBNAIL_EXT, THUMBNAIL_MIMETYPE = "JPEG", "jpg", "image/jpeg"
+THUMBNAIL_QUALITY = 80
+_SAVE_OPTIONS = {"method": 4} if THUMBNAIL_FORMAT == "WEBP" else {"optimize": True}
+
+
+def thumbnail_relpath(image_rel: str, size: int) -> str:
+    """Thumbnail location (relative to references/) of an image at references/<image_rel>"""
+    rel = Path(image_rel)
+    if rel.parts and rel.parts[0] == "images":
+        rel = Path(*rel.parts[1:])
+    # Keep the original extension: a.jpg and a.png must not share a thumbnail
+    return (Path(THUMBNAIL_DIRNAME) / str(size) / rel.with_name(f"{rel.name}.{THUMBNAIL_EXT}")).as_posix()
+
+
+def generate_thumbnails(
+    references_dir: Path,
+    image_rel: str,
+    sizes: Iterable[int] = THUMBNAIL_SIZES,
+    force: bool = False
+) -> Dict[str, str]:
+    """
+    Write the thumbnails of one image (skipping ones newer than the image
+    unless force). Returns {str(size): path relative to references_dir}.
+    Sizes are the maximum width/height; images are never upscaled.
+    """
+    references_dir = Path(references_dir)
+    source = references_dir / image_rel
+    source_mtime = source.stat().st_mtime
+
+    targets = {}
+    for size in sorted(set(sizes), reverse=True):
+        rel = thumbnail_relpath(image_rel, size)
+        path = references_dir / rel
+        targets[size] = (rel, path)
+
+    pending = [size for size, (_, path) in targets.items()
+               if force or not path.exists() or path.stat().st_mtime < source_mtime]
+    if pending:
+        with Image.open(source) as img:
+            # JPEG: decode at a reduced scale straight away
+            img.draft("RGB", (max(pending), max(pending)))
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            if THUMBNAIL_FORMAT == "JPEG" and img.mode == "RGBA":
+                img = img.convert("RGB")
+
+            # Largest first, each one downscaled from the previous
+            for size in sorted(pending, reverse=True):
+                img = img.copy()
+                img.thumbnail((size, size), Image.Resampling.LANCZOS)
+                _, path = targets[size]
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(path.name + ".tmp")
+                img.save(tmp_path, format=THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY, **_SAVE_OPTIONS)
+                tmp_path.replace(path)
+
+    return {str(size): rel for size, (rel, _) in sorted(targets.items())}
@@ -0,0 +1,30 @@
+"""
+utils/text.py - Text normalization for search
+"""
+
+import re
+import unicodedata
+from typing import List
+
+# đ/Đ are separate letters in Unicode, not d + a combining mark
+_LETTER_FOLDS = str.maketrans({"đ": "d", "Đ": "D"})
+
+# Word characters except "_", so golden_hour / cao_tang_hien_dai split into words
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def fold_diacritics(text: str) -> str:
+    """
+    Lowercase and strip diacritics, so Vietnamese queries match with or
+    without accents: "Phòng khách hiện đại" -> "phong khach hien dai"
+    """
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFD", text.translate(_LETTER_FOLDS))
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+    return stripped.lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Folded word tokens of text"""
+    return _TOKEN_RE.findall(fold_diacritics(text))
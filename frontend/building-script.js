@@ -10,10 +10,12 @@ const API_BASE_URL = '/api';
 
 // ============== STATE ==============
 let currentSketchImage = null;
+let currentSketchHandle = null;  // Server-side handle of the uploaded sketch
 let currentAnalysisData = null;
 let currentTranslatedData = null;
 let currentRenderedImage = null;
 let currentReferenceImage = null;
+let currentReferenceHandle = null;  // Server-side handle of the reference image
 let currentMaskImage = null;
 
 // Trạng thái xử lý để tránh double-click
@@ -342,6 +344,7 @@ async function handleImageUpload(event) {
         const reader = new FileReader();
         reader.onload = (e) => {
             currentSketchImage = e.target.result;
+            currentSketchHandle = null;
 
             if (previewImage) {
                 previewImage.src = e.target.result;
@@ -376,6 +379,47 @@ async function handleImageUpload(event) {
     }
 }
 
+// ============== SKETCH HANDLE ==============
+// The backend keeps uploaded sketches and reference images keyed by an
+// image handle, so repeat renders send the handles instead of re-uploading
+// the base64 images.
+async function postRender(requestData, signal) {
+    const send = (body) => fetch(`${API_BASE_URL}/render`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body),
+        signal: signal
+    });
+
+    const byHandle = { ...requestData };
+    if (currentSketchHandle) {
+        delete byHandle.image_base64;
+        byHandle.image_handle = currentSketchHandle;
+    }
+    if (currentReferenceHandle && requestData.reference_image_base64) {
+        delete byHandle.reference_image_base64;
+        byHandle.reference_image_handle = currentReferenceHandle;
+    }
+    if (byHandle.image_handle || byHandle.reference_image_handle) {
+        const response = await send(byHandle);
+        if (response.status !== 410) return response;
+        // Handle evicted on the server: fall back to a full upload
+        currentSketchHandle = null;
+        currentReferenceHandle = null;
+    }
+    return send(requestData);
+}
+
+function rememberRenderHandles(result, requestData) {
+    // Ignore handles of images replaced while the render was running
+    if (result.image_handle && requestData.image_base64 === currentSketchImage) {
+        currentSketchHandle = result.image_handle;
+    }
+    if (result.reference_image_handle && requestData.reference_image_base64 === currentReferenceImage) {
+        currentReferenceHandle = result.reference_image_handle;
+    }
+}
+
 // ============== STEP 1: ANALYZE SKETCH ==============
 async function analyzeSketch() {
     if (!currentSketchImage) {
@@ -397,11 +441,12 @@ async function analyzeSketch() {
     try {
         console.log('📊 Analyzing sketch...');
 
+        const analyzedSketch = currentSketchImage;
         const response = await fetch(`${API_BASE_URL}/analyze-sketch`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                image_base64: currentSketchImage
+                image_base64: analyzedSketch
             })
         });
 
@@ -415,6 +460,10 @@ async function analyzeSketch() {
         }
 
         currentAnalysisData = await response.json();
+        // Ignore the handle if another sketch was loaded while analyzing
+        if (analyzedSketch === currentSketchImage) {
+            currentSketchHandle = currentAnalysisData.image_handle || null;
+        }
         console.log('✅ Analysis complete:', currentAnalysisData);
 
         fillFormFromAnalysis(currentAnalysisData);
@@ -640,12 +689,7 @@ async function generateRender() {
             console.log('📎 Using reference image');
         }
 
-        const response = await fetch(`${API_BASE_URL}/render`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(requestData),
-            signal: currentRenderController.signal  // ✅ FIX: Add abort signal
-        });
+        const response = await postRender(requestData, currentRenderController.signal);  // ✅ FIX: Add abort signal
 
         if (!response.ok) {
             const errorData = await response.json();
@@ -653,6 +697,7 @@ async function generateRender() {
         }
 
         const result = await response.json();
+        rememberRenderHandles(result, requestData);
 
         // ✅ FIX: Only process if this is still the latest request
         if (thisRequestId === currentRequestId) {
@@ -772,11 +817,7 @@ async function applyRefinement() {
             requestData.reference_image_base64 = currentReferenceImage;
         }
 
-        const response = await fetch(`${API_BASE_URL}/render`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(requestData)
-        });
+        const response = await postRender(requestData);
 
         if (!response.ok) {
             const errorData = await response.json();
@@ -784,6 +825,7 @@ async function applyRefinement() {
         }
 
         const result = await response.json();
+        rememberRenderHandles(result, requestData);
 
         currentRenderedImage = result.generated_image_base64;
         displayRenderedImage(result.generated_image_base64, result.mime_type);
@@ -931,6 +973,7 @@ function setupReferenceImageUI() {
     if (upBtn) upBtn.addEventListener('change', handleReferenceUpload);
     if (clearBtn) clearBtn.addEventListener('click', () => {
         currentReferenceImage = null;
+        currentReferenceHandle = null;
         document.getElementById('referencePreview').classList.add('hidden');
     });
 }
@@ -941,6 +984,7 @@ function handleReferenceUpload(event) {
     const reader = new FileReader();
     reader.onload = (e) => {
         currentReferenceImage = e.target.result;
+        currentReferenceHandle = null;
         showReferencePreview(e.target.result);
         showSuccess('renderSuccess', '✅ Đã tải ảnh reference!');
     };
@@ -1323,6 +1367,7 @@ function addUseAsReferenceButton() {
     btn.addEventListener('click', () => {
         if (!currentRenderedImage) return;
         currentReferenceImage = `data:image/png;base64,${currentRenderedImage}`;
+        currentReferenceHandle = null;
         showReferencePreview(currentReferenceImage);
 
         const refSection = document.getElementById('referenceSection');
@@ -9,10 +9,12 @@ const API_BASE_URL = '/api';
 
 // ============== STATE ==============
 let currentSketchImage = null;
+let currentSketchHandle = null;  // Server-side handle of the uploaded sketch
 let currentAnalysisData = null;
 let currentTranslatedData = null;
 let currentRenderedImage = null;
 let currentReferenceImage = null;
+let currentReferenceHandle = null;  // Server-side handle of the reference image
 
 // Processing state
 let isAnalyzing = false;
@@ -275,6 +277,7 @@ async function handleImageUpload(event) {
         const reader = new FileReader();
         reader.onload = (e) => {
             currentSketchImage = e.target.result;
+            currentSketchHandle = null;
 
             if (previewImage) {
                 previewImage.src = e.target.result;
@@ -312,6 +315,7 @@ async function handleReferenceUpload(event) {
         const reader = new FileReader();
         reader.onload = (e) => {
             currentReferenceImage = e.target.result.split(',')[1]; // Remove data:image/...;base64,
+            currentReferenceHandle = null;
 
             if (previewReference) {
                 previewReference.src = e.target.result;
@@ -344,6 +348,7 @@ async function handleReferenceUpload(event) {
 
 function clearReference() {
     currentReferenceImage = null;
+    currentReferenceHandle = null;
 
     if (uploadReference) {
         uploadReference.value = '';
@@ -366,6 +371,47 @@ function clearReference() {
     console.log('🗑️ Reference image cleared');
 }
 
+// ============== SKETCH HANDLE ==============
+// The backend keeps uploaded sketches and reference images keyed by an
+// image handle, so repeat renders send the handles instead of re-uploading
+// the base64 images.
+async function postRender(requestData, signal) {
+    const send = (body) => fetch(`${API_BASE_URL}/render`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body),
+        signal: signal
+    });
+
+    const byHandle = { ...requestData };
+    if (currentSketchHandle) {
+        delete byHandle.image_base64;
+        byHandle.image_handle = currentSketchHandle;
+    }
+    if (currentReferenceHandle && requestData.reference_image_base64) {
+        delete byHandle.reference_image_base64;
+        byHandle.reference_image_handle = currentReferenceHandle;
+    }
+    if (byHandle.image_handle || byHandle.reference_image_handle) {
+        const response = await send(byHandle);
+        if (response.status !== 410) return response;
+        // Handle evicted on the server: fall back to a full upload
+        currentSketchHandle = null;
+        currentReferenceHandle = null;
+    }
+    return send(requestData);
+}
+
+function rememberRenderHandles(result, requestData) {
+    // Ignore handles of images replaced while the render was running
+    if (result.image_handle && requestData.image_base64 === currentSketchImage) {
+        currentSketchHandle = result.image_handle;
+    }
+    if (result.reference_image_handle && requestData.reference_image_base64 === currentReferenceImage) {
+        currentReferenceHandle = result.reference_image_handle;
+    }
+}
+
 // ============== STEP 1: ANALYZE SKETCH ==============
 async function analyzeSketch() {
     if (!currentSketchImage) {
@@ -387,11 +433,12 @@ async function analyzeSketch() {
     try {
         console.log('📊 Analyzing interior sketch...');
 
+        const analyzedSketch = currentSketchImage;
         const response = await fetch(`${API_BASE_URL}/analyze-sketch-interior`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                image_base64: currentSketchImage
+                image_base64: analyzedSketch
             })
         });
 
@@ -405,6 +452,10 @@ async function analyzeSketch() {
         }
 
         currentAnalysisData = await response.json();
+        // Ignore the handle if another sketch was loaded while analyzing
+        if (analyzedSketch === currentSketchImage) {
+            currentSketchHandle = currentAnalysisData.image_handle || null;
+        }
         console.log('✅ Interior analysis complete:', currentAnalysisData);
 
         fillFormFromAnalysis(currentAnalysisData);
@@ -804,11 +855,7 @@ async function generateRender() {
             console.log('🖼️ Using reference image for material/color consistency');
         }
 
-        const response = await fetch(`${API_BASE_URL}/render`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(requestBody)
-        });
+        const response = await postRender(requestBody);
 
         if (!response.ok) {
             let errorMsg = `HTTP ${response.status}`;
@@ -820,6 +867,7 @@ async function generateRender() {
         }
 
         const result = await response.json();
+        rememberRenderHandles(result, requestBody);
 
         // ✅ FIX: Store base64 without prefix for download
         currentRenderedImage = result.generated_image_base64;
@@ -144,8 +144,8 @@ function renderCard(item) {
     const modeLabel = MODE_LABELS[item.mode] || item.mode;
     const modeClass = `mode-${item.mode}`;
     const timeStr = formatTime(item.timestamp);
-    const imgSrc = item.thumbnail_b64
-        ? `data:image/jpeg;base64,${item.thumbnail_b64}`
+    const imgSrc = item.thumbnail_url
+        ? item.thumbnail_url
         : 'data:image/gif;base64,R0lGODlhAQABAAAAACH5BAEKAAEALAAAAAABAAEAAAICTAEAOw==';
     const summary = item.prompt_summary || '—';
 